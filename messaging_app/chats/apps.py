@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class ChatsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'chats'
\ No newline at end of file
+    name = 'chats'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
\ No newline at end of file
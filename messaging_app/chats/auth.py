@@ -1,5 +1,12 @@
 # messaging_app/chats/auth.py
 from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import (
+    JWTAuthentication,
+    JWTStatelessUserAuthentication,
+)
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .revocation import is_revoked
 
 class CustomSessionAuthentication(SessionAuthentication):
     """
@@ -10,4 +17,28 @@ class CustomSessionAuthentication(SessionAuthentication):
         # Skip CSRF for API requests when using JWT
         if request.path.startswith('/api/'):
             return
-        return super().enforce_csrf(request)
\ No newline at end of file
+        return super().enforce_csrf(request)
+
+
+class RevocationCheckMixin:
+    """
+    Rejects tokens revoked through chats.revocation. The check is served
+    from the in-memory revocation list, not the database.
+    """
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token):
+            raise InvalidToken('Token has been revoked')
+        return validated_token
+
+
+class RevocableJWTAuthentication(RevocationCheckMixin, JWTAuthentication):
+    """
+    JWTAuthentication with revocation checks.
+    """
+
+
+class RevocableJWTStatelessUserAuthentication(RevocationCheckMixin, JWTStatelessUserAuthentication):
+    """
+    Database-free JWT authentication with revocation checks.
+    """
@@ -1,11 +1,18 @@
 # chats/auth_views.py
 
+import io
+
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
+from .provisioning import UserProvisioner, format_for_filename, read_rows
+from .revocation import revoke_token
+from .serializers import RevocableTokenRefreshSerializer
 
 User = get_user_model()
 
@@ -74,4 +81,70 @@ def register(request):
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    """
+    Revoke the access token of the request and, if given, the refresh token.
+    """
+    refresh = request.data.get('refresh')
+    if refresh:
+        try:
+            refresh_token = RefreshToken(refresh)
+        except TokenError:
+            return Response(
+                {'error': 'Invalid refresh token'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if str(refresh_token.get('user_id')) != str(request.user.pk):
+            return Response(
+                {'error': 'Refresh token belongs to another user'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        revoke_token(refresh_token)
+    
+    if request.auth is not None:
+        revoke_token(request.auth)
+    
+    return Response({'message': 'Logged out successfully'})
+
+
+class RevocableTokenRefreshView(TokenRefreshView):
+    """
+    Refresh endpoint honouring revocations and refresh token rotation.
+    """
+    serializer_class = RevocableTokenRefreshSerializer
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def provision_users(request):
+    """
+    Bulk-create users from an uploaded CSV or NDJSON file (admin only).
+    Expects a multipart "file" field; "format" (csv or ndjson) defaults to
+    the file extension. Returns the created count and the per-row errors.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response(
+            {'error': 'Please upload a file'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    fmt = request.data.get('format') or format_for_filename(upload.name)
+    if fmt not in ('csv', 'ndjson'):
+        return Response(
+            {'error': 'format must be csv or ndjson'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+    # Hash in this process: a worker pool per request would cost more
+    # than it saves and multiply processes under a multi-worker server
+    report = UserProvisioner(workers=1).provision(read_rows(stream, fmt))
+    
+    response_status = status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK
+    return Response(report, status=response_status)
@@ -0,0 +1,241 @@
+# messaging_app/chats/batching.py
+
+"""
+Group-commit batching for message inserts.
+
+When enabled through the ``CHATS_GROUP_COMMIT`` setting, message inserts
+coming from concurrent requests are queued and written by one flusher
+thread per database alias. The flusher waits at most ``WINDOW_MS`` after
+the first queued write (or until ``MAX_BATCH`` writes are queued), runs
+every write of the batch inside one transaction and commits once.
+
+Durability semantics:
+- A request is only acknowledged after the shared transaction has
+  committed, so an acknowledged message is exactly as durable as one
+  written through the regular path. Batching only adds up to
+  ``WINDOW_MS`` of latency to each write.
+- Each write runs in its own savepoint. A write that fails (validation,
+  integrity error, ...) is rolled back on its own and its exception is
+  re-raised in the request that submitted it; the rest of the batch
+  still commits.
+- If the shared COMMIT itself fails (or the connection cannot be
+  re-established before the batch), every write of the batch fails with
+  that error and none of them is persisted. The flusher thread carries on
+  with the next batch.
+- Writes submitted while the caller is already inside a transaction
+  bypass the batcher, because they must commit or roll back together
+  with the caller's transaction.
+"""
+
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+GROUP_COMMIT_DEFAULTS = {
+    'ENABLED': False,
+    'WINDOW_MS': 5,
+    'MAX_BATCH': 256,
+}
+
+# Queued in place of a write to make the flusher thread exit
+_STOP = object()
+
+
+def get_group_commit_settings():
+    """
+    Return the group commit configuration merged over the defaults.
+    """
+    config = dict(GROUP_COMMIT_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_GROUP_COMMIT', {}))
+    return config
+
+
+class PendingWrite:
+    """
+    A single write waiting for the next group commit.
+    """
+    __slots__ = ('func', 'result', 'error', 'done')
+
+    def __init__(self, func):
+        self.func = func
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self):
+        """
+        Block until the batch holding this write has committed.
+        Returns the write's result or re-raises its error.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class GroupCommitBatcher:
+    """
+    Coalesces writes submitted from many threads into shared transactions
+    on a single database alias.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, window_ms=5, max_batch=256):
+        self.using = using
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.stats = {
+            'batches': 0,
+            'writes': 0,
+            'failed_writes': 0,
+            'failed_commits': 0,
+        }
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func):
+        """
+        Run ``func`` inside the next group commit and return its result.
+        The calling thread blocks until the shared transaction commits.
+        """
+        if connections[self.using].in_atomic_block:
+            return func()
+
+        pending = PendingWrite(func)
+        self._ensure_started()
+        self._queue.put(pending)
+        return pending.wait()
+
+    def stop(self):
+        """
+        Flush the queued writes and stop the flusher thread.
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f'chats-group-commit-{self.using}',
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        """
+        Wait for a first write, then gather more until the window closes
+        or the batch is full.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        connection = connections[self.using]
+        try:
+            while True:
+                batch = self._collect()
+                stopping = batch[-1] is _STOP
+                if stopping:
+                    batch.pop()
+
+                if batch:
+                    try:
+                        self._flush(batch)
+                    except BaseException as exc:
+                        # _flush reports Exceptions itself; anything else
+                        # (SystemExit raised by a write, ...) fails the
+                        # batch and the thread keeps serving the queue
+                        self._fail(batch, exc)
+                    finally:
+                        for pending in batch:
+                            pending.done.set()
+
+                if stopping:
+                    break
+        finally:
+            connection.close()
+
+    def _fail(self, batch, exc):
+        for pending in batch:
+            pending.result = None
+            if pending.error is None:
+                pending.error = exc
+
+    def _flush(self, batch):
+        try:
+            # Inside the try: a failed reconnect fails this batch, not the
+            # flusher thread
+            connections[self.using].close_if_unusable_or_obsolete()
+            with transaction.atomic(using=self.using):
+                for pending in batch:
+                    try:
+                        # One savepoint per write so a failure only
+                        # rolls back that write
+                        with transaction.atomic(using=self.using):
+                            pending.result = pending.func()
+                    except Exception as exc:
+                        pending.error = exc
+                        self.stats['failed_writes'] += 1
+        except Exception as exc:
+            # Reconnecting or the shared COMMIT failed: nothing in the
+            # batch was persisted
+            self.stats['failed_commits'] += 1
+            self._fail(batch, exc)
+
+        self.stats['batches'] += 1
+        self.stats['writes'] += len(batch)
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(using=DEFAULT_DB_ALIAS):
+    """
+    Return the process-wide batcher for a database alias.
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(using)
+        if batcher is None:
+            config = get_group_commit_settings()
+            batcher = GroupCommitBatcher(
+                using=using,
+                window_ms=config['WINDOW_MS'],
+                max_batch=config['MAX_BATCH']
+            )
+            _batchers[using] = batcher
+        return batcher
+
+
+def stop_batchers():
+    """
+    Flush and stop every batcher started in this process.
+    """
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+        _batchers.clear()
+    for batcher in batchers:
+        batcher.stop()
@@ -0,0 +1,198 @@
+# messaging_app/chats/fragments.py
+
+"""
+Cache of rendered MessageSerializer output ("fragments").
+
+Messages rarely change once sent, so each message is rendered once and
+the resulting dict is reused by every list, export and unread view.
+
+A fragment is keyed by (message_id, state, sender_id, sender fingerprint):
+- the state holds updated_at and the rendered fields that can change
+  (body, is_read, conversation). Queryset ``.update()`` calls, such as a
+  bulk "mark as read", do not bump updated_at, so the fields themselves
+  make an edited message miss its old fragment. The body enters the key
+  as a BLAKE2b digest, so a long body is not kept twice and, unlike the
+  salted built-in hash(), two bodies cannot share a key in practice;
+- the sender fingerprint covers the sender fields embedded in the
+  fragment, so a profile change is picked up even by processes that
+  never saw the change happen.
+Signal handlers additionally drop the fragments of edited/deleted
+messages and changed senders right away, to free their bytes early.
+
+The cache is process-local and bounded both by entry count and by the
+approximate JSON size of the stored fragments; the least recently used
+fragments are evicted first.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+FRAGMENT_CACHE_DEFAULTS = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 50000,
+    'MAX_BYTES': 32 * 1024 * 1024,
+}
+
+
+def get_fragment_cache_settings():
+    """
+    Return the fragment cache configuration merged over the defaults.
+    """
+    config = dict(FRAGMENT_CACHE_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_FRAGMENT_CACHE', {}))
+    return config
+
+
+class FragmentCache:
+    """
+    Thread-safe LRU cache of rendered fragments with byte accounting.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (fragment, size)
+        self._by_message = {}  # message_id -> key
+        self._by_sender = {}  # sender_id -> {key, ...}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_many(self, keys):
+        """
+        Return {key: fragment} for the cached keys; the rest are misses.
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, fragments):
+        """
+        Store {key: fragment}. Fragments larger than the byte limit are
+        not cached.
+        """
+        sized = [
+            (key, fragment, len(json.dumps(fragment, cls=DjangoJSONEncoder)))
+            for key, fragment in fragments.items()
+        ]
+        with self._lock:
+            for key, fragment, size in sized:
+                if size > self.max_bytes:
+                    continue
+                message_id, _, sender_id, _ = key
+                previous = self._by_message.get(message_id)
+                if previous is not None:
+                    self._discard(previous)
+                self._entries[key] = (fragment, size)
+                self._by_message[message_id] = key
+                self._by_sender.setdefault(sender_id, set()).add(key)
+                self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_message(self, message_id):
+        with self._lock:
+            key = self._by_message.get(message_id)
+            if key is not None:
+                self._discard(key)
+                self.invalidations += 1
+
+    def invalidate_sender(self, sender_id):
+        with self._lock:
+            keys = self._by_sender.get(sender_id, ())
+            for key in list(keys):
+                self._discard(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_message.clear()
+            self._by_sender.clear()
+            self._bytes = 0
+
+    def _discard(self, key):
+        # Caller holds the lock
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+        message_id, _, sender_id, _ = key
+        if self._by_message.get(message_id) == key:
+            del self._by_message[message_id]
+        keys = self._by_sender.get(sender_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_sender[sender_id]
+
+    @property
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_fragment_cache():
+    """
+    Return the process-wide fragment cache, or None when it is disabled.
+    """
+    global _cache
+    config = get_fragment_cache_settings()
+    if not config['ENABLED']:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = FragmentCache(config['MAX_ENTRIES'], config['MAX_BYTES'])
+        return _cache
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def fragment_key(message, sender_fields):
+    """
+    Return the cache key of a message's rendered fragment.
+    """
+    sender = message.sender
+    fingerprint = _digest(json.dumps(
+        [getattr(sender, field) for field in sender_fields], cls=DjangoJSONEncoder
+    ))
+    state = (
+        message.updated_at, message.is_read, message.conversation_id,
+        _digest(message.message_body)
+    )
+    return (message.pk, state, message.sender_id, fingerprint)
@@ -0,0 +1,90 @@
+# messaging_app/chats/management/commands/benchmark_message_writes.py
+
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from chats.batching import GroupCommitBatcher
+from chats.models import Conversation, Message
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Measure message insert throughput with and without group commit.
+
+    Runs against the configured database; the benchmark users,
+    conversation and messages are deleted afterwards.
+    """
+    help = 'Benchmark concurrent message inserts with and without group commit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--messages', type=int, default=2000,
+                            help='Total messages inserted per mode')
+        parser.add_argument('--window-ms', type=float, default=5)
+        parser.add_argument('--max-batch', type=int, default=256)
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        sender = User.objects.create_user(username=f'bench-sender-{suffix}')
+        other = User.objects.create_user(username=f'bench-other-{suffix}')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(sender, other)
+        using = router.db_for_write(Message, instance=Message(conversation=conversation))
+
+        def insert():
+            Message.objects.create(
+                conversation=conversation,
+                sender=sender,
+                message_body='benchmark'
+            )
+
+        try:
+            direct = self._run(options, insert)
+            batcher = GroupCommitBatcher(
+                using=using,
+                window_ms=options['window_ms'],
+                max_batch=options['max_batch']
+            )
+            try:
+                batched = self._run(options, lambda: batcher.submit(insert))
+            finally:
+                batcher.stop()
+        finally:
+            conversation.delete()
+            sender.delete()
+            other.delete()
+
+        self.stdout.write(f"direct:       {direct:10.0f} msgs/sec")
+        self.stdout.write(
+            f"group commit: {batched:10.0f} msgs/sec "
+            f"({batcher.stats['batches']} batches, "
+            f"{batcher.stats['writes'] / max(batcher.stats['batches'], 1):.1f} writes/batch)"
+        )
+
+    def _run(self, options, write):
+        threads = options['threads']
+        per_thread = options['messages'] // threads
+
+        def worker():
+            try:
+                for _ in range(per_thread):
+                    write()
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return per_thread * threads / elapsed
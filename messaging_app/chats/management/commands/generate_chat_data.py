@@ -0,0 +1,309 @@
+# messaging_app/chats/management/commands/generate_chat_data.py
+
+import bisect
+import itertools
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from chats.models import Conversation, Message, conversation_id_for_key, participant_key_for
+from chats.sharding import get_shard_aliases, shard_for_conversation
+
+WORDS = (
+    'hey hi hello ok sure thanks lunch meeting today tomorrow later call me '
+    'when where why how sounds good great see you soon on my way running late '
+    'can we move the deploy review the doc ticket is done ship it lgtm'
+).split()
+
+# Bodies are drawn from a fixed pool of 2**12 so generation stays cheap
+BODY_POOL_BITS = 12
+
+
+class Command(BaseCommand):
+    """
+    Generate users, conversations, participants and messages at scale.
+
+    Output is fully determined by --seed. Conversation sizes follow a long
+    tail (mostly one-to-one chats, a few large groups) and messages are
+    spread over conversations with a Zipf distribution (--skew), so a few
+    hot conversations hold most of the traffic.
+
+    Rows are written with raw multi-row INSERTs (executemany on the
+    sqlite3 cursor), one transaction per batch, with synchronous and
+    foreign key checks off for the duration of the run. Secondary indexes
+    of the chats tables are dropped during the load and rebuilt at the
+    end, and messages are generated in time order with time-ordered ids
+    so the remaining primary key indexes only append. Nothing is written to the change
+    event log and no signals fire: this is bulk test data, not user
+    activity.
+    """
+    help = 'Generate synthetic chat data (deterministic, skewed, fast)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--conversations', type=int, default=20000)
+        parser.add_argument('--messages', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent of messages per conversation (0 = uniform)')
+        parser.add_argument('--group-ratio', type=float, default=0.15,
+                            help='Share of conversations with more than two participants')
+        parser.add_argument('--max-group-size', type=int, default=200)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Messages are spread over the last N days')
+        parser.add_argument('--prefix', default='gen',
+                            help='Username prefix of the generated users')
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument('--no-defer-indexes', dest='defer_indexes', action='store_false',
+                            help='Keep secondary indexes in place while loading')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 and options['conversations']:
+            raise CommandError('At least two users are needed for conversations')
+        for alias in get_shard_aliases():
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError('generate_chat_data writes raw SQLite inserts')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.aliases = get_shard_aliases()
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+        pragmas = self._tune()
+        started = time.monotonic()
+        total = 0
+        indexes = self._drop_indexes() if options['defer_indexes'] else {}
+        try:
+            for phase in ('users', 'conversations', 'messages'):
+                phase_started = time.monotonic()
+                rows = getattr(self, f'_generate_{phase}')(options)
+                elapsed = time.monotonic() - phase_started
+                total += rows
+                self.stdout.write(
+                    f'{phase}: {rows} rows in {elapsed:.2f}s '
+                    f'({rows / elapsed if elapsed else 0:,.0f} rows/s)'
+                )
+        finally:
+            phase_started = time.monotonic()
+            self._create_indexes(indexes)
+            if indexes:
+                self.stdout.write(f'indexes rebuilt in {time.monotonic() - phase_started:.2f}s')
+            self._restore(pragmas)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} rows/s)'
+        ))
+
+    def _tune(self):
+        previous = {}
+        for alias in self.aliases:
+            if connections[alias].in_atomic_block:
+                # SQLite ignores or rejects these inside a transaction
+                continue
+            cursor = connections[alias].cursor()
+            previous[alias] = (
+                cursor.execute('PRAGMA synchronous').fetchone()[0],
+                cursor.execute('PRAGMA foreign_keys').fetchone()[0],
+            )
+            cursor.execute('PRAGMA synchronous = OFF')
+            # Generated rows reference each other consistently by construction
+            cursor.execute('PRAGMA foreign_keys = OFF')
+            cursor.execute('PRAGMA temp_store = MEMORY')
+            cursor.execute('PRAGMA cache_size = -262144')  # 256 MiB
+        return previous
+
+    def _restore(self, previous):
+        for alias, (synchronous, foreign_keys) in previous.items():
+            cursor = connections[alias].cursor()
+            cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+            cursor.execute(f'PRAGMA foreign_keys = {int(foreign_keys)}')
+
+    def _drop_indexes(self):
+        """
+        Drop the secondary indexes of the chats tables; building them once
+        after the load is much cheaper than maintaining them row by row.
+        Returns {alias: [CREATE INDEX statement, ...]}.
+        """
+        tables = [
+            Conversation._meta.db_table,
+            Conversation.participants.through._meta.db_table,
+            Message._meta.db_table,
+        ]
+        dropped = {}
+        for alias in self.aliases:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                    f"AND sql IS NOT NULL AND tbl_name IN ({', '.join(['%s'] * len(tables))})",
+                    tables
+                )
+                indexes = cursor.fetchall()
+                for name, _ in indexes:
+                    cursor.execute(f'DROP INDEX {connections[alias].ops.quote_name(name)}')
+            dropped[alias] = [sql for _, sql in indexes]
+        return dropped
+
+    def _create_indexes(self, indexes):
+        for alias, statements in indexes.items():
+            with connections[alias].cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def _insert(self, alias, table, columns, rows):
+        connection = connections[alias]
+        sql = (
+            f'INSERT INTO {connection.ops.quote_name(table)} '
+            f'({", ".join(connection.ops.quote_name(column) for column in columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))})'
+        )
+        rows = iter(rows)
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                return count
+            with transaction.atomic(using=alias):
+                connection.ensure_connection()
+                # The raw sqlite3 cursor skips Django's per-row param conversion
+                connection.connection.executemany(sql, batch)
+            count += len(batch)
+
+    def _uuid(self):
+        return '%032x' % self.rng.getrandbits(128)
+
+    def _timestamp(self, seconds_ago):
+        return (self.now - timedelta(seconds=seconds_ago)).isoformat(' ')
+
+    def _generate_users(self, options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM auth_user')
+            first_id = cursor.fetchone()[0] + 1
+        self.user_ids = list(range(first_id, first_id + options['users']))
+        joined = self._timestamp(options['days'] * 86400)
+        prefix = f"{options['prefix']}{options['seed']}_"
+
+        columns = ['id', 'password', 'is_superuser', 'username', 'first_name',
+                   'last_name', 'email', 'is_staff', 'is_active', 'date_joined']
+        rows = [
+            # '!' marks an unusable password: generated users cannot log in
+            (user_id, '!', 0, f'{prefix}{user_id}', '', '', f'{prefix}{user_id}@example.com',
+             0, 1, joined)
+            for user_id in self.user_ids
+        ]
+        # Users are mirrored on every shard
+        for alias in self.aliases:
+            self._insert(alias, 'auth_user', columns, rows)
+        return len(rows)
+
+    def _conversation_size(self, options):
+        if self.rng.random() >= options['group_ratio']:
+            return 2
+        # Long tail of group sizes
+        size = 2 + int(self.rng.paretovariate(1.3))
+        return min(size, options['max_group_size'], len(self.user_ids))
+
+    def _generate_conversations(self, options):
+        rng = self.rng
+        keys = set()
+        self.conversations = []
+        conversation_rows = {alias: [] for alias in self.aliases}
+        participant_rows = {alias: [] for alias in self.aliases}
+        created = self._timestamp(options['days'] * 86400)
+
+        for _ in range(options['conversations']):
+            for _attempt in range(5):
+                members = rng.sample(self.user_ids, self._conversation_size(options))
+                key = participant_key_for(members)
+                if key not in keys:
+                    break
+            else:
+                # Participant set already taken: keep the conversation unkeyed
+                key = None
+            keys.add(key)
+            # Keyed conversations live on their participant key's home shard
+            conversation_id = conversation_id_for_key(key).hex if key else self._uuid()
+            alias = shard_for_conversation(conversation_id, self.aliases)
+            self.conversations.append((conversation_id, alias, members))
+            conversation_rows[alias].append((conversation_id, key, created, created))
+            participant_rows[alias].extend((conversation_id, user_id) for user_id in members)
+
+        rows = 0
+        for alias in self.aliases:
+            rows += self._insert(
+                alias, Conversation._meta.db_table,
+                ['conversation_id', 'participant_key', 'created_at', 'updated_at'],
+                conversation_rows[alias]
+            )
+            rows += self._insert(
+                alias, Conversation.participants.through._meta.db_table,
+                ['conversation_id', 'user_id'],
+                participant_rows[alias]
+            )
+        return rows
+
+    def _generate_messages(self, options):
+        if not self.conversations or not options['messages']:
+            return 0
+        rng = self.rng
+        conversations = list(self.conversations)
+        # Which conversations are hot is random too
+        rng.shuffle(conversations)
+        cumulative = list(itertools.accumulate(
+            1 / (rank + 1) ** options['skew'] for rank in range(len(conversations))
+        ))
+        total_weight = cumulative[-1]
+        bodies = [
+            ' '.join(rng.choices(WORDS, k=1 + int(rng.expovariate(1 / 8))))
+            for _ in range(2 ** BODY_POOL_BITS)
+        ]
+        span = options['days'] * 86400
+        step = span / options['messages']
+        start = self.now - timedelta(seconds=span)
+        start_ms = int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+        def generate():
+            # Messages are generated in time order (Poisson arrivals), so the
+            # sent_at indexes and the time-ordered ids below only append
+            offset = 0.0
+            for position in range(options['messages']):
+                index = bisect.bisect(cumulative, rng.random() * total_weight)
+                conversation_id, alias, members = conversations[index]
+                offset = min(offset + rng.expovariate(1) * step, span)
+                sent_at = (start + timedelta(seconds=offset)).isoformat(' ')
+                row = (
+                    # 48-bit millisecond timestamp + 80 random bits, like UUIDv7
+                    '%012x%020x' % (start_ms + int(offset * 1000), rng.getrandbits(80)),
+                    conversation_id,
+                    rng.choice(members),
+                    bodies[rng.getrandbits(BODY_POOL_BITS)],
+                    sent_at,
+                    sent_at,
+                    # Older messages are more likely to be read
+                    1 if rng.random() < 1 - position / options['messages'] / 2 else 0,
+                )
+                yield alias, row
+
+        columns = ['message_id', 'conversation_id', 'sender_id', 'message_body',
+                   'sent_at', 'updated_at', 'is_read']
+        if len(self.aliases) == 1:
+            return self._insert(
+                self.aliases[0], Message._meta.db_table, columns,
+                (row for _, row in generate())
+            )
+
+        buffers = {alias: [] for alias in self.aliases}
+        count = 0
+        for alias, row in generate():
+            buffer = buffers[alias]
+            buffer.append(row)
+            if len(buffer) >= self.batch_size:
+                count += self._insert(alias, Message._meta.db_table, columns, buffer)
+                buffer.clear()
+        for alias, buffer in buffers.items():
+            count += self._insert(alias, Message._meta.db_table, columns, buffer)
+        return count
@@ -0,0 +1,50 @@
+# messaging_app/chats/management/commands/provision_users.py
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.provisioning import UserProvisioner, format_for_filename, read_rows
+
+
+class Command(BaseCommand):
+    """
+    Create many users from a CSV (with header) or NDJSON file.
+    Columns/keys: username, email, password, first_name, last_name.
+    """
+    help = 'Bulk-create users from a CSV or NDJSON file ("-" for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help='Input format (default: from the file extension, else csv)')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Password hashing processes (default: one per CPU)')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_for_filename(options['path'])
+        provisioner = UserProvisioner(
+            batch_size=options['batch_size'],
+            workers=options['workers']
+        )
+
+        started = time.monotonic()
+        try:
+            if options['path'] == '-':
+                report = provisioner.provision(read_rows(sys.stdin, fmt))
+            else:
+                with open(options['path'], newline='', encoding='utf-8') as stream:
+                    report = provisioner.provision(read_rows(stream, fmt))
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']} ({error['username']}): {error['errors']}")
+        rate = report['created'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} user(s), {len(report['errors'])} error(s) "
+            f"in {elapsed:.1f}s ({rate:.0f} users/s)"
+        ))
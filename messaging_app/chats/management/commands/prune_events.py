@@ -0,0 +1,32 @@
+# messaging_app/chats/management/commands/prune_events.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from chats.outbox import compact_events, prune_events
+from chats.sharding import get_shard_aliases
+
+
+class Command(BaseCommand):
+    """
+    Apply change-log retention (and optionally compaction) on every shard.
+    Meant to run periodically, e.g. from cron.
+    """
+    help = 'Prune (and optionally compact) the change event log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-hours', type=float, default=None,
+                            help='Override CHATS_OUTBOX RETENTION_HOURS')
+        parser.add_argument('--compact', action='store_true',
+                            help='Also keep only the latest consumed event per row')
+
+    def handle(self, *args, **options):
+        retention = None
+        if options['retention_hours'] is not None:
+            retention = timedelta(hours=options['retention_hours'])
+
+        for alias in get_shard_aliases():
+            compacted = compact_events(using=alias) if options['compact'] else 0
+            pruned = prune_events(using=alias, retention=retention)
+            self.stdout.write(f'{alias}: pruned {pruned}, compacted {compacted}')
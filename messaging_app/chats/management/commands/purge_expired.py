@@ -0,0 +1,52 @@
+# messaging_app/chats/management/commands/purge_expired.py
+
+from django.core.management.base import BaseCommand
+
+from chats.retention import RetentionEngine
+from chats.revocation import prune_expired_revocations
+
+
+class Command(BaseCommand):
+    """
+    Apply the retention policies in small chunks (see chats/retention.py).
+    Safe to run while the API is serving writes, and to interrupt: rerun
+    with --resume to continue the same purge.
+    """
+    help = 'Purge messages (and empty conversations) past their retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause-ms', type=float, default=None,
+                            help='Pause between chunks')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue the latest unfinished run')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be purged')
+
+    def handle(self, *args, **options):
+        engine = RetentionEngine(
+            chunk_size=options['chunk_size'],
+            pause_ms=options['pause_ms'],
+            progress=self._progress,
+            dry_run=options['dry_run']
+        )
+        run = engine.run(resume=options['resume'])
+
+        verb = 'Would purge' if options['dry_run'] else 'Purged'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {run.messages_deleted} message(s) and '
+            f'{run.conversations_deleted} conversation(s) as of {run.as_of:%Y-%m-%d %H:%M:%S}'
+        ))
+
+        if not options['dry_run']:
+            # Revocations are only needed until the token expires
+            pruned = prune_expired_revocations()
+            self.stdout.write(f'Pruned {pruned} expired token revocation(s)')
+
+    def _progress(self, stats):
+        self.stdout.write(
+            f"[{stats['shard']}] {stats['messages_deleted']} messages, "
+            f"{stats['conversations_deleted']} conversations, "
+            f"{stats['rows_per_sec']:.0f} rows/s"
+        )
@@ -0,0 +1,94 @@
+# messaging_app/chats/management/commands/rebalance_shards.py
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from chats import outbox
+from chats.models import Conversation, Message
+from chats.sharding import copy_rows, get_shard_aliases, mirror_user, shard_for_conversation
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Move conversations that are not on their rendezvous shard.
+
+    Run after changing CHATS_SHARDS (and migrating the new shards). Users
+    are mirrored first, then each misplaced conversation is copied with
+    its participant rows and messages to its target shard in one
+    transaction and deleted from the source afterwards. A conversation
+    already present on its target is not copied again, so an interrupted
+    run can simply be restarted.
+    """
+    help = 'Move conversations to the shard they hash to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Messages copied/deleted per statement batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be moved')
+
+    def handle(self, *args, **options):
+        aliases = get_shard_aliases()
+        dry_run = options['dry_run']
+
+        if not dry_run:
+            for user in User.objects.using(DEFAULT_DB_ALIAS).iterator():
+                mirror_user(user, aliases)
+
+        moved = 0
+        for source in aliases:
+            conversation_ids = Conversation.objects.using(source).values_list(
+                'conversation_id', flat=True
+            )
+            for conversation_id in list(conversation_ids):
+                target = shard_for_conversation(conversation_id, aliases)
+                if target == source:
+                    continue
+                moved += 1
+                self.stdout.write(f'{conversation_id}: {source} -> {target}')
+                if not dry_run:
+                    # A move is not a change: keep it out of the change log
+                    with outbox.suppressed():
+                        self._move(conversation_id, source, target, options['batch_size'])
+
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} conversation(s)'))
+
+    def _move(self, conversation_id, source, target, batch_size):
+        conversation = Conversation.objects.using(source).get(conversation_id=conversation_id)
+        Participant = Conversation.participants.through
+
+        if not Conversation.objects.using(target).filter(conversation_id=conversation_id).exists():
+            with transaction.atomic(using=target):
+                copy_rows(Conversation, [conversation], target)
+                Participant.objects.using(target).bulk_create([
+                    Participant(conversation_id=conversation_id, user_id=user_id)
+                    for user_id in Participant.objects.using(source).filter(
+                        conversation_id=conversation_id
+                    ).values_list('user_id', flat=True)
+                ])
+                messages = Message.objects.using(source).filter(
+                    conversation_id=conversation_id
+                ).order_by('pk')
+                batch = []
+                for message in messages.iterator(chunk_size=batch_size):
+                    batch.append(message)
+                    if len(batch) >= batch_size:
+                        copy_rows(Message, batch, target)
+                        batch = []
+                copy_rows(Message, batch, target)
+
+        with transaction.atomic(using=source):
+            message_ids = Message.objects.using(source).filter(
+                conversation_id=conversation_id
+            ).values_list('pk', flat=True)
+            while True:
+                chunk = list(message_ids[:batch_size])
+                if not chunk:
+                    break
+                Message.objects.using(source).filter(pk__in=chunk).delete()
+            Participant.objects.using(source).filter(conversation_id=conversation_id).delete()
+            Conversation.objects.using(source).filter(conversation_id=conversation_id).delete()
@@ -0,0 +1,429 @@
+# messaging_app/chats/metrics.py
+
+"""
+Service metrics in the Prometheus text exposition format.
+
+MetricsMiddleware records, for every request under ``PATH_PREFIXES``:
+
+- chats_http_requests_total{route, method, status}
+- chats_http_request_duration_seconds{route, method} (histogram)
+- chats_http_requests_active{method} (gauge)
+- chats_db_queries_per_request{route, method} (histogram)
+- chats_db_query_duration_seconds{route, method} (histogram, DB time per request)
+- chats_serializer_duration_seconds{route, method} (histogram, time in
+  to_representation of the chats serializers, including the queries it
+  triggers)
+
+``route`` is the URL name (``conversation-list``, ``token_obtain_pair``),
+so its cardinality is bounded by the URLconf; unmatched paths are
+reported as ``unmatched``.
+
+Recording takes no lock: every thread updates its own dict and the
+exposition endpoint sums them. Dicts of finished threads are folded into
+a retired total, so thread-per-request servers do not grow the list.
+
+With several worker processes, set ``MULTIPROCESS_DIR`` to a directory
+shared by the workers: each one writes a snapshot ``<pid>.json`` at most
+every ``FLUSH_SECONDS`` (and at exit), and ``/metrics`` adds the other
+workers' snapshots to its own live values. Counters and histograms of
+exited workers are kept; their gauges are dropped.
+"""
+
+import atexit
+import bisect
+import hmac
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+METRICS_DEFAULTS = {
+    'ENABLED': True,
+    'PATH_PREFIXES': ['/api/chats/', '/api/token/'],
+    'MULTIPROCESS_DIR': None,
+    'FLUSH_SECONDS': 5,
+    'TOKEN': None,  # None: /metrics is open
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+
+
+def get_metrics_settings():
+    """
+    Return the metrics configuration merged over the defaults.
+    """
+    config = dict(METRICS_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_METRICS', {}))
+    return config
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms with per-thread storage.
+
+    Values are keyed by (metric name, label values). A histogram value is
+    a list of per-bucket counts (the last bucket is +Inf) followed by the
+    sum and the count of the observations.
+    """
+
+    def __init__(self):
+        self.definitions = {}  # name -> (kind, description, label names, buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []  # (thread, values)
+        self._retired = {}
+
+    def counter(self, name, description, labels=()):
+        self.definitions[name] = ('counter', description, tuple(labels), None)
+
+    def gauge(self, name, description, labels=()):
+        self.definitions[name] = ('gauge', description, tuple(labels), None)
+
+    def histogram(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.definitions[name] = ('histogram', description, tuple(labels), tuple(buckets))
+
+    def _values(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._threads.append((threading.current_thread(), values))
+            return values
+
+    def inc(self, name, labels=(), amount=1):
+        values = self._values()
+        key = (name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        values = self._values()
+        key = (name, labels)
+        histogram = values.get(key)
+        buckets = self.definitions[name][3]
+        if histogram is None:
+            histogram = values[key] = [0] * (len(buckets) + 3)
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def collect(self):
+        """
+        Return the summed values of every thread: {(name, labels): value}.
+        """
+        with self._lock:
+            alive = []
+            for thread, values in self._threads:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    # A finished thread cannot write any more
+                    _merge(self._retired, values.items())
+            self._threads = alive
+            merged = {}
+            _merge(merged, self._retired.items())
+            for _, values in alive:
+                # Copy first: the owning thread may add keys meanwhile
+                _merge(merged, list(values.items()))
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for _, values in self._threads:
+                values.clear()
+            self._retired = {}
+
+
+def _merge(into, items):
+    for key, value in items:
+        if isinstance(value, list):
+            current = into.get(key)
+            if current is None:
+                into[key] = list(value)
+            else:
+                for i, amount in enumerate(value):
+                    current[i] += amount
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(definitions, values):
+    """
+    Render collected values in the text exposition format (version 0.0.4).
+    """
+    by_name = {}
+    for (name, labels), value in values.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(definitions):
+        kind, description, label_names, buckets = definitions[name]
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name.get(name, []), key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(
+                    f'{name}_bucket{_labels(label_names, labels, [("le", le)])} {cumulative}'
+                )
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ProcessSnapshots:
+    """
+    Snapshot files of the worker processes in a shared directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, registry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        values = [[name, list(labels), value]
+                  for (name, labels), value in registry.collect().items()]
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'pid': os.getpid(), 'values': values}, f)
+        os.replace(path + '.tmp', path)
+
+    def read_others(self, definitions):
+        """
+        Return the merged values of every other process.
+        """
+        merged = {}
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return merged
+        for filename in names:
+            if not filename.endswith('.json') or filename == f'{os.getpid()}.json':
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(snapshot['pid'])
+            _merge(merged, (
+                ((name, tuple(labels)), value)
+                for name, labels, value in snapshot['values']
+                if name in definitions and (alive or definitions[name][0] != 'gauge')
+            ))
+        return merged
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Return the process-wide registry with the chats request metrics.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = MetricsRegistry()
+            registry.counter('chats_http_requests_total',
+                             'HTTP requests by route, method and status.',
+                             ['route', 'method', 'status'])
+            registry.histogram('chats_http_request_duration_seconds',
+                               'HTTP request latency in seconds.',
+                               ['route', 'method'], LATENCY_BUCKETS)
+            registry.gauge('chats_http_requests_active',
+                           'HTTP requests currently being served.', ['method'])
+            registry.histogram('chats_db_queries_per_request',
+                               'Database queries per HTTP request.',
+                               ['route', 'method'], QUERY_COUNT_BUCKETS)
+            registry.histogram('chats_db_query_duration_seconds',
+                               'Database time per HTTP request in seconds.',
+                               ['route', 'method'], DB_TIME_BUCKETS)
+            registry.histogram('chats_serializer_duration_seconds',
+                               'Serializer to_representation time per HTTP request in seconds.',
+                               ['route', 'method'], DB_TIME_BUCKETS)
+            _registry = registry
+        return _registry
+
+
+class _RequestStats:
+    """
+    Per-request accumulator, reachable from the current thread.
+    """
+    __slots__ = ('queries', 'db_seconds', 'serializer_seconds', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+
+_current = threading.local()
+
+
+def _timed_execute(execute, sql, params, many, context):
+    stats = getattr(_current, 'stats', None)
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - started
+        stats.queries += 1
+
+
+def _install_query_timer():
+    # Django keeps one connection object per alias and thread, so the
+    # wrapper is installed once per thread instead of once per request
+    if getattr(_current, 'installed', False):
+        return
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if _timed_execute not in wrappers:
+            wrappers.append(_timed_execute)
+    _current.installed = True
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent in to_representation to the current request's
+    serializer time. Nested serializers are only counted once.
+    """
+
+    def to_representation(self, instance):
+        stats = getattr(_current, 'stats', None)
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+        stats.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_seconds += time.perf_counter() - started
+            stats.serializing = False
+
+
+class MetricsMiddleware:
+    """
+    Records the request metrics (see the module docstring).
+    """
+
+    def __init__(self, get_response):
+        config = get_metrics_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefixes = tuple(config['PATH_PREFIXES'])
+        self.registry = get_registry()
+        self.snapshots = (
+            ProcessSnapshots(config['MULTIPROCESS_DIR']) if config['MULTIPROCESS_DIR'] else None
+        )
+        self.flush_seconds = config['FLUSH_SECONDS']
+        self._flushed_at = 0.0
+        if self.snapshots is not None:
+            atexit.register(self.snapshots.write, self.registry)
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefixes):
+            return self.get_response(request)
+
+        registry = self.registry
+        method = request.method if request.method in METHODS else 'other'
+        _install_query_timer()
+        stats = _current.stats = _RequestStats()
+        registry.inc('chats_http_requests_active', (method,))
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.stats = None
+            match = getattr(request, 'resolver_match', None)
+            route = (match.view_name if match is not None else None) or 'unmatched'
+            labels = (route, method)
+            registry.inc('chats_http_requests_active', (method,), -1)
+            registry.inc('chats_http_requests_total', (route, method, str(status)))
+            registry.observe('chats_http_request_duration_seconds', labels, elapsed)
+            registry.observe('chats_db_queries_per_request', labels, stats.queries)
+            registry.observe('chats_db_query_duration_seconds', labels, stats.db_seconds)
+            registry.observe('chats_serializer_duration_seconds', labels, stats.serializer_seconds)
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.snapshots is None:
+            return
+        now = time.monotonic()
+        if now - self._flushed_at >= self.flush_seconds:
+            self._flushed_at = now
+            self.snapshots.write(self.registry)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint: this process's metrics plus the snapshots
+    of the other workers.
+    """
+    config = get_metrics_settings()
+    if config['TOKEN']:
+        supplied = request.META.get('HTTP_AUTHORIZATION', '')
+        # compare_digest rejects non-ASCII str, so compare the bytes
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {config["TOKEN"]}'.encode()):
+            return HttpResponseForbidden()
+    registry = get_registry()
+    values = registry.collect()
+    if config['MULTIPROCESS_DIR']:
+        _merge(values, ProcessSnapshots(config['MULTIPROCESS_DIR']).read_others(
+            registry.definitions
+        ).items())
+    return HttpResponse(
+        render(registry.definitions, values),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
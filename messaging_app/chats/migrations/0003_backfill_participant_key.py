@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:45
+
+import hashlib
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def backfill_participant_keys(apps, schema_editor):
+    """
+    Compute participant_key for every conversation and merge conversations
+    sharing a participant set into the oldest one: messages are moved to
+    the kept conversation and the duplicates are deleted.
+    """
+    Conversation = apps.get_model('chats', 'Conversation')
+    Message = apps.get_model('chats', 'Message')
+    Participant = Conversation.participants.through
+    db_alias = schema_editor.connection.alias
+
+    participants = defaultdict(set)
+    for conversation_id, user_id in Participant.objects.using(db_alias).values_list(
+        'conversation_id', 'user_id'
+    ):
+        participants[conversation_id].add(user_id)
+
+    by_key = defaultdict(list)
+    for conversation_id, user_ids in participants.items():
+        key = hashlib.sha256(','.join(map(str, sorted(user_ids))).encode()).hexdigest()
+        by_key[key].append(conversation_id)
+
+    for key, conversation_ids in by_key.items():
+        conversations = Conversation.objects.using(db_alias).filter(
+            pk__in=conversation_ids
+        ).order_by('created_at')
+        keep, *duplicates = [conversation.pk for conversation in conversations]
+
+        if duplicates:
+            Message.objects.using(db_alias).filter(
+                conversation_id__in=duplicates
+            ).update(conversation_id=keep)
+            Conversation.objects.using(db_alias).filter(pk__in=duplicates).delete()
+
+        Conversation.objects.using(db_alias).filter(pk=keep).update(participant_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0002_conversation_participant_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_participant_keys, migrations.RunPython.noop),
+    ]
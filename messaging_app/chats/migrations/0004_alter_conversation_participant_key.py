@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_backfill_participant_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='participant_key',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 of the sorted participant ids, kept in sync on participant changes', max_length=64, null=True, unique=True),
+        ),
+    ]
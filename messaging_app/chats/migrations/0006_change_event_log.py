@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:54
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0005_message_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumerOffset',
+            fields=[
+                ('consumer', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Consumer offset',
+                'verbose_name_plural': 'Consumer offsets',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entity', models.CharField(choices=[('conversation', 'Conversation'), ('participants', 'Participants'), ('message', 'Message')], max_length=20)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=20)),
+                ('object_id', models.UUIDField(help_text='Primary key of the changed row')),
+                ('conversation_id', models.UUIDField(help_text='Conversation the change belongs to')),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Change event',
+                'verbose_name_plural': 'Change events',
+                'ordering': ['seq'],
+                'indexes': [models.Index(fields=['entity', 'object_id', 'seq'], name='chats_event_object_idx'), models.Index(fields=['created_at'], name='chats_event_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0006_change_event_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('finished', 'Finished')], default='running', max_length=10)),
+                ('messages_deleted', models.BigIntegerField(default=0)),
+                ('conversations_deleted', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Retention run',
+                'verbose_name_plural': 'Retention runs',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='changeevent',
+            name='action',
+            field=models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('purged', 'Purged by retention')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_age_days', models.PositiveIntegerField(help_text='Messages older than this are purged')),
+                ('delete_empty_conversations', models.BooleanField(default=False, help_text='Also delete conversations left without messages that are older than max_age_days')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('conversation', models.OneToOneField(blank=True, help_text='Leave empty for the global policy', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='retention_policy', to='chats.conversation')),
+            ],
+            options={
+                'verbose_name': 'Retention policy',
+                'verbose_name_plural': 'Retention policies',
+            },
+        ),
+    ]
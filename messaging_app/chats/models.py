@@ -1,12 +1,128 @@
 # messaging_app/chats/models.py
 
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from .sharding import ShardedManager, get_shard_aliases, is_sharded, shard_for_conversation
+import hashlib
 import uuid
 
 User = get_user_model()
 
 
+def participant_key_for(user_ids):
+    """
+    Return the canonical key of a participant set: the SHA-256 hex digest
+    of the sorted, de-duplicated user ids. Returns None for an empty set.
+    """
+    ids = sorted({int(user_id) for user_id in user_ids})
+    if not ids:
+        return None
+    return hashlib.sha256(','.join(map(str, ids)).encode()).hexdigest()
+
+
+# Namespace of the conversation ids derived from participant keys
+PARTICIPANT_KEY_NAMESPACE = uuid.UUID('5b0f8a3e-2c1d-4f6b-9e7a-3d2c1b0a9f8e')
+
+
+def conversation_id_for_key(key):
+    """
+    Return the conversation_id a new conversation with participant_key
+    key gets. It is derived from the key, so the conversation's shard is
+    a function of its participant set: every find_or_create for the same
+    set lands on the same shard, where participant_key is unique.
+    """
+    return uuid.uuid5(PARTICIPANT_KEY_NAMESPACE, key)
+
+
+class ConversationManager(ShardedManager):
+    """
+    Manager with participant-set lookups backed by the participant_key index.
+    """
+
+    def _home_shard(self, key):
+        return self._db or shard_for_conversation(conversation_id_for_key(key))
+
+    def _find_by_key(self, key):
+        home = self._home_shard(key)
+        conversation = self.using(home).filter(participant_key=key).first()
+        if conversation is not None or self._db:
+            return conversation
+        # Conversations whose participants changed after creation keep
+        # their shard, so a miss on the home shard checks the others
+        for alias in get_shard_aliases():
+            if alias != home:
+                conversation = self.using(alias).filter(participant_key=key).first()
+                if conversation is not None:
+                    return conversation
+        return None
+
+    def find_by_participants(self, user_ids):
+        """
+        Return the conversation whose participants are exactly user_ids, or None.
+        """
+        key = participant_key_for(user_ids)
+        if key is None:
+            return None
+        return self._find_by_key(key)
+
+    def _create(self, using, conversation_id, key, user_ids):
+        with transaction.atomic(using=using):
+            conversation = self.using(using).create(
+                conversation_id=conversation_id,
+                participant_key=key
+            )
+            conversation.participants.set(user_ids)
+        return conversation
+
+    def find_or_create(self, user_ids):
+        """
+        Return (conversation, created) for the exact participant set user_ids.
+        The ids must reference existing users.
+
+        A new conversation is created on the home shard of its participant
+        key, so concurrent calls for the same set collide on that shard's
+        unique participant_key (or primary key) and the loser returns the
+        winner's conversation.
+        """
+        user_ids = sorted({int(user_id) for user_id in user_ids})
+        key = participant_key_for(user_ids)
+
+        if key is None:
+            conversation_id = uuid.uuid4()
+            using = self._db or shard_for_conversation(conversation_id)
+            return self._create(using, conversation_id, key, user_ids), True
+
+        conversation = self._find_by_key(key)
+        if conversation is not None:
+            return conversation, False
+
+        using = self._home_shard(key)
+        conversation_id = conversation_id_for_key(key)
+        try:
+            return self._create(using, conversation_id, key, user_ids), True
+        except IntegrityError:
+            # Lost the race against a concurrent find_or_create
+            conversation = self._find_by_key(key)
+            if conversation is not None:
+                return conversation, False
+            if not self.using(using).filter(pk=conversation_id).exists():
+                raise
+        # The derived id belongs to a conversation whose participants have
+        # changed since: use a random id that hashes to the same shard
+        while True:
+            conversation_id = uuid.uuid4()
+            if self._db or shard_for_conversation(conversation_id) == using:
+                break
+        try:
+            return self._create(using, conversation_id, key, user_ids), True
+        except IntegrityError:
+            conversation = self._find_by_key(key)
+            if conversation is None:
+                raise
+            return conversation, False
+
+
 class Conversation(models.Model):
     """
     Model representing a conversation between multiple users.
@@ -21,9 +137,19 @@ class Conversation(models.Model):
         related_name='conversations',
         help_text="Users participating in this conversation"
     )
+    participant_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="SHA-256 of the sorted participant ids, kept in sync on participant changes"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ConversationManager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Conversation'
@@ -37,6 +163,44 @@ class Conversation(models.Model):
     def last_message(self):
         """Get the last message in this conversation."""
         return self.messages.order_by('-sent_at').first()
+    
+    def refresh_participant_key(self):
+        """
+        Recompute participant_key from the current participants.
+        Raises IntegrityError if another conversation has the same participant set.
+        """
+        using = self._state.db or router.db_for_write(Conversation, instance=self)
+        user_ids = self.participants.through.objects.using(using).filter(
+            conversation_id=self.pk
+        ).values_list('user_id', flat=True)
+        self.participant_key = participant_key_for(user_ids)
+        if self.participant_key is not None and is_sharded():
+            # The unique index only covers this shard
+            for alias in get_shard_aliases():
+                if alias != using and Conversation.objects.using(alias).filter(
+                    participant_key=self.participant_key
+                ).exists():
+                    raise IntegrityError(
+                        'A conversation with these participants already exists'
+                    )
+        with transaction.atomic(using=using, savepoint=False):
+            Conversation.objects.using(using).filter(pk=self.pk).update(
+                participant_key=self.participant_key
+            )
+            # Every participant change ends here, so log it here
+            from .outbox import record_event
+            record_event(self, 'updated', using, entity='participants', payload={
+                'participant_ids': sorted(user_ids),
+                'participant_key': self.participant_key,
+            })
+    
+    def save(self, *args, **kwargs):
+        """
+        Save inside a transaction so the change event commits with the row.
+        """
+        using = kwargs.get('using') or router.db_for_write(Conversation, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
 
 
 class Message(models.Model):
@@ -52,12 +216,14 @@ class Message(models.Model):
         Conversation,
         on_delete=models.CASCADE,
         related_name='messages',
+        db_index=False,  # Covered by the (conversation, -sent_at) index
         help_text="The conversation this message belongs to"
     )
     sender = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='sent_messages',
+        db_index=False,  # Covered by the (sender, sent_at) index
         help_text="The user who sent this message"
     )
     message_body = models.TextField(
@@ -67,13 +233,24 @@ class Message(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_read = models.BooleanField(default=False)
     
+    objects = ShardedManager()
+    
     class Meta:
         ordering = ['sent_at']
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         indexes = [
             models.Index(fields=['-sent_at']),
+            # Conversation timelines, previews and conversation_messages
             models.Index(fields=['conversation', '-sent_at']),
+            # my_messages: sender filter ordered by sent_at
+            models.Index(fields=['sender', 'sent_at'], name='chats_msg_sender_sent_idx'),
+            # unread_messages: only unread rows, per conversation, by sent_at
+            models.Index(
+                fields=['conversation', 'sent_at'],
+                condition=models.Q(is_read=False),
+                name='chats_msg_unread_idx'
+            ),
         ]
     
     def __str__(self):
@@ -85,4 +262,151 @@ class Message(models.Model):
         """
         if self.sender not in self.conversation.participants.all():
             raise ValueError("Sender must be a participant in the conversation")
-        super().save(*args, **kwargs)
\ No newline at end of file
+        # One transaction for the row and its change event
+        using = kwargs.get('using') or router.db_for_write(Message, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class ChangeEvent(models.Model):
+    """
+    Append-only log of changes to conversations and messages (transactional
+    outbox). Events are written in the same transaction as the change they
+    describe, on the same database, and are read in seq order by consumers.
+    """
+    ENTITY_CHOICES = [
+        ('conversation', 'Conversation'),
+        ('participants', 'Participants'),
+        ('message', 'Message'),
+    ]
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+        ('purged', 'Purged by retention'),
+    ]
+    
+    seq = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    object_id = models.UUIDField(help_text="Primary key of the changed row")
+    conversation_id = models.UUIDField(help_text="Conversation the change belongs to")
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['seq']
+        verbose_name = 'Change event'
+        verbose_name_plural = 'Change events'
+        indexes = [
+            # Compaction: latest event per changed row
+            models.Index(fields=['entity', 'object_id', 'seq'], name='chats_event_object_idx'),
+            # Retention: oldest events first
+            models.Index(fields=['created_at'], name='chats_event_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.seq} {self.entity} {self.action} {self.object_id}"
+
+
+class ConsumerOffset(models.Model):
+    """
+    Last event seq processed by a named consumer of the change log.
+    """
+    consumer = models.CharField(max_length=100, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Consumer offset'
+        verbose_name_plural = 'Consumer offsets'
+    
+    def __str__(self):
+        return f"{self.consumer} @ {self.position}"
+
+
+class RetentionPolicy(models.Model):
+    """
+    How long messages are kept. A policy without a conversation is global
+    and applies to every conversation that has no policy of its own; if
+    several global policies exist the shortest one wins.
+    """
+    conversation = models.OneToOneField(
+        Conversation,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='retention_policy',
+        help_text="Leave empty for the global policy"
+    )
+    max_age_days = models.PositiveIntegerField(
+        help_text="Messages older than this are purged"
+    )
+    delete_empty_conversations = models.BooleanField(
+        default=False,
+        help_text="Also delete conversations left without messages that are older than max_age_days"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        verbose_name = 'Retention policy'
+        verbose_name_plural = 'Retention policies'
+    
+    def __str__(self):
+        scope = self.conversation_id or 'global'
+        return f"Retention {scope}: {self.max_age_days} days"
+
+
+class RetentionRun(models.Model):
+    """
+    Progress of one retention purge. Cutoffs are computed from ``as_of``,
+    so resuming an interrupted run targets exactly the same rows.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('finished', 'Finished'),
+    ]
+    
+    as_of = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    messages_deleted = models.BigIntegerField(default=0)
+    conversations_deleted = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+        verbose_name = 'Retention run'
+        verbose_name_plural = 'Retention runs'
+    
+    def __str__(self):
+        return f"Retention run {self.pk} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    """
+    Durable record of a revoked JWT, identified by its jti claim.
+    Rows are only needed until the token would have expired anyway.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    token_type = models.CharField(max_length=20)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='revoked_tokens'
+    )
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Revoked token'
+        verbose_name_plural = 'Revoked tokens'
+    
+    def __str__(self):
+        return f"Revoked {self.token_type} {self.jti}"
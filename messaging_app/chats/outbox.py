@@ -0,0 +1,251 @@
+# messaging_app/chats/outbox.py
+
+"""
+Transactional outbox for conversation and message changes.
+
+Every save/delete of a Conversation or Message, and every participant
+change (entity ``participants``, payload = the full participant set),
+appends a ChangeEvent row in the same transaction and on the
+same database as the change itself. Downstream work (search indexing,
+counters, push delivery, analytics) reads the log instead of the main
+tables or request-time signals.
+
+Delivery semantics:
+- Events are read in ``seq`` order. SQLite runs one writer at a time, so
+  ``seq`` order is also commit order and a consumer never skips an event
+  committed after one it has already seen.
+- EventConsumer commits its offset after a batch has been handled, so a
+  crash replays the last batch: delivery is at-least-once and handlers
+  must be idempotent (``seq`` is a natural dedupe key).
+- With sharding enabled each shard keeps its own log and offsets; run one
+  consumer per shard alias.
+- Queryset ``update()``/``delete()`` calls and raw SQL bypass the log.
+
+Storage is bounded by ``prune_events`` (drop events every consumer has
+processed once they are older than ``RETENTION_HOURS``) and
+``compact_events`` (keep only the latest event per changed row).
+"""
+
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from .models import ChangeEvent, Conversation, ConsumerOffset, Message
+
+
+OUTBOX_DEFAULTS = {
+    'ENABLED': True,
+    'BATCH_SIZE': 1000,
+    'RETENTION_HOURS': 24 * 7,
+}
+
+_state = threading.local()
+
+
+def get_outbox_settings():
+    """
+    Return the outbox configuration merged over the defaults.
+    """
+    config = dict(OUTBOX_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_OUTBOX', {}))
+    return config
+
+
+class suppressed:
+    """
+    Context manager that stops change events from being recorded in the
+    current thread, for maintenance jobs that move rather than change data.
+    """
+
+    def __enter__(self):
+        self._previous = getattr(_state, 'suppressed', False)
+        _state.suppressed = True
+        return self
+
+    def __exit__(self, *exc_info):
+        _state.suppressed = self._previous
+
+
+def _payload(instance):
+    return {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields
+    }
+
+
+def record_event(instance, action, using, entity=None, payload=None):
+    """
+    Append a change event for a Conversation or Message on ``using``.
+    ``entity`` defaults to the model's own ('conversation' or 'message')
+    and ``payload`` to the row's column values.
+    Returns the event, or None when recording is disabled or suppressed.
+    """
+    if getattr(_state, 'suppressed', False) or not get_outbox_settings()['ENABLED']:
+        return None
+
+    if isinstance(instance, Message):
+        default_entity, conversation_id = 'message', instance.conversation_id
+    elif isinstance(instance, Conversation):
+        default_entity, conversation_id = 'conversation', instance.pk
+    else:
+        raise TypeError(f'No change events for {type(instance).__name__}')
+
+    return ChangeEvent.objects.using(using).create(
+        entity=entity or default_entity,
+        action=action,
+        object_id=instance.pk,
+        conversation_id=conversation_id,
+        payload=_payload(instance) if payload is None else payload,
+    )
+
+
+class EventConsumer:
+    """
+    Named, offset-tracking reader of the change log on one database.
+
+        consumer = EventConsumer('search-indexer')
+        for batch in consumer.batches():
+            index(batch)  # offset is committed when the loop continues
+
+    Only the change log and the offsets table are read or written.
+    """
+
+    def __init__(self, name, using=DEFAULT_DB_ALIAS, batch_size=None):
+        self.name = name
+        self.using = using
+        self.batch_size = batch_size or get_outbox_settings()['BATCH_SIZE']
+
+    @property
+    def position(self):
+        """
+        Seq of the last event this consumer committed (0 if none).
+        """
+        offset = ConsumerOffset.objects.using(self.using).filter(
+            consumer=self.name
+        ).values_list('position', flat=True).first()
+        return offset or 0
+
+    def fetch(self, after=None, limit=None):
+        """
+        Return up to ``limit`` events after seq ``after`` (default: the
+        committed position), in seq order.
+        """
+        after = self.position if after is None else after
+        return list(
+            ChangeEvent.objects.using(self.using).filter(
+                seq__gt=after
+            ).order_by('seq')[:limit or self.batch_size]
+        )
+
+    def commit(self, seq):
+        """
+        Record ``seq`` as processed. The position never moves backwards.
+        """
+        with transaction.atomic(using=self.using):
+            offset, _ = ConsumerOffset.objects.using(self.using).select_for_update().get_or_create(
+                consumer=self.name
+            )
+            if seq > offset.position:
+                offset.position = seq
+                offset.save(update_fields=['position', 'updated_at'])
+
+    def batches(self):
+        """
+        Yield batches of pending events until the log is drained. The
+        offset of a batch is committed when the next one is requested, so
+        a batch whose processing raises (or after which the loop breaks)
+        is delivered again next time.
+        """
+        after = self.position
+        while True:
+            batch = self.fetch(after=after)
+            if not batch:
+                return
+            yield batch
+            after = batch[-1].seq
+            self.commit(after)
+
+    def consume(self, handler, max_batches=None):
+        """
+        Pass pending events to ``handler(batch)`` batch by batch.
+        Returns the number of events handled.
+        """
+        handled = 0
+        batches = 0
+        after = self.position
+        while not max_batches or batches < max_batches:
+            batch = self.fetch(after=after)
+            if not batch:
+                break
+            handler(batch)
+            after = batch[-1].seq
+            self.commit(after)
+            handled += len(batch)
+            batches += 1
+        return handled
+
+
+def prune_events(using=DEFAULT_DB_ALIAS, retention=None, chunk_size=None):
+    """
+    Delete events processed by every consumer and older than the retention
+    window. With no registered consumer only the age limit applies.
+    Returns the number of deleted events.
+    """
+    config = get_outbox_settings()
+    if retention is None:
+        retention = timedelta(hours=config['RETENTION_HOURS'])
+    chunk_size = chunk_size or config['BATCH_SIZE']
+
+    events = ChangeEvent.objects.using(using).filter(
+        created_at__lt=timezone.now() - retention
+    )
+    low_watermark = ConsumerOffset.objects.using(using).aggregate(
+        low=Min('position')
+    )['low']
+    if low_watermark is not None:
+        events = events.filter(seq__lte=low_watermark)
+
+    return _delete_in_chunks(events, using, chunk_size)
+
+
+def compact_events(using=DEFAULT_DB_ALIAS, up_to_seq=None, chunk_size=None):
+    """
+    Delete events superseded by a later event for the same row, keeping
+    the latest event per (entity, object_id). Only events up to
+    ``up_to_seq`` (default: every consumer's position) are compacted, so
+    consumers that are behind still see every change.
+    Returns the number of deleted events.
+    """
+    chunk_size = chunk_size or get_outbox_settings()['BATCH_SIZE']
+    if up_to_seq is None:
+        up_to_seq = ConsumerOffset.objects.using(using).aggregate(
+            low=Min('position')
+        )['low']
+        if up_to_seq is None:
+            return 0
+
+    newer = ChangeEvent.objects.using(using).filter(
+        entity=OuterRef('entity'),
+        object_id=OuterRef('object_id'),
+        seq__gt=OuterRef('seq'),
+    )
+    events = ChangeEvent.objects.using(using).filter(
+        Exists(newer),
+        seq__lte=up_to_seq,
+    )
+    return _delete_in_chunks(events, using, chunk_size)
+
+
+def _delete_in_chunks(events, using, chunk_size):
+    deleted = 0
+    seqs = events.order_by('seq').values_list('seq', flat=True)
+    while True:
+        chunk = list(seqs[:chunk_size])
+        if not chunk:
+            return deleted
+        with transaction.atomic(using=using):
+            deleted += ChangeEvent.objects.using(using).filter(seq__in=chunk).delete()[0]
@@ -0,0 +1,336 @@
+# messaging_app/chats/presence.py
+
+"""
+Ephemeral presence ("online", "last seen") and typing indicators.
+
+Nothing here is written to the relational database: heartbeats and
+typing updates go to a presence backend whose entries expire on their
+own. The backend is chosen with ``CHATS_PRESENCE['BACKEND']``:
+
+- LocalPresenceBackend (default) keeps everything in process memory. It
+  is the stand-in for development, tests and single-process deployments.
+- CachePresenceBackend stores entries in the Django cache named by the
+  ``cache_alias`` key of ``CHATS_PRESENCE['OPTIONS']`` (default
+  ``'default'``), so every process sharing that cache (e.g. Redis or
+  Memcached) sees the same presence.
+
+A user is online while their last heartbeat is younger than
+``ONLINE_TTL`` seconds; "last seen" is kept for ``LAST_SEEN_TTL``.
+Typing entries live for ``TYPING_TTL`` seconds unless refreshed.
+
+Who may see what is checked against the database: typing needs
+membership of the conversation, and presence is only returned for users
+sharing a conversation with the requester. Confirmed answers are cached
+in-process for ``MEMBERSHIP_TTL`` seconds (MembershipCache); participant
+removals drop the affected entries at once in this process, other
+processes within the TTL.
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+PRESENCE_DEFAULTS = {
+    'BACKEND': 'chats.presence.LocalPresenceBackend',
+    'OPTIONS': {},
+    'ONLINE_TTL': 60,
+    'LAST_SEEN_TTL': 24 * 60 * 60,
+    'TYPING_TTL': 8,
+    'MEMBERSHIP_TTL': 60,
+}
+
+
+def get_presence_settings():
+    """
+    Return the presence configuration merged over the defaults.
+    """
+    config = dict(PRESENCE_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_PRESENCE', {}))
+    return config
+
+
+class LocalPresenceBackend:
+    """
+    In-process presence store. Expired entries are dropped lazily on
+    reads and by a sweep every ``sweep_interval`` writes.
+    """
+
+    def __init__(self, sweep_interval=1000):
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._last_seen = {}  # user_id -> (timestamp, expires)
+        self._typing = {}  # conversation_id -> {user_id: expires}
+        self._writes = 0
+
+    def touch(self, user_id, now, ttl):
+        with self._lock:
+            self._last_seen[user_id] = (now, now + ttl)
+            self._after_write(now)
+
+    def last_seen_many(self, user_ids, now):
+        with self._lock:
+            found = {}
+            for user_id in user_ids:
+                entry = self._last_seen.get(user_id)
+                if entry is not None and entry[1] > now:
+                    found[user_id] = entry[0]
+            return found
+
+    def set_typing(self, conversation_id, user_id, now, ttl):
+        with self._lock:
+            typists = self._typing.setdefault(conversation_id, {})
+            if ttl > 0:
+                typists[user_id] = now + ttl
+            else:
+                typists.pop(user_id, None)
+            if not typists:
+                del self._typing[conversation_id]
+            self._after_write(now)
+
+    def typing_many(self, conversation_ids, now):
+        with self._lock:
+            return {
+                conversation_id: sorted(
+                    user_id
+                    for user_id, expires in self._typing.get(conversation_id, {}).items()
+                    if expires > now
+                )
+                for conversation_id in conversation_ids
+            }
+
+    def _after_write(self, now):
+        # Caller holds the lock
+        self._writes += 1
+        if self._writes % self.sweep_interval:
+            return
+        self._last_seen = {
+            user_id: entry for user_id, entry in self._last_seen.items() if entry[1] > now
+        }
+        for conversation_id in list(self._typing):
+            typists = {
+                user_id: expires
+                for user_id, expires in self._typing[conversation_id].items()
+                if expires > now
+            }
+            if typists:
+                self._typing[conversation_id] = typists
+            else:
+                del self._typing[conversation_id]
+
+
+class CachePresenceBackend:
+    """
+    Presence store on a shared Django cache. Reads use get_many, so a
+    batch query costs one cache round trip per kind of entry.
+
+    Typing sets are read-modify-write per conversation; two updates racing
+    on the same conversation can lose one, which the next typing refresh
+    (every few seconds) repairs.
+    """
+
+    def __init__(self, cache_alias='default', key_prefix='chats:presence'):
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+
+    def _user_key(self, user_id):
+        return f'{self.key_prefix}:user:{user_id}'
+
+    def _typing_key(self, conversation_id):
+        return f'{self.key_prefix}:typing:{conversation_id}'
+
+    def touch(self, user_id, now, ttl):
+        self.cache.set(self._user_key(user_id), now, timeout=ttl)
+
+    def last_seen_many(self, user_ids, now):
+        keys = {self._user_key(user_id): user_id for user_id in user_ids}
+        return {keys[key]: value for key, value in self.cache.get_many(list(keys)).items()}
+
+    def set_typing(self, conversation_id, user_id, now, ttl):
+        key = self._typing_key(conversation_id)
+        typists = {
+            member: expires
+            for member, expires in (self.cache.get(key) or {}).items()
+            if expires > now
+        }
+        if ttl > 0:
+            typists[user_id] = now + ttl
+        else:
+            typists.pop(user_id, None)
+        if typists:
+            self.cache.set(key, typists, timeout=max(typists.values()) - now)
+        else:
+            self.cache.delete(key)
+
+    def typing_many(self, conversation_ids, now):
+        keys = {self._typing_key(conversation_id): conversation_id
+                for conversation_id in conversation_ids}
+        stored = self.cache.get_many(list(keys))
+        return {
+            conversation_id: sorted(
+                user_id
+                for user_id, expires in stored.get(key, {}).items()
+                if expires > now
+            )
+            for key, conversation_id in keys.items()
+        }
+
+
+class MembershipCache:
+    """
+    Process-local cache of relations confirmed against the database:
+    (user_id, conversation_id) memberships and (viewer_id, user_id) pairs
+    of users sharing a conversation. Only confirmations are cached, so a
+    new participant is seen at once; forget() drops what a removal
+    invalidates. Holds at most ``max_entries`` of each kind.
+    """
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._members = {}  # (user_id, conversation_id) -> expires
+        self._contacts = {}  # (viewer_id, user_id) -> expires
+
+    def _add(self, entries, keys, now):
+        if len(entries) > self.max_entries:
+            entries.clear()
+        for key in keys:
+            entries[key] = now + self.ttl
+
+    def is_member(self, user_id, conversation_id, now):
+        with self._lock:
+            return self._members.get((user_id, conversation_id), 0) > now
+
+    def add_member(self, user_id, conversation_id, now):
+        with self._lock:
+            self._add(self._members, [(user_id, conversation_id)], now)
+
+    def known_contacts(self, viewer_id, user_ids, now):
+        """
+        Return the subset of user_ids confirmed to share a conversation
+        with viewer_id.
+        """
+        with self._lock:
+            return {
+                user_id for user_id in user_ids
+                if self._contacts.get((viewer_id, user_id), 0) > now
+            }
+
+    def add_contacts(self, viewer_id, user_ids, now):
+        with self._lock:
+            self._add(self._contacts, [(viewer_id, user_id) for user_id in user_ids], now)
+
+    def forget(self, conversation_id, user_ids=None):
+        """
+        Drop the entries invalidated by removing user_ids (every
+        participant when None) from a conversation.
+        """
+        with self._lock:
+            self._members = {
+                (user_id, member_of): expires
+                for (user_id, member_of), expires in self._members.items()
+                if member_of != conversation_id
+                or (user_ids is not None and user_id not in user_ids)
+            }
+            if user_ids is None:
+                self._contacts.clear()
+            else:
+                self._contacts = {
+                    (viewer_id, user_id): expires
+                    for (viewer_id, user_id), expires in self._contacts.items()
+                    if viewer_id not in user_ids and user_id not in user_ids
+                }
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_memberships = None
+
+
+def get_presence_backend():
+    """
+    Return the configured presence backend (created once per process).
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = get_presence_settings()
+            _backend = import_string(config['BACKEND'])(**config['OPTIONS'])
+        return _backend
+
+
+def get_membership_cache():
+    """
+    Return this process's MembershipCache.
+    """
+    global _memberships
+    with _backend_lock:
+        if _memberships is None:
+            _memberships = MembershipCache(get_presence_settings()['MEMBERSHIP_TTL'])
+        return _memberships
+
+
+def forget_memberships(conversation_id, user_ids=None):
+    """
+    Drop cached memberships and contacts invalidated by removing user_ids
+    (every participant when None) from a conversation.
+    """
+    get_membership_cache().forget(
+        uuid.UUID(str(conversation_id)),
+        None if user_ids is None else {int(user_id) for user_id in user_ids}
+    )
+
+
+def heartbeat(user_id):
+    """
+    Mark a user as online now.
+    """
+    config = get_presence_settings()
+    get_presence_backend().touch(user_id, time.time(), config['LAST_SEEN_TTL'])
+
+
+def set_typing(conversation_id, user_id, typing=True):
+    """
+    Start (or refresh) or stop a user's typing indicator in a conversation.
+    Typing also counts as a heartbeat.
+    """
+    config = get_presence_settings()
+    now = time.time()
+    backend = get_presence_backend()
+    backend.set_typing(str(conversation_id), user_id, now, config['TYPING_TTL'] if typing else 0)
+    backend.touch(user_id, now, config['LAST_SEEN_TTL'])
+
+
+def presence_for(user_ids):
+    """
+    Return {user_id: {'online': bool, 'last_seen': ISO timestamp or None}}.
+    """
+    config = get_presence_settings()
+    now = time.time()
+    user_ids = list(dict.fromkeys(user_ids))
+    seen = get_presence_backend().last_seen_many(user_ids, now)
+    result = {}
+    for user_id in user_ids:
+        last_seen = seen.get(user_id)
+        result[user_id] = {
+            'online': last_seen is not None and now - last_seen < config['ONLINE_TTL'],
+            'last_seen': (
+                datetime.fromtimestamp(last_seen, tz=timezone.utc).isoformat()
+                if last_seen is not None else None
+            ),
+        }
+    return result
+
+
+def typing_in(conversation_ids):
+    """
+    Return {conversation_id: [user_id, ...]} of users currently typing.
+    """
+    ids = [str(conversation_id) for conversation_id in conversation_ids]
+    return get_presence_backend().typing_many(ids, time.time())
@@ -0,0 +1,378 @@
+# messaging_app/chats/profiling.py
+
+"""
+Sampling profiler for API requests.
+
+SamplingProfilerMiddleware profiles a fraction (``SAMPLE_RATE``) of the
+requests, plus every request whose ``HEADER`` carries the configured
+``TOKEN``. While such a request runs, a background thread snapshots the
+request thread's stack every ``INTERVAL_MS`` (``sys._current_frames``);
+the request thread itself is never traced or instrumented, so profiled
+requests only pay for the sampler holding the GIL while it walks one
+stack.
+
+Samples are aggregated per view (``ConversationViewSet.list``, ...) as
+collapsed stacks, rooted at the phase the sample fell in:
+
+- auth: DRF authentication (including token revocation checks)
+- permission: permission and throttle checks
+- queryset: SQL execution
+- serializer: serializer ``data``/``to_representation``
+- renderer: response rendering
+- view: everything else
+
+The innermost phase wins, so queries issued from a serializer count as
+queryset time. Collapsed stacks are the input format of flamegraph.pl and
+speedscope; with ``OUTPUT_DIR`` set they are written there as
+``<view>.collapsed`` at most every ``FLUSH_SECONDS``.
+
+With ``ENABLED`` false the middleware removes itself from the chain
+(MiddlewareNotUsed), so it costs nothing. When enabled, an unprofiled
+request costs one random draw and one header lookup.
+"""
+
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.models.sql.compiler import SQLCompiler
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+PROFILING_DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.0,
+    'HEADER': 'X-Chats-Profile',
+    'TOKEN': None,  # None: the header is ignored
+    'INTERVAL_MS': 5,
+    'MAX_STACKS': 5000,
+    'OUTPUT_DIR': None,
+    'FLUSH_SECONDS': 30,
+}
+
+PHASES = ('auth', 'permission', 'queryset', 'serializer', 'renderer', 'view')
+
+
+def get_profiling_settings():
+    """
+    Return the profiling configuration merged over the defaults.
+    """
+    config = dict(PROFILING_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_PROFILING', {}))
+    return config
+
+
+def _phase_codes():
+    # Code objects marking the start of a phase in a stack
+    markers = {
+        'auth': [APIView.perform_authentication],
+        'permission': [
+            APIView.check_permissions,
+            APIView.check_object_permissions,
+            APIView.check_throttles,
+        ],
+        'queryset': [SQLCompiler.execute_sql],
+        'serializer': [
+            serializers.BaseSerializer.data.fget,
+            serializers.Serializer.data.fget,
+            serializers.ListSerializer.data.fget,
+            serializers.Serializer.to_representation,
+            serializers.ListSerializer.to_representation,
+        ],
+        'renderer': [Response.rendered_content.fget],
+    }
+    return {
+        function.__code__: phase
+        for phase, functions in markers.items()
+        for function in functions
+    }
+
+
+class ViewProfile:
+    """
+    Aggregated samples of one view.
+    """
+
+    def __init__(self, max_stacks):
+        self.max_stacks = max_stacks
+        self.requests = 0
+        self.samples = 0
+        self.wall_seconds = 0.0
+        self.phases = Counter()
+        self.stacks = Counter()
+
+    def add(self, phase, stack):
+        self.samples += 1
+        self.phases[phase] += 1
+        if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+            # Bounded memory: unseen stacks only keep their phase
+            stack = f'{phase};[truncated]'
+        self.stacks[stack] += 1
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'samples': self.samples,
+            'wall_ms': round(self.wall_seconds * 1000, 3),
+            'phases': {
+                phase: {
+                    'samples': self.phases[phase],
+                    'share': round(self.phases[phase] / self.samples, 4),
+                    # Wall time apportioned by sample share
+                    'estimated_ms': round(
+                        self.wall_seconds * 1000 * self.phases[phase] / self.samples, 3
+                    ),
+                }
+                for phase in PHASES
+                if self.phases[phase]
+            },
+        }
+
+    def collapsed(self):
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in sorted(self.stacks.items())
+        )
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads currently serving a profiled request.
+    The sampler thread starts on first use and sleeps while nothing is
+    being profiled.
+    """
+
+    def __init__(self, interval_ms, max_stacks):
+        self.interval = interval_ms / 1000
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._active = {}  # thread id -> [view name, root code object]
+        self._views = {}
+        self._labels = {}
+        self._phase_codes = _phase_codes()
+        self.sampler_seconds = 0.0
+        self.sampler_runs = 0
+
+    def start(self, root_code):
+        """
+        Start sampling the calling thread. Frames outside ``root_code``
+        (the WSGI server, outer middleware) are left out of the stacks.
+        """
+        with self._lock:
+            self._active[threading.get_ident()] = [None, root_code]
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='chats-profiler', daemon=True
+                )
+                self._thread.start()
+            self._wakeup.set()
+
+    def set_view(self, name):
+        entry = self._active.get(threading.get_ident())
+        if entry is not None:
+            entry[0] = name
+
+    def stop(self, wall_seconds):
+        """
+        Stop sampling the calling thread and account the request.
+        """
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+            if entry is None or entry[0] is None:
+                return
+            self._view(entry[0]).requests += 1
+            self._view(entry[0]).wall_seconds += wall_seconds
+
+    def _view(self, name):
+        # Caller holds the lock
+        profile = self._views.get(name)
+        if profile is None:
+            profile = self._views[name] = ViewProfile(self.max_stacks)
+        return profile
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._wakeup.clear()
+                    idle = True
+                else:
+                    idle = False
+            if idle:
+                self._wakeup.wait()
+                continue
+            time.sleep(self.interval)
+            started = time.perf_counter()
+            self.sample()
+            self.sampler_seconds += time.perf_counter() - started
+            self.sampler_runs += 1
+
+    def sample(self):
+        """
+        Take one sample of every profiled thread.
+        """
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, (name, root_code) in self._active.items():
+                frame = frames.get(ident)
+                if frame is None or name is None:
+                    continue
+                phase, stack = self._walk(frame, root_code)
+                self._view(name).add(phase, stack)
+
+    def _walk(self, frame, root_code):
+        codes = []
+        while frame is not None and frame.f_code is not root_code:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        phase = 'view'
+        for code in codes:
+            phase = self._phase_codes.get(code, phase)
+        return phase, ';'.join([phase] + [self._label(code) for code in codes])
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for path in sorted(sys.path, key=len, reverse=True):
+                if path and filename.startswith(path + os.sep):
+                    filename = filename[len(path) + 1:]
+                    break
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = self._labels[code] = f'{name} ({filename}:{code.co_firstlineno})'
+        return label
+
+    def summary(self):
+        with self._lock:
+            views = {name: profile.summary() for name, profile in sorted(self._views.items())}
+        return {
+            'interval_ms': self.interval * 1000,
+            'sampler': {
+                'runs': self.sampler_runs,
+                'busy_ms': round(self.sampler_seconds * 1000, 3),
+                'ms_per_run': round(
+                    self.sampler_seconds * 1000 / self.sampler_runs, 4
+                ) if self.sampler_runs else 0.0,
+            },
+            'views': views,
+        }
+
+    def collapsed(self, name):
+        """
+        Collapsed stacks of one view, or None if it has no samples.
+        """
+        with self._lock:
+            profile = self._views.get(name)
+            return profile.collapsed() if profile is not None else None
+
+    def write_collapsed(self, directory):
+        """
+        Write ``<view>.collapsed`` for every view into ``directory``.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            files = {name: profile.collapsed() for name, profile in self._views.items()}
+        for name, content in files.items():
+            path = os.path.join(directory, re.sub(r'[^\w.-]', '_', name) + '.collapsed')
+            with open(path + '.tmp', 'w') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self.sampler_seconds = 0.0
+            self.sampler_runs = 0
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """
+    Return the process-wide sampling profiler.
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            config = get_profiling_settings()
+            _profiler = SamplingProfiler(config['INTERVAL_MS'], config['MAX_STACKS'])
+        return _profiler
+
+
+def view_name(view_func, method):
+    """
+    Return 'ViewSet.action' for DRF viewsets, the function name otherwise.
+    """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    method = method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method, method)}'
+
+
+class SamplingProfilerMiddleware:
+    """
+    Profiles sampled requests (see the module docstring).
+    """
+
+    def __init__(self, get_response):
+        config = get_profiling_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config['SAMPLE_RATE']
+        self.header = 'HTTP_' + config['HEADER'].upper().replace('-', '_')
+        self.token = config['TOKEN']
+        self.output_dir = config['OUTPUT_DIR']
+        self.flush_seconds = config['FLUSH_SECONDS']
+        self._flushed_at = time.monotonic()
+
+    def _profiled(self, request):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        value = request.META.get(self.header)
+        # compare_digest rejects non-ASCII str, so compare the bytes
+        return bool(value and self.token and hmac.compare_digest(
+            value.encode(), self.token.encode()
+        ))
+
+    def __call__(self, request):
+        if not self._profiled(request):
+            return self.get_response(request)
+
+        profiler = get_profiler()
+        profiler.start(SamplingProfilerMiddleware.__call__.__code__)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.stop(time.perf_counter() - started)
+            self._maybe_flush(profiler)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profiler = _profiler
+        if profiler is not None and threading.get_ident() in profiler._active:
+            profiler.set_view(view_name(view_func, request.method))
+        return None
+
+    def _maybe_flush(self, profiler):
+        if not self.output_dir:
+            return
+        now = time.monotonic()
+        if now - self._flushed_at >= self.flush_seconds:
+            self._flushed_at = now
+            profiler.write_collapsed(self.output_dir)
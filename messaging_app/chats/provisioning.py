@@ -0,0 +1,271 @@
+# messaging_app/chats/provisioning.py
+
+"""
+Bulk user provisioning from CSV or NDJSON.
+
+Rows are processed in batches of ``BATCH_SIZE``. Each batch is:
+
+1. validated row by row (username and email required, email format,
+   duplicates within the input);
+2. checked against existing users with one ``username__in`` and one
+   ``email__in`` query;
+3. password-hashed, across a process pool when ``workers`` > 1 (PBKDF2
+   is CPU bound, so threads would not help). Workers are spawned, not
+   forked, and run ``django.setup()`` from ``DJANGO_SETTINGS_MODULE``
+   before their first task. The pool is meant for the provision_users
+   command; the HTTP endpoint hashes in the request's process;
+4. inserted with ``bulk_create``.
+
+A bad row is reported with its line number and skipped; it never aborts
+the batch. If an insert races with another writer the batch falls back
+to row-by-row inserts so only the conflicting rows fail.
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from .sharding import copy_rows, get_shard_aliases, is_sharded
+
+User = get_user_model()
+
+
+PROVISIONING_DEFAULTS = {
+    'BATCH_SIZE': 500,
+    'WORKERS': None,  # None: one per CPU
+}
+
+USER_FIELDS = ('username', 'email', 'password', 'first_name', 'last_name')
+
+
+def get_provisioning_settings():
+    """
+    Return the provisioning configuration merged over the defaults.
+    """
+    config = dict(PROVISIONING_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_PROVISIONING', {}))
+    return config
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line number, row dict or None, error or None) from a text stream
+    in 'csv' (with a header line) or 'ndjson' format.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'ndjson':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_num, None, 'Each line must be a JSON object'
+                continue
+            yield line_num, row, None
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def format_for_filename(filename, default='csv'):
+    """
+    Guess the input format from a file name.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if extension == '.csv':
+        return 'csv'
+    return default
+
+
+def _hash_password(password, hasher):
+    return make_password(password, hasher=hasher)
+
+
+class UserProvisioner:
+    """
+    Creates users in batches and collects per-row errors.
+
+        report = UserProvisioner().provision(read_rows(stream, 'csv'))
+    """
+
+    def __init__(self, batch_size=None, workers=None):
+        config = get_provisioning_settings()
+        self.batch_size = batch_size or config['BATCH_SIZE']
+        self.workers = workers or config['WORKERS'] or os.cpu_count() or 1
+        self.created = 0
+        self.errors = []
+        self._seen_usernames = set()
+        self._seen_emails = set()
+
+    def provision(self, rows):
+        """
+        Provision every row and return {'created': n, 'errors': [...]}.
+        """
+        pool = None
+        if self.workers > 1:
+            # Forking a process that runs threads (group commit, revocation
+            # refresh) can deadlock the child, so workers start fresh. They
+            # unpickle _hash_password by importing this module, which needs
+            # Django set up first.
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            )
+        try:
+            batch = []
+            for line_num, row, error in rows:
+                if error is not None:
+                    self._error(line_num, None, {'row': error})
+                    continue
+                batch.append((line_num, row))
+                if len(batch) >= self.batch_size:
+                    self._process(batch, pool)
+                    batch = []
+            if batch:
+                self._process(batch, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.errors.sort(key=lambda error: error['line'])
+        return {'created': self.created, 'errors': self.errors}
+
+    def _error(self, line_num, username, errors):
+        self.errors.append({'line': line_num, 'username': username, 'errors': errors})
+
+    def _clean(self, line_num, row):
+        values = {field: str(row.get(field) or '').strip() for field in USER_FIELDS}
+        values['password'] = str(row.get('password') or '')
+        errors = {}
+        if not values['username']:
+            errors['username'] = 'This field is required.'
+        elif len(values['username']) > User._meta.get_field('username').max_length:
+            errors['username'] = 'Too long.'
+        elif values['username'] in self._seen_usernames:
+            errors['username'] = 'Duplicate username in the input.'
+        if not values['email']:
+            errors['email'] = 'This field is required.'
+        else:
+            try:
+                validate_email(values['email'])
+            except ValidationError:
+                errors['email'] = 'Enter a valid email address.'
+            else:
+                values['email'] = User.objects.normalize_email(values['email'])
+                if values['email'] in self._seen_emails:
+                    errors['email'] = 'Duplicate email in the input.'
+        if errors:
+            self._error(line_num, values['username'] or None, errors)
+            return None
+        self._seen_usernames.add(values['username'])
+        self._seen_emails.add(values['email'])
+        return values
+
+    def _process(self, batch, pool):
+        cleaned = [
+            (line_num, values)
+            for line_num, values in ((n, self._clean(n, row)) for n, row in batch)
+            if values is not None
+        ]
+        if not cleaned:
+            return
+
+        # One query per field for the whole batch
+        taken_usernames = set(User.objects.filter(
+            username__in=[values['username'] for _, values in cleaned]
+        ).values_list('username', flat=True))
+        taken_emails = set(User.objects.filter(
+            email__in=[values['email'] for _, values in cleaned]
+        ).values_list('email', flat=True))
+
+        pending = []
+        for line_num, values in cleaned:
+            errors = {}
+            if values['username'] in taken_usernames:
+                errors['username'] = 'A user with that username already exists.'
+            if values['email'] in taken_emails:
+                errors['email'] = 'A user with that email already exists.'
+            if errors:
+                self._error(line_num, values['username'], errors)
+            else:
+                pending.append((line_num, values))
+        if not pending:
+            return
+
+        passwords = [values['password'] or None for _, values in pending]
+        to_hash = [password for password in passwords if password is not None]
+        # Spawned workers load the settings module afresh, so they are
+        # handed this process's hasher (settings overrides included)
+        hasher = get_hasher()
+        if pool is not None:
+            chunksize = max(1, len(to_hash) // (self.workers * 4))
+            hashes = iter(list(pool.map(
+                _hash_password, to_hash, [hasher] * len(to_hash), chunksize=chunksize
+            )))
+        else:
+            hashes = iter([_hash_password(password, hasher) for password in to_hash])
+
+        users = []
+        for (line_num, values), password in zip(pending, passwords):
+            users.append((line_num, User(
+                username=values['username'],
+                email=values['email'],
+                first_name=values['first_name'],
+                last_name=values['last_name'],
+                # Rows without a password get an unusable one
+                password=next(hashes) if password is not None else make_password(None),
+            )))
+
+        self._insert(users)
+
+    def _insert(self, users):
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                created = User.objects.bulk_create([user for _, user in users])
+                self._mirror(created)
+        except IntegrityError:
+            # Someone else created one of these users meanwhile
+            created = []
+            for line_num, user in users:
+                try:
+                    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                        user.save(force_insert=True)
+                except IntegrityError as e:
+                    self._error(line_num, user.username, {'row': str(e)})
+                else:
+                    created.append(user)
+        self.created += len(created)
+
+    def _mirror(self, users):
+        # bulk_create sends no post_save, so mirror to the shards here
+        if not is_sharded():
+            return
+        for alias in get_shard_aliases():
+            if alias != DEFAULT_DB_ALIAS:
+                copy_rows(User, users, alias)
+
+
+def provision_from_text(data, fmt, **options):
+    """
+    Provision users from an in-memory CSV or NDJSON document.
+    """
+    return UserProvisioner(**options).provision(read_rows(io.StringIO(data), fmt))
@@ -0,0 +1,205 @@
+# messaging_app/chats/retention.py
+
+"""
+Retention purge engine.
+
+Deleting an old conversation in one statement cascades to all of its
+messages inside a single transaction, which holds SQLite's write lock for
+as long as the delete takes. The engine instead deletes expired messages
+in chunks of ``CHUNK_SIZE`` rows, oldest first along the sent_at indexes,
+commits each chunk on its own and sleeps ``PAUSE_MS`` between chunks so
+API writes queue behind at most one short chunk.
+
+- Conversation policies override the global one (see RetentionPolicy).
+- Every chunk appends one ``purged`` change event per affected
+  conversation with the deleted message ids, instead of one event per
+  message.
+- Progress is stored in a RetentionRun after every chunk. Cutoffs are
+  computed from the run's ``as_of``, so resuming an interrupted run
+  continues with exactly the rows it was deleting.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .fragments import get_fragment_cache
+from .models import ChangeEvent, Conversation, Message, RetentionPolicy, RetentionRun
+from .outbox import get_outbox_settings
+from .sharding import get_shard_aliases
+
+
+RETENTION_DEFAULTS = {
+    'CHUNK_SIZE': 500,
+    'PAUSE_MS': 50,
+}
+
+
+def get_retention_settings():
+    """
+    Return the retention configuration merged over the defaults.
+    """
+    config = dict(RETENTION_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_RETENTION', {}))
+    return config
+
+
+class RetentionEngine:
+    """
+    Applies the retention policies chunk by chunk.
+
+    ``progress`` is called after every chunk with a dict holding the
+    shard alias, the rows deleted so far and the throughput in rows/sec.
+    """
+
+    def __init__(self, chunk_size=None, pause_ms=None, progress=None, dry_run=False):
+        config = get_retention_settings()
+        self.chunk_size = chunk_size or config['CHUNK_SIZE']
+        self.pause = (config['PAUSE_MS'] if pause_ms is None else pause_ms) / 1000
+        self.progress = progress
+        self.dry_run = dry_run
+
+    def run(self, resume=False):
+        """
+        Purge every shard. With ``resume`` the latest unfinished run is
+        continued instead of starting a new one. Returns the RetentionRun
+        (unsaved when dry_run is set).
+        """
+        run = None
+        if resume:
+            run = RetentionRun.objects.filter(status='running').first()
+        if run is None:
+            run = RetentionRun(as_of=timezone.now())
+            if not self.dry_run:
+                run.save()
+
+        self._started = time.monotonic()
+        self._deleted_at_start = run.messages_deleted
+        global_policy = RetentionPolicy.objects.using(DEFAULT_DB_ALIAS).filter(
+            conversation__isnull=True
+        ).order_by('max_age_days').first()
+
+        for alias in get_shard_aliases():
+            self._purge_shard(run, alias, global_policy)
+
+        if not self.dry_run:
+            run.status = 'finished'
+            run.finished_at = timezone.now()
+            run.save()
+        return run
+
+    def _purge_shard(self, run, alias, global_policy):
+        policies = RetentionPolicy.objects.using(alias).filter(conversation__isnull=False)
+        for policy in policies.iterator():
+            cutoff = run.as_of - timedelta(days=policy.max_age_days)
+            self._purge_messages(run, alias, Message.objects.using(alias).filter(
+                conversation_id=policy.conversation_id,
+                sent_at__lt=cutoff
+            ))
+            if policy.delete_empty_conversations:
+                self._purge_conversations(run, alias, Conversation.objects.using(alias).filter(
+                    pk=policy.conversation_id
+                ), cutoff)
+
+        if global_policy is None:
+            return
+        cutoff = run.as_of - timedelta(days=global_policy.max_age_days)
+        with_own_policy = RetentionPolicy.objects.using(alias).filter(
+            conversation__isnull=False
+        ).values('conversation_id')
+        self._purge_messages(run, alias, Message.objects.using(alias).filter(
+            sent_at__lt=cutoff
+        ).exclude(conversation_id__in=with_own_policy))
+        if global_policy.delete_empty_conversations:
+            self._purge_conversations(run, alias, Conversation.objects.using(alias).exclude(
+                pk__in=with_own_policy
+            ), cutoff)
+
+    def _purge_messages(self, run, alias, messages):
+        # Oldest first, along the sent_at indexes
+        chunks = messages.order_by('sent_at').values_list('message_id', 'conversation_id')
+        while True:
+            rows = list(chunks[:self.chunk_size])
+            if not rows or self.dry_run:
+                if rows:
+                    run.messages_deleted += messages.count()
+                    self._report(run, alias)
+                return
+            with transaction.atomic(using=alias):
+                deleted = self._delete_rows(alias, Message, [pk for pk, _ in rows])
+                self._log_purge(alias, rows, run.as_of)
+            # The run lives on default: record it once the shard has committed
+            run.messages_deleted += deleted
+            self._save_progress(run)
+            cache = get_fragment_cache()
+            if cache is not None:
+                for message_id, _ in rows:
+                    cache.invalidate_message(message_id)
+            self._report(run, alias)
+            time.sleep(self.pause)
+
+    def _purge_conversations(self, run, alias, conversations, cutoff):
+        empty = conversations.filter(created_at__lt=cutoff, messages__isnull=True)
+        while True:
+            batch = list(empty.order_by('created_at')[:self.chunk_size])
+            if not batch or self.dry_run:
+                return
+            with transaction.atomic(using=alias):
+                # No messages are left, so each cascade is small
+                for conversation in batch:
+                    conversation.delete()
+            run.conversations_deleted += len(batch)
+            self._save_progress(run)
+            self._report(run, alias)
+            time.sleep(self.pause)
+
+    def _delete_rows(self, alias, model, pks):
+        # Plain DELETE by primary key: no per-row signals or collector
+        connection = connections[alias]
+        table = connection.ops.quote_name(model._meta.db_table)
+        column = connection.ops.quote_name(model._meta.pk.column)
+        placeholders = ', '.join(['%s'] * len(pks))
+        params = [model._meta.pk.get_db_prep_value(pk, connection) for pk in pks]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', params)
+            return cursor.rowcount
+
+    def _log_purge(self, alias, rows, as_of):
+        if not get_outbox_settings()['ENABLED']:
+            return
+        by_conversation = {}
+        for message_id, conversation_id in rows:
+            by_conversation.setdefault(conversation_id, []).append(str(message_id))
+        ChangeEvent.objects.using(alias).bulk_create([
+            ChangeEvent(
+                entity='conversation',
+                action='purged',
+                object_id=conversation_id,
+                conversation_id=conversation_id,
+                payload={'message_ids': message_ids, 'as_of': as_of},
+            )
+            for conversation_id, message_ids in by_conversation.items()
+        ])
+
+    def _save_progress(self, run):
+        RetentionRun.objects.filter(pk=run.pk).update(
+            messages_deleted=run.messages_deleted,
+            conversations_deleted=run.conversations_deleted,
+            updated_at=timezone.now()
+        )
+
+    def _report(self, run, alias):
+        if self.progress is None:
+            return
+        elapsed = time.monotonic() - self._started
+        deleted = run.messages_deleted - self._deleted_at_start
+        self.progress({
+            'shard': alias,
+            'messages_deleted': run.messages_deleted,
+            'conversations_deleted': run.conversations_deleted,
+            'elapsed': elapsed,
+            'rows_per_sec': deleted / elapsed if elapsed else 0.0,
+        })
@@ -0,0 +1,231 @@
+# messaging_app/chats/revocation.py
+
+"""
+JWT revocation with an in-memory hot path.
+
+Revoked token ids (jti) are stored durably in RevokedToken. Each process
+mirrors them into a bloom filter plus a small exact set:
+
+- A token whose jti is not in the bloom filter is not revoked; this is
+  the answer for almost every request and costs a few hash lookups.
+- The exact set holds the jtis added since the filter was last rebuilt
+  (including the ones revoked by this process, effective immediately).
+- A bloom hit outside the exact set is confirmed against the database,
+  so false positives (about ``ERROR_RATE`` of the valid tokens) never
+  reject a valid token.
+
+Every ``REFRESH_SECONDS`` a process pulls the revocations recorded since
+its last refresh (one indexed query), so a token revoked by another
+worker is rejected everywhere within that interval. Every
+``REBUILD_SECONDS`` the filter is rebuilt from the unexpired rows only,
+which keeps it small and drops the exact set.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import RevokedToken
+
+
+REVOCATION_DEFAULTS = {
+    'REFRESH_SECONDS': 5,
+    'REBUILD_SECONDS': 300,
+    'CAPACITY': 100000,
+    'ERROR_RATE': 0.001,
+}
+
+
+def get_revocation_settings():
+    """
+    Return the revocation configuration merged over the defaults.
+    """
+    config = dict(REVOCATION_DEFAULTS)
+    config.update(getattr(settings, 'CHATS_REVOCATION', {}))
+    return config
+
+
+class BloomFilter:
+    """
+    Fixed-size bloom filter over strings (double hashing on blake2b).
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.capacity = capacity
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class RevocationList:
+    """
+    Per-process view of the revoked jtis (see the module docstring).
+    """
+
+    def __init__(self, refresh_seconds, rebuild_seconds, capacity, error_rate):
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._recent = set()
+        self._false_positives = set()
+        self._last_id = 0
+        self._refreshed_at = 0
+        self._rebuilt_at = 0
+        self.stats = {'checks': 0, 'bloom_hits': 0, 'db_checks': 0, 'refreshes': 0, 'rebuilds': 0}
+
+    def is_revoked(self, jti):
+        self._maybe_refresh()
+        self.stats['checks'] += 1
+        if jti in self._recent:
+            return True
+        if jti not in self._bloom:
+            return False
+        # Either revoked before the last rebuild or a false positive
+        self.stats['bloom_hits'] += 1
+        if jti in self._false_positives:
+            return False
+        self.stats['db_checks'] += 1
+        revoked = RevokedToken.objects.filter(jti=jti).exists()
+        if not revoked and len(self._false_positives) < 10000:
+            # Later revocations of this jti land in _recent, checked first
+            self._false_positives.add(jti)
+        return revoked
+
+    def add(self, jti):
+        """
+        Make a revocation effective in this process right away.
+        """
+        with self._lock:
+            self._recent.add(jti)
+
+    def invalidate(self):
+        """
+        Rebuild the filter from the database now. Readers keep using the
+        old filter until the new one is swapped in.
+        """
+        with self._lock:
+            self._rebuild(time.monotonic())
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self._bloom is not None and now - self._refreshed_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if self._bloom is None or now - self._rebuilt_at >= self.rebuild_seconds:
+                self._rebuild(now)
+            elif now - self._refreshed_at >= self.refresh_seconds:
+                self._pull(now)
+
+    def _rebuild(self, now):
+        # Caller holds the lock
+        rows = RevokedToken.objects.filter(
+            expires_at__gt=timezone.now()
+        ).values_list('id', 'jti')
+        last_id = self._last_id
+        jtis = []
+        for row_id, jti in rows.iterator():
+            jtis.append(jti)
+            last_id = max(last_id, row_id)
+        bloom = BloomFilter(max(self.capacity, len(jtis) * 2), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        # Readers check _recent, _bloom, then _false_positives without the
+        # lock: clear the false positives before swapping in the filter they
+        # were recorded against, and drop _recent only once it is folded in
+        self._false_positives = set()
+        self._bloom = bloom
+        self._recent = set()
+        self._last_id = last_id
+        self._refreshed_at = self._rebuilt_at = now
+        self.stats['rebuilds'] += 1
+
+    def _pull(self, now):
+        # Caller holds the lock
+        rows = RevokedToken.objects.filter(id__gt=self._last_id).values_list('id', 'jti')
+        for row_id, jti in rows:
+            self._recent.add(jti)
+            self._last_id = max(self._last_id, row_id)
+        self._refreshed_at = now
+        self.stats['refreshes'] += 1
+        if len(self._recent) > self._bloom.capacity // 10:
+            # Keep the exact set small: fold it into a fresh filter
+            self._rebuild(now)
+
+
+_revocations = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocation_list():
+    """
+    Return the process-wide revocation list.
+    """
+    global _revocations
+    with _revocations_lock:
+        if _revocations is None:
+            config = get_revocation_settings()
+            _revocations = RevocationList(
+                config['REFRESH_SECONDS'],
+                config['REBUILD_SECONDS'],
+                config['CAPACITY'],
+                config['ERROR_RATE']
+            )
+        return _revocations
+
+
+def is_revoked(token):
+    """
+    Return True if a validated token (access or refresh) has been revoked.
+    """
+    jti = token.get(jwt_settings.JTI_CLAIM)
+    return jti is not None and get_revocation_list().is_revoked(jti)
+
+
+def revoke_token(token):
+    """
+    Durably revoke a validated token. Revoking twice is harmless.
+    """
+    jti = token[jwt_settings.JTI_CLAIM]
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    RevokedToken.objects.get_or_create(jti=jti, defaults={
+        'token_type': token.get(jwt_settings.TOKEN_TYPE_CLAIM, ''),
+        'user_id': int(user_id) if user_id is not None else None,
+        'expires_at': datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc),
+    })
+    get_revocation_list().add(jti)
+
+
+def prune_expired_revocations():
+    """
+    Delete revocations of tokens that have expired anyway.
+    Returns the number of deleted rows.
+    """
+    return RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()[0]
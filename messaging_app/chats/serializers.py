@@ -1,13 +1,20 @@
 # messaging_app/chats/serializers.py
 
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from .fragments import fragment_key, get_fragment_cache
+from .metrics import TimedSerializerMixin
 from .models import Conversation, Message
+from .revocation import is_revoked, revoke_token
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for User model (basic info).
     """
@@ -17,7 +24,36 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class CachedMessageListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    Renders message lists from the fragment cache: one get_many for the
+    whole page, the misses are rendered and stored with one set_many.
+    """
+    
+    def to_representation(self, data):
+        cache = get_fragment_cache()
+        if cache is None:
+            return super().to_representation(data)
+        
+        messages = list(data.all() if hasattr(data, 'all') else data)
+        sender_fields = UserSerializer.Meta.fields
+        keys = [fragment_key(message, sender_fields) for message in messages]
+        fragments = cache.get_many(keys)
+        
+        missing = {
+            key: self.child.to_representation(message)
+            for key, message in zip(keys, messages)
+            if key not in fragments
+        }
+        if missing:
+            cache.set_many(missing)
+            fragments.update(missing)
+        
+        # Shallow copies: callers may add keys to their own list items
+        return [dict(fragments[key]) for key in keys]
+
+
+class MessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Message model.
     """
@@ -26,6 +62,7 @@ class MessageSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Message
+        list_serializer_class = CachedMessageListSerializer
         fields = [
             'message_id',
             'conversation',
@@ -54,7 +91,7 @@ class MessageSerializer(serializers.ModelSerializer):
         return data
 
 
-class ConversationSerializer(serializers.ModelSerializer):
+class ConversationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Conversation model.
     """
@@ -89,15 +126,20 @@ class ConversationSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """
         Create a new conversation with participants.
+        If a conversation with exactly the same participants already
+        exists, it is returned instead of creating a duplicate, and
+        self.created is False.
         """
         participant_ids = validated_data.pop('participant_ids', [])
-        conversation = Conversation.objects.create()
+        creator = validated_data.pop('creator', None)
         
-        # Add participants
-        if participant_ids:
-            users = User.objects.filter(id__in=participant_ids)
-            conversation.participants.set(users)
+        user_ids = set(
+            User.objects.filter(id__in=participant_ids).values_list('id', flat=True)
+        )
+        if creator is not None:
+            user_ids.add(creator.pk)
         
+        conversation, self.created = Conversation.objects.find_or_create(user_ids)
         return conversation
     
     def update(self, instance, validated_data):
@@ -108,7 +150,31 @@ class ConversationSerializer(serializers.ModelSerializer):
         
         if participant_ids is not None:
             users = User.objects.filter(id__in=participant_ids)
-            instance.participants.set(users)
+            try:
+                with transaction.atomic(using=instance._state.db):
+                    instance.participants.set(users)
+            except IntegrityError:
+                raise serializers.ValidationError({
+                    'participant_ids': 'A conversation with these participants already exists.'
+                })
         
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh that rejects revoked refresh tokens and, when refresh
+    tokens rotate, revokes the one that was just used.
+    """
+    
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_revoked(refresh):
+            raise InvalidToken('Token has been revoked')
+        
+        data = super().validate(attrs)
+        
+        if jwt_settings.ROTATE_REFRESH_TOKENS and jwt_settings.BLACKLIST_AFTER_ROTATION:
+            revoke_token(refresh)
+        return data
@@ -0,0 +1,315 @@
+# messaging_app/chats/sharding.py
+
+"""
+Conversation-based sharding across several database aliases.
+
+Every conversation lives on exactly one shard, chosen by rendezvous
+hashing of its conversation_id over ``settings.CHATS_SHARDS``. Its
+participant rows and its messages live on the same shard, so every
+per-conversation query is a single-shard query. Adding a shard only
+moves about 1/N of the conversations (see the rebalance_shards command).
+
+Users stay managed on the default database. Every save/delete of a user
+on the default database is mirrored to the other shards so foreign keys
+from messages and participant rows resolve locally.
+
+Routing rules:
+- Writes and reads with an instance hint are routed by the instance's
+  conversation_id (Conversation, Message and the participants table).
+- ShardedQuerySet routes filter()/get()/create() calls that name a
+  single conversation (``conversation=...``, ``conversation_id=...``,
+  ``pk=...`` on Conversation) to that conversation's shard.
+- Cross-conversation queries must be run on every shard and merged
+  with ShardedResults (scatter-gather).
+
+Reverse participant changes (``user.conversations.add(...)``) carry no
+conversation hint and are not routed; use ``conversation.participants``.
+"""
+
+import functools
+import hashlib
+import heapq
+import uuid
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, router
+
+
+# Lookups that pin a query on a chats model to a single conversation
+SHARD_KEY_LOOKUPS = {
+    'conversation',
+    'conversation_id',
+    'conversation__pk',
+    'conversation__conversation_id',
+}
+
+# Apps whose models may relate across shards (users are mirrored)
+SHARED_APP_LABELS = {'chats', 'auth', 'contenttypes'}
+
+
+def get_shard_aliases():
+    """
+    Return the database aliases conversations are spread across.
+    """
+    return list(getattr(settings, 'CHATS_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def is_sharded():
+    """
+    Return True when conversations are spread across more than one database.
+    """
+    return len(get_shard_aliases()) > 1
+
+
+def shard_for_conversation(conversation_id, aliases=None):
+    """
+    Return the alias of the shard holding a conversation.
+
+    Rendezvous (highest random weight) hashing: each alias scores the
+    conversation_id and the highest score wins, so adding or removing a
+    shard only moves the conversations that score highest on it.
+    """
+    aliases = aliases or get_shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+
+    key = str(uuid.UUID(str(conversation_id)))
+    return max(
+        aliases,
+        key=lambda alias: hashlib.blake2b(f'{alias}:{key}'.encode(), digest_size=8).digest()
+    )
+
+
+def group_by_shard(conversation_ids):
+    """
+    Split conversation ids into {alias: [conversation_id, ...]}.
+    """
+    groups = {}
+    for conversation_id in conversation_ids:
+        groups.setdefault(shard_for_conversation(conversation_id), []).append(conversation_id)
+    return groups
+
+
+def _shard_key(value):
+    """
+    Return the conversation id referenced by a lookup value, if any.
+    """
+    if isinstance(value, models.Model):
+        return value.pk
+    if isinstance(value, (uuid.UUID, str)):
+        return value
+    return None
+
+
+class ConversationShardRouter:
+    """
+    Database router sending conversation data to its shard.
+    """
+
+    def _shard_for_hints(self, model, hints):
+        if model._meta.app_label != 'chats':
+            return None
+        instance = hints.get('instance')
+        conversation_id = getattr(instance, 'conversation_id', None)
+        if conversation_id is None:
+            return None
+        return shard_for_conversation(conversation_id)
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for_hints(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for_hints(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if (obj1._meta.app_label in SHARED_APP_LABELS
+                and obj2._meta.app_label in SHARED_APP_LABELS):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every shard carries the chats schema plus a mirror of the users
+        if db != DEFAULT_DB_ALIAS and db in get_shard_aliases():
+            return app_label in SHARED_APP_LABELS
+        return None
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet that routes single-conversation queries to their shard.
+    """
+
+    def _shard_lookups(self):
+        lookups = set(SHARD_KEY_LOOKUPS)
+        if self.model._meta.pk.name == 'conversation_id':
+            lookups.add('pk')
+        return lookups
+
+    def _routed(self, kwargs):
+        if self._db is not None or not is_sharded():
+            return self
+        for lookup in self._shard_lookups().intersection(kwargs):
+            conversation_id = _shard_key(kwargs[lookup])
+            if conversation_id is not None:
+                try:
+                    return self.using(shard_for_conversation(conversation_id))
+                except ValueError:
+                    # Malformed id: let the query itself report it
+                    return self
+        return self
+
+    def filter(self, *args, **kwargs):
+        # get() goes through filter(), so it is routed as well
+        return super(ShardedQuerySet, self._routed(kwargs)).filter(*args, **kwargs)
+
+    def create(self, **kwargs):
+        if self._db is not None or not is_sharded():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=router.db_for_write(self.model, instance=obj))
+        return obj
+
+
+ShardedManager = models.Manager.from_queryset(ShardedQuerySet)
+
+
+def _order_spec(queryset):
+    """
+    Return [(attribute path, descending), ...] for a queryset's ordering.
+    """
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    spec = []
+    for field in ordering:
+        if not isinstance(field, str) or field == '?':
+            return []
+        descending = field.startswith('-')
+        name = field.lstrip('-+')
+        if name == 'pk':
+            name = queryset.model._meta.pk.attname
+        spec.append((name.split('__'), descending))
+    return spec
+
+
+def _resolve(obj, path):
+    for attr in path:
+        obj = getattr(obj, attr, None)
+    return obj
+
+
+def _comparator(spec):
+    def compare(a, b):
+        for path, descending in spec:
+            left, right = _resolve(a, path), _resolve(b, path)
+            if left == right:
+                continue
+            # None sorts first, like SQLite does in ascending order
+            if left is None or (right is not None and left < right):
+                result = -1
+            else:
+                result = 1
+            return -result if descending else result
+        return 0
+    return functools.cmp_to_key(compare)
+
+
+class ShardedResults:
+    """
+    Read-only sequence over the same query run on every shard, merged in
+    the queries' ordering (scatter-gather).
+
+    Supports count(), len(), slicing and iteration, which is what Django's
+    Paginator and DRF serializers need. A slice [start:stop] fetches at
+    most ``stop`` rows from each shard.
+    """
+    ordered = True
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self._key = _comparator(_order_spec(self.querysets[0])) if self.querysets else None
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(queryset.count() for queryset in self.querysets)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return heapq.merge(
+            *(queryset.iterator() for queryset in self.querysets),
+            key=self._key
+        )
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step not in (None, 1):
+                raise ValueError('ShardedResults does not support slice steps')
+            start = item.start or 0
+            stop = item.stop if item.stop is not None else self.count()
+            if stop <= start:
+                return []
+            merged = heapq.merge(
+                *(list(queryset[:stop]) for queryset in self.querysets),
+                key=self._key
+            )
+            return [obj for index, obj in enumerate(merged) if start <= index < stop]
+
+        results = self[item:item + 1]
+        if not results:
+            raise IndexError('ShardedResults index out of range')
+        return results[0]
+
+
+def scatter(build_queryset):
+    """
+    Run ``build_queryset(alias)`` on every shard.
+    Returns the single queryset when sharding is off, ShardedResults otherwise.
+    """
+    aliases = get_shard_aliases()
+    if len(aliases) == 1:
+        return build_queryset(aliases[0])
+    return ShardedResults(build_queryset(alias) for alias in aliases)
+
+
+def mirror_user(user, aliases=None):
+    """
+    Copy a user row from the default database onto the other shards.
+    """
+    model = type(user)
+    values = {
+        field.attname: getattr(user, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    }
+    for alias in aliases or get_shard_aliases():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        manager = model._base_manager.db_manager(alias)
+        if not manager.filter(pk=user.pk).update(**values):
+            copy_rows(model, [user], alias)
+
+
+def copy_rows(model, objects, using):
+    """
+    Insert model instances on another database as-is: primary keys and
+    auto_now/auto_now_add timestamps are kept, and no signals fire.
+    """
+    objects = list(objects)
+    if not objects:
+        return
+    connection = connections[using]
+    fields = model._meta.concrete_fields
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = (
+        f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} '
+        f'({columns}) VALUES ({placeholders})'
+    )
+    rows = [
+        [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+        for obj in objects
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
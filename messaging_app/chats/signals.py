@@ -0,0 +1,146 @@
+# messaging_app/chats/signals.py
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .fragments import get_fragment_cache
+from .models import Conversation, Message
+from .outbox import record_event
+from .presence import forget_memberships
+from .sharding import get_shard_aliases, is_sharded, mirror_user
+
+User = get_user_model()
+
+
+def refresh_participant_keys(conversation_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Recompute participant_key for the given conversations.
+    """
+    for conversation in Conversation.objects.using(using).filter(pk__in=list(conversation_ids)):
+        conversation.refresh_participant_key()
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_participant_key(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """
+    Keep Conversation.participant_key in sync with participant changes made
+    from either side of the relation (conversation.participants or
+    user.conversations), and drop the presence memberships a removal
+    invalidates.
+    """
+    if reverse:
+        # instance is a User and pk_set holds conversation ids
+        if action == 'pre_clear':
+            instance._cleared_conversation_ids = list(
+                instance.conversations.using(using).values_list('pk', flat=True)
+            )
+        elif action in ('post_add', 'post_remove'):
+            refresh_participant_keys(pk_set, using)
+        elif action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_conversation_ids', [])
+            refresh_participant_keys(pk_set, using)
+        if action in ('post_remove', 'post_clear'):
+            for conversation_id in pk_set:
+                forget_memberships(conversation_id, [instance.pk])
+        return
+
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        instance.refresh_participant_key()
+    if action in ('post_remove', 'post_clear'):
+        # pk_set is None on clear: every participant left
+        forget_memberships(instance.pk, pk_set)
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_conversations(sender, instance, using, **kwargs):
+    """
+    Deleting a user cascades to the participant rows without firing
+    m2m_changed, so remember the affected conversations.
+    """
+    instance._deleted_conversation_ids = list(
+        instance.conversations.using(using).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def refresh_keys_after_user_delete(sender, instance, using, **kwargs):
+    """
+    Refresh participant keys of the conversations the deleted user was in.
+    A conversation whose remaining participants now match another
+    conversation loses its key instead of blocking the delete.
+    """
+    conversation_ids = getattr(instance, '_deleted_conversation_ids', [])
+    for conversation in Conversation.objects.using(using).filter(pk__in=conversation_ids):
+        try:
+            with transaction.atomic(using=using):
+                conversation.refresh_participant_key()
+        except IntegrityError:
+            Conversation.objects.using(using).filter(pk=conversation.pk).update(
+                participant_key=None
+            )
+
+
+@receiver(post_save, sender=User)
+def mirror_saved_user(sender, instance, using, raw=False, **kwargs):
+    """
+    Mirror users saved on the default database onto the other shards.
+    """
+    if raw or using != DEFAULT_DB_ALIAS or not is_sharded():
+        return
+    mirror_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def mirror_deleted_user(sender, instance, using, **kwargs):
+    """
+    Delete the shard copies of a user deleted from the default database.
+    Each shard cascades to the user's messages and participant rows.
+    """
+    if using != DEFAULT_DB_ALIAS or not is_sharded():
+        return
+    for alias in get_shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            User.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_save, sender=Message)
+def log_saved_change(sender, instance, created, using, raw=False, **kwargs):
+    """
+    Append a change event in the transaction that saved the row.
+    """
+    if raw:
+        return
+    record_event(instance, 'created' if created else 'updated', using)
+
+
+@receiver(post_delete, sender=Conversation)
+@receiver(post_delete, sender=Message)
+def log_deleted_change(sender, instance, using, **kwargs):
+    """
+    Append a change event in the transaction that deleted the row.
+    """
+    record_event(instance, 'deleted', using)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def drop_message_fragment(sender, instance, **kwargs):
+    """
+    Free the cached fragment of an edited or deleted message.
+    """
+    cache = get_fragment_cache()
+    if cache is not None:
+        cache.invalidate_message(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_sender_fragments(sender, instance, **kwargs):
+    """
+    Free the cached fragments embedding a changed or deleted user.
+    """
+    cache = get_fragment_cache()
+    if cache is not None:
+        cache.invalidate_sender(instance.pk)
@@ -1,3 +1,1356 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection, connections, models, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import metrics, presence, profiling, revocation
+from .batching import GroupCommitBatcher
+from .fragments import FragmentCache, fragment_key, get_fragment_cache
+from .models import (
+    ChangeEvent,
+    Conversation,
+    Message,
+    RetentionPolicy,
+    RetentionRun,
+    RevokedToken,
+    conversation_id_for_key,
+    participant_key_for,
+)
+from .outbox import EventConsumer, compact_events, prune_events
+from .presence import CachePresenceBackend, LocalPresenceBackend
+from .provisioning import provision_from_text
+from .retention import RetentionEngine
+from .revocation import BloomFilter
+from .serializers import ConversationSerializer
+from .sharding import (
+    ShardedResults,
+    get_shard_aliases,
+    is_sharded,
+    scatter,
+    shard_for_conversation,
+)
+
+User = get_user_model()
+
+
+class AllShardsMixin:
+    """
+    Lets a test case use every shard: saving a user mirrors it onto all of them.
+    """
+    databases = '__all__'
+
+
+def on_every_shard(model, **filters):
+    """
+    Rows of ``model`` matching ``filters`` across all shards.
+    """
+    return scatter(lambda alias: model.objects.using(alias).filter(**filters))
+
+
+@contextmanager
+def capture_shard_queries():
+    """
+    Capture the queries run on every shard; yields the list of contexts.
+    """
+    with ExitStack() as stack:
+        yield [
+            stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in get_shard_aliases()
+        ]
+
+
+class GroupCommitBatcherTests(AllShardsMixin, TransactionTestCase):
+    """
+    Tests for coalescing message inserts into shared transactions.
+    """
+
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.sender)
+        self.batcher = GroupCommitBatcher(
+            using=self.conversation._state.db, window_ms=50, max_batch=64
+        )
+
+    def tearDown(self):
+        self.batcher.stop()
+
+    def insert(self, body):
+        return Message.objects.create(
+            conversation=self.conversation,
+            sender=self.sender,
+            message_body=body
+        )
+
+    def test_concurrent_writes_share_a_commit(self):
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda i=i: results.append(self.batcher.submit(lambda: self.insert(str(i))))
+            )
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), 8)
+        self.assertLess(self.batcher.stats['batches'], 8)
+
+    def test_failed_write_does_not_abort_batch(self):
+        errors = []
+
+        def failing():
+            self.insert('rolled back')
+            raise ValueError('boom')
+
+        def submit_failing():
+            try:
+                self.batcher.submit(failing)
+            except ValueError as exc:
+                errors.append(exc)
+
+        thread = threading.Thread(target=submit_failing)
+        thread.start()
+        message = self.batcher.submit(lambda: self.insert('kept'))
+        thread.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(
+            list(Message.objects.filter(conversation=self.conversation).values_list(
+                'message_body', flat=True
+            )),
+            [message.message_body]
+        )
+
+    def test_connection_error_fails_the_batch_and_flusher_recovers(self):
+        # Connections are per thread: patch the flusher's through its class
+        with mock.patch.object(
+            type(connections[self.batcher.using]), 'close_if_unusable_or_obsolete',
+            side_effect=RuntimeError('gone')
+        ):
+            with self.assertRaisesMessage(RuntimeError, 'gone'):
+                self.batcher.submit(lambda: self.insert('lost'))
+        self.assertEqual(self.batcher.stats['failed_commits'], 1)
+
+        message = self.batcher.submit(lambda: self.insert('after'))
+        self.assertEqual(message.message_body, 'after')
+        self.assertEqual(
+            list(Message.objects.filter(conversation=self.conversation).values_list(
+                'message_body', flat=True
+            )),
+            ['after']
+        )
+
+    def test_base_exception_does_not_stop_the_flusher(self):
+        def exiting():
+            raise SystemExit('write gave up')
+
+        with self.assertRaises(SystemExit):
+            self.batcher.submit(exiting)
+        self.assertEqual(self.batcher.submit(lambda: self.insert('next')).message_body, 'next')
+
+
+class ParticipantKeyTests(AllShardsMixin, TestCase):
+    """
+    Tests for the participant-set key and the find_or_create endpoint.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.carol = User.objects.create_user(username='carol')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.url = '/api/chats/conversations/find_or_create/'
+
+    def test_find_or_create_reuses_conversation(self):
+        response = self.client.post(self.url, {'participant_ids': [self.bob.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.client.force_authenticate(self.bob)
+        again = self.client.post(self.url, {'participant_ids': [self.alice.id]}, format='json')
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data['conversation_id'], response.data['conversation_id'])
+        self.assertEqual(on_every_shard(Conversation).count(), 1)
+
+    def test_create_returns_200_for_an_existing_conversation(self):
+        url = '/api/chats/conversations/'
+        response = self.client.post(url, {'participant_ids': [self.bob.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        again = self.client.post(url, {'participant_ids': [self.bob.id]}, format='json')
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data['conversation_id'], response.data['conversation_id'])
+        self.assertEqual(on_every_shard(Conversation).count(), 1)
+
+    def test_new_conversation_lives_on_its_key_shard(self):
+        conversation, created = Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        self.assertTrue(created)
+        key = participant_key_for([self.alice.id, self.bob.id])
+        self.assertEqual(conversation.pk, conversation_id_for_key(key))
+        self.assertEqual(conversation._state.db, shard_for_conversation(conversation.pk))
+
+    def test_find_or_create_unknown_user(self):
+        response = self.client.post(self.url, {'participant_ids': [9999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_key_follows_participant_changes(self):
+        conversation, _ = Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        if is_sharded():
+            # Reverse adds are not routed to the conversation's shard
+            conversation.participants.add(self.carol)
+        else:
+            self.carol.conversations.add(conversation)
+        conversation.refresh_from_db()
+        self.assertEqual(
+            conversation.participant_key,
+            participant_key_for([self.alice.id, self.bob.id, self.carol.id])
+        )
+
+        conversation.participants.remove(self.carol)
+        conversation.refresh_from_db()
+        self.assertEqual(
+            conversation.participant_key,
+            participant_key_for([self.alice.id, self.bob.id])
+        )
+
+    def test_participant_change_cannot_duplicate_conversation(self):
+        Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        group, _ = Conversation.objects.find_or_create(
+            [self.alice.id, self.bob.id, self.carol.id]
+        )
+
+        response = self.client.post(
+            f'/api/chats/conversations/{group.pk}/remove_participant/',
+            {'user_id': self.carol.id},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn(self.carol, group.participants.all())
+
+
+class BulkParticipantTests(AllShardsMixin, TestCase):
+    """
+    Tests for the bulk add/remove participant actions.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner')
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(5)]
+        self.conversation, _ = Conversation.objects.find_or_create([self.owner.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.base = f'/api/chats/conversations/{self.conversation.pk}'
+
+    def test_bulk_add_reports_per_item_outcomes(self):
+        self.conversation.participants.add(self.users[0])
+
+        with capture_shard_queries() as queries:
+            response = self.client.post(f'{self.base}/add_participants/', {
+                'user_ids': [self.users[0].id, self.users[1].id, 9999, 'x'],
+                'usernames': ['user2', 'user3', 'ghost'],
+            }, format='json')
+
+        # Plus the participant_key check on every other shard
+        self.assertEqual(sum(map(len, queries)), 10 + len(get_shard_aliases()) - 1)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['added'], 3)
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['already_participant', 'added', 'not_found', 'invalid',
+             'added', 'added', 'not_found']
+        )
+        self.conversation.refresh_from_db()
+        self.assertEqual(
+            self.conversation.participant_key,
+            participant_key_for([self.owner.id] + [user.id for user in self.users[:4]])
+        )
+
+    def test_bulk_remove(self):
+        self.conversation.participants.add(*self.users[:3])
+
+        response = self.client.post(f'{self.base}/remove_participants/', {
+            'user_ids': [self.users[0].id],
+            'usernames': ['user1', 'user4'],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['removed'], 2)
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['removed', 'removed', 'not_participant']
+        )
+        self.assertEqual(
+            set(self.conversation.participants.all()),
+            {self.owner, self.users[2]}
+        )
+
+
+class ConversationPreviewTests(AllShardsMixin, TestCase):
+    """
+    Tests for the batched conversation previews action.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.mine = []
+        for other in range(3):
+            user = User.objects.create_user(username=f'other{other}')
+            conversation, _ = Conversation.objects.find_or_create([self.alice.id, user.id])
+            for i in range(5):
+                Message.objects.create(
+                    conversation=conversation, sender=self.alice, message_body=f'{other}-{i}'
+                )
+            self.mine.append(conversation)
+        self.foreign, _ = Conversation.objects.find_or_create([self.bob.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_previews_in_constant_queries(self):
+        ids = ','.join(str(c.pk) for c in self.mine + [self.foreign])
+        with capture_shard_queries() as queries:
+            response = self.client.get(
+                '/api/chats/messages/previews/', {'conversation_ids': ids, 'limit': 2}
+            )
+
+        # One membership query per shard asked, one message query per shard
+        # holding accessible conversations
+        shards = {c._state.db for c in self.mine + [self.foreign]}
+        accessible = {c._state.db for c in self.mine}
+        self.assertEqual(sum(map(len, queries)), len(shards) + len(accessible))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['not_found'], [self.foreign.pk])
+        self.assertEqual(
+            [[m['message_body'] for m in item['messages']] for item in response.data['results']],
+            [['0-4', '0-3'], ['1-4', '1-3'], ['2-4', '2-3']]
+        )
+
+    def test_previews_requires_ids(self):
+        response = self.client.get('/api/chats/messages/previews/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueryPlanTests(AllShardsMixin, TestCase):
+    """
+    EXPLAIN-based checks that every supported filter/ordering combination
+    of the message and conversation endpoints is served by an index.
+
+    Every SELECT an endpoint runs is explained; a plan step that scans a
+    table or walks a whole index fails the test. Scans of temporary
+    results (subqueries, DISTINCT/ORDER BY b-trees) are allowed.
+    """
+    FULL_SCAN = re.compile(r'^SCAN (?!\(?subquery|qualify)')
+
+    MESSAGE_FILTERS = [
+        '',
+        'sender_id={bob}',
+        'sender_username=bo',
+        'conversation_id={conversation}',
+        'is_read=false',
+        'is_read=true',
+        'sent_at_after=2020-01-01T00:00:00Z',
+        'sent_at_before=2030-01-01T00:00:00Z',
+        'sent_at_range_after=2020-01-01&sent_at_range_before=2030-01-01',
+        'message_body=hello',
+        'is_read=false&sent_at_after=2020-01-01T00:00:00Z',
+    ]
+    CONVERSATION_FILTERS = [
+        '',
+        'participant_id={bob}',
+        'participant_username=bo',
+        'created_at_after=2020-01-01T00:00:00Z',
+        'created_at_before=2030-01-01T00:00:00Z',
+        'created_at_range_after=2020-01-01&created_at_range_before=2030-01-01',
+        'updated_at_after=2020-01-01T00:00:00Z',
+        'updated_at_before=2030-01-01T00:00:00Z',
+    ]
+    MESSAGE_ORDERINGS = ['', 'sent_at', '-sent_at', 'updated_at', '-updated_at']
+    CONVERSATION_ORDERINGS = ['', 'created_at', '-created_at', 'updated_at', '-updated_at']
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.conversation, _ = Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        for sender in (self.alice, self.bob, self.alice):
+            Message.objects.create(
+                conversation=self.conversation, sender=sender, message_body='hello'
+            )
+        Message.objects.filter(sender=self.bob).update(is_read=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.params = {'bob': self.bob.id, 'conversation': self.conversation.pk}
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[3] for row in cursor.fetchall()]
+
+    def plans_for(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        return [
+            (query['sql'], self.plan(query['sql']))
+            for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+
+    def assertIndexedPlans(self, url):
+        plans = self.plans_for(url)
+        for sql, plan in plans:
+            scans = [step for step in plan if self.FULL_SCAN.match(step)]
+            self.assertEqual(scans, [], f'{url}\n{sql}\n' + '\n'.join(plan))
+        return plans
+
+    def combinations(self, path, filters, orderings):
+        for query in filters:
+            for ordering in orderings:
+                params = [part for part in (query.format(**self.params), ordering and f'ordering={ordering}') if part]
+                separator = '&' if '?' in path else '?'
+                yield path + (separator + '&'.join(params) if params else '')
+
+    def test_message_endpoints_use_indexes(self):
+        paths = [
+            '/api/chats/messages/',
+            '/api/chats/messages/my_messages/',
+            '/api/chats/messages/unread_messages/',
+            f'/api/chats/messages/conversation_messages/?conversation_id={self.conversation.pk}',
+        ]
+        for path in paths:
+            for url in self.combinations(path, self.MESSAGE_FILTERS, self.MESSAGE_ORDERINGS):
+                with self.subTest(url=url):
+                    self.assertIndexedPlans(url)
+
+    def test_conversation_endpoints_use_indexes(self):
+        for url in self.combinations(
+            '/api/chats/conversations/', self.CONVERSATION_FILTERS, self.CONVERSATION_ORDERINGS
+        ):
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+
+    def test_my_messages_uses_sender_index_without_sort(self):
+        plans = self.assertIndexedPlans('/api/chats/messages/my_messages/')
+        sql, plan = next(
+            (sql, plan) for sql, plan in plans
+            if sql.startswith('SELECT "chats_message"."message_id"')
+        )
+        self.assertIn('chats_msg_sender_sent_idx', ' '.join(plan))
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_unread_messages_uses_partial_index(self):
+        plans = self.assertIndexedPlans('/api/chats/messages/unread_messages/')
+        self.assertTrue(
+            any('chats_msg_unread_idx' in ' '.join(plan) for sql, plan in plans),
+            plans
+        )
+
+
+class ShardPlacementTests(AllShardsMixin, TestCase):
+    """
+    Tests for conversation placement and scatter-gather merging.
+    """
+
+    def test_placement_is_deterministic(self):
+        aliases = ['default', 'shard_1', 'shard_2']
+        ids = [uuid.uuid4() for _ in range(200)]
+        placement = [shard_for_conversation(i, aliases) for i in ids]
+
+        self.assertEqual(placement, [shard_for_conversation(str(i), aliases) for i in ids])
+        self.assertEqual(set(placement), set(aliases))
+
+    def test_adding_a_shard_only_moves_to_the_new_shard(self):
+        ids = [uuid.uuid4() for _ in range(500)]
+        before = {i: shard_for_conversation(i, ['default', 'shard_1']) for i in ids}
+        after = {i: shard_for_conversation(i, ['default', 'shard_1', 'shard_2']) for i in ids}
+
+        moved = [i for i in ids if before[i] != after[i]]
+        self.assertTrue(all(after[i] == 'shard_2' for i in moved))
+        self.assertLess(len(moved), len(ids) / 2)
+
+    def test_sharded_results_merge_in_query_order(self):
+        alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        conversation, _ = Conversation.objects.find_or_create([alice.id, bob.id])
+        for i in range(6):
+            Message.objects.create(
+                conversation=conversation, sender=alice if i % 2 else bob, message_body=str(i)
+            )
+        ordered = Message.objects.using(conversation._state.db).order_by('-sent_at', 'message_id')
+        results = ShardedResults([ordered.filter(sender=alice), ordered.filter(sender=bob)])
+
+        self.assertEqual(results.count(), 6)
+        self.assertEqual([m.message_body for m in results], [m.message_body for m in ordered])
+        self.assertEqual([m.message_body for m in results[1:4]],
+                         [m.message_body for m in ordered[1:4]])
+
+
+@override_settings(CHATS_SHARDS=['default', 'shard_1', 'shard_2'])
+class ShardedRoutingTests(AllShardsMixin, TestCase):
+    """
+    End-to-end checks against several shard databases.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.others = [User.objects.create_user(username=f'user{i}') for i in range(8)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def _conversations(self):
+        conversations = []
+        for i, other in enumerate(self.others):
+            conversation, _ = Conversation.objects.find_or_create([self.alice.id, other.id])
+            Message.objects.create(conversation=conversation, sender=other, message_body=f'in-{i}')
+            Message.objects.create(conversation=conversation, sender=self.alice, message_body=f'out-{i}')
+            conversations.append(conversation)
+        return conversations
+
+    def test_conversation_data_lives_on_its_shard(self):
+        conversations = self._conversations()
+        self.assertGreater(len({c._state.db for c in conversations}), 1)
+        for conversation in conversations:
+            alias = shard_for_conversation(conversation.pk)
+            self.assertEqual(conversation._state.db, alias)
+            self.assertEqual(
+                Message.objects.using(alias).filter(conversation=conversation).count(), 2
+            )
+            self.assertEqual(
+                Message.objects.filter(conversation_id=conversation.pk).count(), 2
+            )
+
+    def test_scatter_gather_endpoints(self):
+        self._conversations()
+
+        response = self.client.get(
+            '/api/chats/messages/my_messages/', {'page_size': 3, 'ordering': 'sent_at'}
+        )
+        self.assertEqual(response.data['count'], 8)
+        self.assertEqual(
+            [m['message_body'] for m in response.data['results']], ['out-0', 'out-1', 'out-2']
+        )
+
+        response = self.client.get('/api/chats/messages/unread_messages/')
+        self.assertEqual(response.data['count'], 8)
+
+        response = self.client.get('/api/chats/conversations/')
+        self.assertEqual(response.data['count'], 8)
+
+    def test_message_detail_found_on_any_shard(self):
+        conversation = self._conversations()[-1]
+        message = Message.objects.filter(conversation=conversation).first()
+
+        response = self.client.get(f'/api/chats/messages/{message.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['message_body'], message.message_body)
+
+    def test_rebalance_moves_conversations_to_their_shard(self):
+        with override_settings(CHATS_SHARDS=['default']):
+            conversations = self._conversations()
+        self.assertTrue(all(c._state.db == 'default' for c in conversations))
+
+        call_command('rebalance_shards', stdout=io.StringIO())
+
+        for conversation in conversations:
+            alias = shard_for_conversation(conversation.pk)
+            moved = Conversation.objects.get(pk=conversation.pk)
+            self.assertEqual(moved._state.db, alias)
+            self.assertEqual(moved.participant_key, conversation.participant_key)
+            self.assertEqual(Message.objects.filter(conversation=moved).count(), 2)
+            if alias != 'default':
+                self.assertFalse(
+                    Conversation.objects.using('default').filter(pk=conversation.pk).exists()
+                )
+
+
+class ChangeEventLogTests(AllShardsMixin, TestCase):
+    """
+    Tests for the transactional change log and its consumers.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.conversation, _ = Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        self.using = self.conversation._state.db
+
+    def _events(self):
+        return list(
+            ChangeEvent.objects.using(self.using).values_list('entity', 'action')
+        )
+
+    def test_changes_are_logged_in_order(self):
+        message = Message.objects.create(
+            conversation=self.conversation, sender=self.alice, message_body='hi'
+        )
+        message.is_read = True
+        message.save()
+        message.delete()
+
+        self.assertEqual(self._events(), [
+            ('conversation', 'created'),
+            ('participants', 'updated'),
+            ('message', 'created'),
+            ('message', 'updated'),
+            ('message', 'deleted'),
+        ])
+        created = ChangeEvent.objects.using(self.using).get(entity='message', action='created')
+        self.assertEqual(created.payload['message_body'], 'hi')
+        self.assertEqual(created.conversation_id, self.conversation.pk)
+
+    def test_event_rolls_back_with_the_change(self):
+        before = ChangeEvent.objects.using(self.using).count()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic(using=self.using):
+                Message.objects.create(
+                    conversation=self.conversation, sender=self.alice, message_body='lost'
+                )
+                raise RuntimeError
+        self.assertEqual(ChangeEvent.objects.using(self.using).count(), before)
+
+    def test_consumer_reads_batches_and_commits_offsets(self):
+        for i in range(5):
+            Message.objects.create(
+                conversation=self.conversation, sender=self.alice, message_body=str(i)
+            )
+        consumer = EventConsumer('indexer', using=self.using, batch_size=3)
+        seen = []
+        self.assertEqual(consumer.consume(lambda batch: seen.extend(e.seq for e in batch)), 7)
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(consumer.position, seen[-1])
+        self.assertEqual(consumer.fetch(), [])
+
+        # A failing handler leaves its batch to be delivered again
+        Message.objects.create(conversation=self.conversation, sender=self.bob, message_body='x')
+        with self.assertRaises(ValueError):
+            consumer.consume(lambda batch: int('boom'))
+        self.assertEqual(len(consumer.fetch()), 1)
+
+    def test_prune_and_compact(self):
+        message = Message.objects.create(
+            conversation=self.conversation, sender=self.alice, message_body='a'
+        )
+        for body in 'bcd':
+            message.message_body = body
+            message.save()
+        consumer = EventConsumer('indexer', using=self.using)
+        lagging = EventConsumer('analytics', using=self.using)
+        consumer.commit(consumer.fetch()[-1].seq)
+        lagging.commit(3)
+
+        # Only the message's created event is behind every consumer and superseded
+        self.assertEqual(compact_events(using=self.using), 1)
+        lagging.commit(consumer.position)
+        self.assertEqual(compact_events(using=self.using), 2)
+        self.assertEqual(
+            ChangeEvent.objects.using(self.using).get(entity='message').payload['message_body'], 'd'
+        )
+
+        self.assertEqual(prune_events(using=self.using), 0)
+        self.assertEqual(prune_events(using=self.using, retention=timedelta(0)), 3)
+
+
+class FragmentCacheTests(AllShardsMixin, TestCase):
+    """
+    Tests for the rendered message fragment cache.
+    """
+
+    def setUp(self):
+        self.cache = get_fragment_cache()
+        self.cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        conversation, _ = Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        self.messages = [
+            Message.objects.create(conversation=conversation, sender=self.bob, message_body=str(i))
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def _unread(self):
+        return self.client.get('/api/chats/messages/unread_messages/').data['results']
+
+    def test_lists_reuse_fragments(self):
+        before = self.cache.stats
+        first = self._unread()
+        second = self._unread()
+
+        self.assertEqual(first, second)
+        stats = self.cache.stats
+        self.assertEqual(stats['misses'] - before['misses'], 3)
+        self.assertEqual(stats['hits'] - before['hits'], 3)
+        self.assertEqual(stats['entries'], 3)
+
+    def test_edits_deletes_and_sender_changes_are_visible(self):
+        self._unread()
+        message = self.messages[0]
+        message.message_body = 'edited'
+        message.save()
+        self.messages[1].delete()
+        self.bob.first_name = 'Robert'
+        self.bob.save()
+
+        results = self._unread()
+        self.assertEqual([m['message_body'] for m in results], ['edited', '2'])
+        self.assertTrue(all(m['sender']['first_name'] == 'Robert' for m in results))
+
+    def test_queryset_updates_are_visible(self):
+        self._unread()
+        # .update() leaves updated_at alone
+        Message.objects.filter(conversation=self.messages[0].conversation_id).filter(
+            pk=self.messages[0].pk
+        ).update(message_body='bulk edited')
+        self.assertEqual(self._unread()[0]['message_body'], 'bulk edited')
+
+        self.client.get('/api/chats/messages/')
+        Message.objects.filter(conversation=self.messages[0].conversation_id).update(is_read=True)
+        results = self.client.get('/api/chats/messages/').data['results']
+        self.assertTrue(all(m['is_read'] for m in results))
+
+    def test_key_uses_a_stable_digest_of_the_body(self):
+        message = self.messages[0]
+        fields = ['id', 'username']
+        key = fragment_key(message, fields)
+        # The built-in hash() is salted per process and may collide
+        with mock.patch('builtins.hash', return_value=0):
+            fetched = Message.objects.get(conversation=message.conversation, pk=message.pk)
+            self.assertEqual(fragment_key(fetched, fields), key)
+            message.message_body = 'edited'
+            self.assertNotEqual(fragment_key(message, fields), key)
+
+    def test_lru_eviction_by_bytes(self):
+        cache = FragmentCache(max_entries=100, max_bytes=100)
+        cache.set_many({('a', 1, 1, 0): {'body': 'x' * 25}})
+        cache.set_many({('b', 1, 1, 0): {'body': 'y' * 25}})
+        cache.get_many([('a', 1, 1, 0)])
+        cache.set_many({('c', 1, 2, 0): {'body': 'z' * 25}})
+
+        self.assertEqual(set(cache.get_many([('a', 1, 1, 0), ('b', 1, 1, 0), ('c', 1, 2, 0)])),
+                         {('a', 1, 1, 0), ('c', 1, 2, 0)})
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertLessEqual(cache.stats['bytes'], 100)
+
+    def test_stats_endpoint_is_admin_only(self):
+        response = self.client.get('/api/chats/messages/fragment_cache/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.alice.is_staff = True
+        self.alice.save()
+        response = self.client.get('/api/chats/messages/fragment_cache/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('hit_ratio', response.data)
+
+
+class PresenceTests(AllShardsMixin, TestCase):
+    """
+    Tests for presence and typing indicators.
+    """
+
+    def setUp(self):
+        presence._backend = LocalPresenceBackend()
+        presence._memberships = None
+        # Load the revocation list up front; it then refreshes periodically
+        revocation.get_revocation_list().is_revoked('warm-up')
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.conversation, _ = Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        self.client = APIClient()
+        token = AccessToken.for_user(self.alice)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def tearDown(self):
+        presence._backend = None
+        presence._memberships = None
+
+    def _presence(self, *users):
+        return self.client.get(
+            '/api/chats/presence/', {'user_ids': ','.join(str(user.id) for user in users)}
+        )
+
+    def test_heartbeat_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/chats/presence/heartbeat/')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        # Sharing a conversation is checked once (one query per shard)
+        with capture_shard_queries() as queries:
+            response = self._presence(self.alice, self.bob)
+        self.assertEqual(sum(map(len, queries)), len(get_shard_aliases()))
+        with self.assertNumQueries(0):
+            self.assertEqual(self._presence(self.alice, self.bob).data, response.data)
+
+        self.assertTrue(response.data['results'][self.alice.id]['online'])
+        self.assertEqual(
+            response.data['results'][self.bob.id], {'online': False, 'last_seen': None}
+        )
+
+    def test_presence_is_limited_to_shared_conversations(self):
+        carol = User.objects.create_user(username='carol')
+        response = self._presence(self.bob, carol)
+        self.assertEqual(list(response.data['results']), [self.bob.id])
+        self.assertEqual(response.data['not_found'], [carol.id])
+
+    def test_removal_invalidates_cached_memberships(self):
+        group, _ = Conversation.objects.find_or_create(
+            [self.alice.id, self.bob.id, User.objects.create_user(username='carol').id]
+        )
+        typing = {'conversation_id': str(group.pk)}
+        self.assertEqual(
+            self.client.post('/api/chats/presence/typing/', typing).status_code,
+            status.HTTP_204_NO_CONTENT
+        )
+        self.assertIn(self.bob.id, self._presence(self.bob).data['results'])
+
+        # Alice leaves the group, then Bob removes her from their pair
+        group.participants.remove(self.alice)
+        self.assertEqual(
+            self.client.post('/api/chats/presence/typing/', typing).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+        bob = APIClient()
+        bob.force_authenticate(self.bob)
+        response = bob.post(
+            f'/api/chats/conversations/{self.conversation.pk}/remove_participants/',
+            {'user_ids': [self.alice.id]}, format='json'
+        )
+        self.assertEqual(response.data['removed'], 1)
+        self.assertEqual(self._presence(self.bob).data['not_found'], [self.bob.id])
+
+    def test_typing_and_batch_conversation_presence(self):
+        other, _ = Conversation.objects.find_or_create([self.bob.id])
+        response = self.client.post(
+            '/api/chats/presence/typing/', {'conversation_id': str(self.conversation.pk)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.post(
+            '/api/chats/presence/typing/', {'conversation_id': str(other.pk)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/chats/presence/conversations/', {
+                'conversation_ids': f'{self.conversation.pk},{other.pk}'
+            })
+        result = response.data['results'][0]
+        self.assertEqual(result['typing'], [self.alice.id])
+        self.assertTrue(result['participants'][self.alice.id]['online'])
+        self.assertFalse(result['participants'][self.bob.id]['online'])
+        self.assertEqual(response.data['not_found'], [other.pk])
+
+        self.client.post('/api/chats/presence/typing/', {
+            'conversation_id': str(self.conversation.pk), 'typing': False
+        })
+        self.assertEqual(presence.typing_in([self.conversation.pk]),
+                         {str(self.conversation.pk): []})
+
+    def test_entries_expire(self):
+        for backend in (LocalPresenceBackend(), CachePresenceBackend()):
+            backend.touch(1, now=100, ttl=10)
+            backend.set_typing('c', 1, now=100, ttl=5)
+            self.assertEqual(backend.last_seen_many([1, 2], now=105), {1: 100})
+            self.assertEqual(backend.typing_many(['c'], now=104), {'c': [1]})
+            self.assertEqual(backend.typing_many(['c'], now=106), {'c': []})
+            if isinstance(backend, LocalPresenceBackend):
+                self.assertEqual(backend.last_seen_many([1], now=111), {})
+
+
+class RetentionTests(AllShardsMixin, TestCase):
+    """
+    Tests for chunked retention purges.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.carol = User.objects.create_user(username='carol')
+        self.general, _ = Conversation.objects.find_or_create([self.alice.id, self.bob.id])
+        self.legal, _ = Conversation.objects.find_or_create([self.alice.id, self.carol.id])
+        now = timezone.now()
+        for conversation in (self.general, self.legal):
+            for days in (1, 10, 40, 100):
+                message = Message.objects.create(
+                    conversation=conversation, sender=self.alice, message_body=f'{days}d'
+                )
+                Message.objects.filter(conversation=conversation, pk=message.pk).update(
+                    sent_at=now - timedelta(days=days)
+                )
+
+    def _bodies(self, conversation):
+        return sorted(
+            Message.objects.filter(conversation=conversation).values_list('message_body', flat=True)
+        )
+
+    def test_global_and_conversation_policies(self):
+        RetentionPolicy.objects.create(max_age_days=30)
+        RetentionPolicy.objects.create(conversation=self.legal, max_age_days=5)
+        progress = []
+
+        run = RetentionEngine(chunk_size=1, pause_ms=0, progress=progress.append).run()
+
+        self.assertEqual(self._bodies(self.general), ['10d', '1d'])
+        self.assertEqual(self._bodies(self.legal), ['1d'])
+        self.assertEqual(run.messages_deleted, 5)
+        self.assertEqual(len(progress), 5)
+        self.assertEqual(RetentionRun.objects.get().status, 'finished')
+        purged = on_every_shard(ChangeEvent, action='purged')
+        self.assertEqual(purged.count(), 5)
+        self.assertEqual(sum(len(e.payload['message_ids']) for e in purged), 5)
+
+    def test_dry_run_and_empty_conversations(self):
+        RetentionPolicy.objects.create(max_age_days=0, delete_empty_conversations=True)
+        RetentionPolicy.objects.create(conversation=self.general, max_age_days=1000)
+
+        run = RetentionEngine(pause_ms=0, dry_run=True).run()
+        self.assertEqual(run.messages_deleted, 4)
+        self.assertEqual(on_every_shard(Message).count(), 8)
+
+        run = RetentionEngine(pause_ms=0).run()
+        self.assertEqual(self._bodies(self.general), ['100d', '10d', '1d', '40d'])
+        self.assertEqual(run.conversations_deleted, 1)
+        self.assertEqual([c.pk for c in on_every_shard(Conversation)], [self.general.pk])
+
+    def test_progress_only_counts_committed_chunks(self):
+        RetentionPolicy.objects.create(max_age_days=30)
+        log_purge = RetentionEngine._log_purge
+        calls = []
+
+        def fail_second_chunk(engine, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('shard went away')
+            return log_purge(engine, *args)
+
+        with mock.patch.object(RetentionEngine, '_log_purge', fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                RetentionEngine(chunk_size=1, pause_ms=0).run()
+
+        self.assertEqual(on_every_shard(Message).count(), 7)
+        self.assertEqual(RetentionRun.objects.get().messages_deleted, 1)
+
+    def test_resume_uses_the_original_cutoff(self):
+        RetentionPolicy.objects.create(max_age_days=30)
+        interrupted = RetentionRun.objects.create(
+            as_of=timezone.now() - timedelta(days=60), messages_deleted=3
+        )
+
+        out = io.StringIO()
+        call_command('purge_expired', '--resume', '--pause-ms=0', stdout=out)
+
+        interrupted.refresh_from_db()
+        self.assertEqual(interrupted.status, 'finished')
+        # Only the 100 day old messages are 30 days older than 60 days ago
+        self.assertEqual(interrupted.messages_deleted, 5)
+        self.assertIn('Purged 5 message(s)', out.getvalue())
+
+
+class TokenRevocationTests(AllShardsMixin, TestCase):
+    """
+    Tests for JWT revocation and refresh token rotation.
+    """
+
+    def setUp(self):
+        revocation._revocations = None
+        self.alice = User.objects.create_user(username='alice', password='secret-pass')
+        self.client = APIClient()
+        response = self.client.post('/api/token/', {'username': 'alice', 'password': 'secret-pass'})
+        self.access = response.data['access']
+        self.refresh = response.data['refresh']
+
+    def tearDown(self):
+        revocation._revocations = None
+
+    def _get(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return self.client.get('/api/chats/conversations/')
+
+    def test_logout_revokes_access_and_refresh(self):
+        self.assertEqual(self._get(self.access).status_code, status.HTTP_200_OK)
+
+        response = self.client.post('/api/auth/logout/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self._get(self.access).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+    def test_refresh_rotation_revokes_the_used_token(self):
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data['refresh'], self.refresh)
+
+        replay = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(replay.status_code, status.HTTP_401_UNAUTHORIZED)
+        rotated = self.client.post('/api/token/refresh/', {'refresh': response.data['refresh']})
+        self.assertEqual(rotated.status_code, status.HTTP_200_OK)
+
+    def test_checks_are_served_from_memory(self):
+        revocations = revocation.get_revocation_list()
+        self._get(self.access)
+        with self.assertNumQueries(0):
+            self.assertFalse(revocations.is_revoked('never-revoked'))
+
+        # Revocations by other workers are picked up by the next refresh
+        RevokedToken.objects.create(
+            jti='elsewhere', token_type='access', expires_at=timezone.now() + timedelta(hours=1)
+        )
+        self.assertFalse(revocations.is_revoked('elsewhere'))
+        revocations._refreshed_at -= revocations.refresh_seconds
+        self.assertTrue(revocations.is_revoked('elsewhere'))
+
+        # The rebuilt filter replaces the old one; readers never see it unset
+        bloom = revocations._bloom
+        revocations.invalidate()
+        self.assertIsNotNone(revocations._bloom)
+        self.assertIsNot(revocations._bloom, bloom)
+        self.assertEqual(revocations._recent, set())
+        self.assertTrue(revocations.is_revoked('elsewhere'))
+        self.assertEqual(revocations.stats['db_checks'], 1)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserProvisioningTests(AllShardsMixin, TestCase):
+    """
+    Tests for bulk user provisioning.
+    """
+
+    def setUp(self):
+        User.objects.create_user(username='taken', email='taken@example.com')
+
+    def test_csv_with_per_row_errors(self):
+        data = (
+            'username,email,password,first_name\n'
+            'ann,ann@example.com,pw-ann,Ann\n'
+            'taken,new@example.com,pw,\n'
+            'ben,taken@example.com,pw,\n'
+            ',nobody@example.com,pw,\n'
+            'cid,not-an-email,pw,\n'
+            'ann,ann2@example.com,pw,\n'
+            'dee,dee@example.com,,\n'
+        )
+        # Per batch of 4 rows: two lookups and one INSERT (in a savepoint)
+        with self.assertNumQueries(10):
+            report = provision_from_text(data, 'csv', batch_size=4, workers=1)
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(
+            [(e['line'], sorted(e['errors'])) for e in report['errors']],
+            [(3, ['username']), (4, ['email']), (5, ['username']),
+             (6, ['email']), (7, ['username'])]
+        )
+        ann = User.objects.get(username='ann')
+        self.assertEqual(ann.first_name, 'Ann')
+        self.assertTrue(ann.check_password('pw-ann'))
+        self.assertFalse(User.objects.get(username='dee').has_usable_password())
+
+    def test_ndjson_hashed_in_process_pool(self):
+        data = '\n'.join(
+            json.dumps({'username': f'user{i}', 'email': f'user{i}@example.com', 'password': f'pw{i}'})
+            for i in range(20)
+        ) + '\n{broken\n'
+        report = provision_from_text(data, 'ndjson', batch_size=8, workers=2)
+
+        self.assertEqual(report['created'], 20)
+        self.assertEqual(report['errors'][0]['line'], 21)
+        self.assertTrue(User.objects.get(username='user7').check_password('pw7'))
+
+    def test_admin_endpoint(self):
+        admin = User.objects.create_user(username='admin', email='admin@example.com', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        upload = SimpleUploadedFile(
+            'users.ndjson', b'{"username": "eve", "email": "eve@example.com", "password": "pw"}\n'
+        )
+
+        # The endpoint never starts a process pool
+        with mock.patch('chats.provisioning.ProcessPoolExecutor') as pool:
+            with self.settings(CHATS_PROVISIONING={'WORKERS': 4}):
+                response = client.post('/api/auth/provision/', {'file': upload}, format='multipart')
+        pool.assert_not_called()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'created': 1, 'errors': []})
+
+
+class GenerateChatDataTests(AllShardsMixin, TestCase):
+    """
+    Tests for the synthetic data generator.
+    """
+
+    def generate(self, seed, prefix='gen'):
+        call_command(
+            'generate_chat_data', users=30, conversations=40, messages=500,
+            seed=seed, prefix=prefix, stdout=io.StringIO()
+        )
+        return sorted(
+            body
+            for alias in get_shard_aliases()
+            for body in Message.objects.using(alias).values_list('message_body', 'sent_at')
+        )
+
+    def test_counts_and_integrity(self):
+        self.generate(seed=1)
+
+        self.assertEqual(User.objects.count(), 30)
+        for alias in get_shard_aliases():
+            self.assertEqual(User.objects.using(alias).count(), 30)
+        self.assertEqual(
+            sum(Conversation.objects.using(alias).count() for alias in get_shard_aliases()), 40
+        )
+        self.assertEqual(
+            sum(Message.objects.using(alias).count() for alias in get_shard_aliases()), 500
+        )
+        for alias in get_shard_aliases():
+            self.assertFalse(ChangeEvent.objects.using(alias).exists())
+            # Every sender is a participant of the conversation
+            self.assertFalse(Message.objects.using(alias).exclude(
+                conversation__participants=models.F('sender')
+            ).exists())
+            with connections[alias].cursor() as cursor:
+                cursor.execute('PRAGMA foreign_key_check')
+                self.assertEqual(cursor.fetchall(), [])
+                # The deferred indexes were rebuilt
+                cursor.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+                    [Message._meta.db_table]
+                )
+                self.assertGreater(cursor.fetchone()[0], 1)
+
+    def test_seed_is_deterministic(self):
+        first = self.generate(seed=7)
+        for alias in get_shard_aliases():
+            Message.objects.using(alias).all().delete()
+            Conversation.objects.using(alias).all().delete()
+
+        second = self.generate(seed=7, prefix='again')
+        self.assertEqual([body for body, _ in second], [body for body, _ in first])
+
+
+@override_settings(CHATS_PROFILING={
+    'ENABLED': True, 'SAMPLE_RATE': 0.0, 'TOKEN': 'secret', 'INTERVAL_MS': 1,
+})
+class SamplingProfilerTests(AllShardsMixin, TestCase):
+    """
+    Tests for the sampling profiler middleware and its summary endpoint.
+    """
+
+    def setUp(self):
+        profiling._profiler = None
+        self.alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        Conversation.objects.find_or_create([self.alice.id, bob.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def slow_list(self):
+        original = ConversationSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return original(serializer, instance)
+
+        with mock.patch.object(ConversationSerializer, 'to_representation', slow):
+            return self.client.get('/api/chats/conversations/', HTTP_X_CHATS_PROFILE='secret')
+
+    def test_profiled_request_is_broken_down_by_phase(self):
+        self.assertEqual(self.slow_list().status_code, status.HTTP_200_OK)
+
+        summary = profiling.get_profiler().summary()
+        view = summary['views']['ConversationViewSet.list']
+        self.assertEqual(view['requests'], 1)
+        self.assertGreater(view['phases']['serializer']['share'], 0.5)
+        collapsed = profiling.get_profiler().collapsed('ConversationViewSet.list')
+        self.assertTrue(all(
+            re.fullmatch(r'(auth|permission|queryset|serializer|renderer|view)(;[^;]+)* \d+', line)
+            for line in collapsed.splitlines()
+        ))
+        self.assertIn('serializer;', collapsed)
+
+    def test_only_sampled_or_authorized_requests_are_profiled(self):
+        self.client.get('/api/chats/conversations/')
+        self.client.get('/api/chats/conversations/', HTTP_X_CHATS_PROFILE='wrong')
+        self.client.get('/api/chats/conversations/', HTTP_X_CHATS_PROFILE='s\u00e9cret')
+
+        self.assertIsNone(profiling._profiler)
+
+    def test_disabled_middleware_is_removed(self):
+        with self.settings(CHATS_PROFILING={'ENABLED': False}):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.SamplingProfilerMiddleware(lambda request: None)
+
+    def test_summary_endpoint(self):
+        self.slow_list()
+        response = self.client.get('/api/chats/profiles/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/chats/profiles/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ConversationViewSet.list', response.data['views'])
+
+        response = self.client.get('/api/chats/profiles/ConversationViewSet.list/')
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn(b'serializer;', response.content)
+
+        self.client.post('/api/chats/profiles/reset/')
+        response = self.client.get('/api/chats/profiles/ConversationViewSet.list/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MetricsTests(AllShardsMixin, TestCase):
+    """
+    Tests for the request metrics and the /metrics endpoint.
+    """
+
+    def setUp(self):
+        metrics._registry = None
+        self.alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        self.conversation, _ = Conversation.objects.find_or_create([self.alice.id, bob.id])
+        Message.objects.create(conversation=self.conversation, sender=bob, message_body='hi')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def scrape(self, **extra):
+        response = self.client.get('/metrics', **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_request_metrics(self):
+        self.client.get('/api/chats/conversations/')
+        self.client.get('/api/chats/conversations/')
+        self.client.get(f'/api/chats/conversations/{uuid.uuid4()}/')
+        self.client.get('/admin/')
+
+        text = self.scrape()
+        self.assertIn(
+            'chats_http_requests_total{route="conversation-list",method="GET",status="200"} 2',
+            text
+        )
+        self.assertIn(
+            'chats_http_requests_total{route="conversation-detail",method="GET",status="404"} 1',
+            text
+        )
+        self.assertIn(
+            'chats_http_request_duration_seconds_bucket'
+            '{route="conversation-list",method="GET",le="+Inf"} 2',
+            text
+        )
+        self.assertIn('chats_http_requests_active{method="GET"} 0', text)
+        self.assertNotIn('admin', text)
+        self.assertNotIn('route="metrics"', text)
+
+        queries = re.search(
+            r'chats_db_queries_per_request_sum\{route="conversation-list",method="GET"\} (\d+)', text
+        )
+        self.assertGreater(int(queries.group(1)), 0)
+        serializer = re.search(
+            r'chats_serializer_duration_seconds_sum\{route="conversation-list",method="GET"\} (\S+)',
+            text
+        )
+        self.assertGreater(float(serializer.group(1)), 0)
+
+    def test_threads_are_summed(self):
+        registry = metrics.MetricsRegistry()
+        registry.counter('hits', 'Hits.', ['kind'])
+        registry.histogram('latency', 'Latency.', [], buckets=(0.1, 1.0))
+
+        def work():
+            for i in range(1000):
+                registry.inc('hits', ('a',))
+                registry.observe('latency', (), i % 3 * 0.75)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        work()
+
+        values = registry.collect()
+        self.assertEqual(values[('hits', ('a',))], 5000)
+        # Buckets 0.1, 1.0, +Inf, then sum and count
+        self.assertEqual(values[('latency', ())], [1670, 1665, 1665, 3746.25, 5000])
+        text = metrics.render(registry.definitions, values)
+        self.assertIn('latency_bucket{le="1"} 3335', text)
+        self.assertIn('latency_bucket{le="+Inf"} 5000', text)
+
+    def test_snapshots_of_other_workers_are_merged(self):
+        registry = metrics.get_registry()
+        directory = tempfile.mkdtemp()
+        alive = {
+            'pid': os.getppid(),
+            'values': [
+                ['chats_http_requests_total', ['conversation-list', 'GET', '200'], 3],
+                ['chats_http_requests_active', ['GET'], 2],
+            ],
+        }
+        exited = {
+            'pid': 2 ** 22 + 1,  # above the default pid_max
+            'values': [
+                ['chats_http_requests_total', ['conversation-list', 'GET', '200'], 4],
+                ['chats_http_requests_active', ['GET'], 5],
+            ],
+        }
+        for snapshot in (alive, exited):
+            with open(os.path.join(directory, f"{snapshot['pid']}.json"), 'w') as f:
+                json.dump(snapshot, f)
+
+        with self.settings(CHATS_METRICS={'MULTIPROCESS_DIR': directory, 'FLUSH_SECONDS': 0}):
+            client = APIClient()
+            client.force_authenticate(self.alice)
+            client.get('/api/chats/conversations/')
+            text = client.get('/metrics').content.decode()
+
+        self.assertIn(
+            'chats_http_requests_total{route="conversation-list",method="GET",status="200"} 8',
+            text
+        )
+        self.assertIn('chats_http_requests_active{method="GET"} 2', text)
+        # This worker wrote its own snapshot after the request
+        self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+        self.assertIn('chats_http_requests_total', registry.definitions)
+
+    def test_token(self):
+        with self.settings(CHATS_METRICS={'TOKEN': 'scrape'}):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(
+                self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scr\u00e4pe').status_code,
+                status.HTTP_403_FORBIDDEN
+            )
+            self.scrape(HTTP_AUTHORIZATION='Bearer scrape')
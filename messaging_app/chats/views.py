@@ -1,11 +1,20 @@
 # messaging_app/chats/views.py
 
+import time
+import uuid
+
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.authentication import SessionAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404, HttpResponse
 from .models import Conversation, Message
 from .serializers import ConversationSerializer, MessageSerializer
 from .permissions import (
@@ -15,9 +24,25 @@ from .permissions import (
 )
 from .filters import MessageFilter, ConversationFilter
 from .pagination import MessagePagination, ConversationPagination
+from .auth import RevocableJWTStatelessUserAuthentication
+from .batching import get_batcher, get_group_commit_settings
+from . import presence, profiling
+from .fragments import get_fragment_cache
+from .sharding import get_shard_aliases, group_by_shard, is_sharded, scatter, shard_for_conversation
 
 User = get_user_model()
 
+# Upper bound on users accepted by one bulk participant request
+MAX_BULK_PARTICIPANTS = 1000
+
+# Limits for the batched conversation previews action
+MAX_PREVIEW_CONVERSATIONS = 50
+MAX_PREVIEW_MESSAGES = 20
+
+# Upper bound on conversations/users in one presence query
+MAX_PRESENCE_CONVERSATIONS = 50
+MAX_PRESENCE_USERS = 500
+
 
 class ConversationViewSet(viewsets.ModelViewSet):
     """
@@ -43,16 +68,94 @@ class ConversationViewSet(viewsets.ModelViewSet):
         """
         Return only conversations where the current user is a participant.
         """
-        return Conversation.objects.filter(
+        queryset = Conversation.objects.filter(
             participants=self.request.user
-        ).distinct().prefetch_related('participants', 'messages')
+        ).distinct()
+        
+        # Bulk participant actions never serialize the conversation
+        if self.action in ('add_participants', 'remove_participants'):
+            return queryset
+        
+        return queryset.prefetch_related('participants', 'messages')
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List the user's conversations, gathered from every shard.
+        """
+        conversations = scatter(
+            lambda alias: self.filter_queryset(self.get_queryset().using(alias))
+        )
+        
+        page = self.paginate_queryset(conversations)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(conversations, many=True)
+        return Response(serializer.data)
+    
+    def create(self, request, *args, **kwargs):
+        """
+        Create a conversation, or return the existing one with the same
+        participants: 201 when it was created, 200 when it already existed.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if serializer.created else status.HTTP_200_OK,
+            headers=headers
+        )
     
     def perform_create(self, serializer):
         """
         When creating a conversation, automatically add the creator as a participant.
         """
-        conversation = serializer.save()
-        conversation.participants.add(self.request.user)
+        serializer.save(creator=self.request.user)
+    
+    @action(detail=False, methods=['post'])
+    def find_or_create(self, request):
+        """
+        Return the conversation whose participants are exactly the given
+        users plus the current user, creating it if it does not exist.
+        Resolved with one lookup on the participant_key index.
+        """
+        participant_ids = request.data.get('participant_ids')
+        
+        if not isinstance(participant_ids, list) or not participant_ids:
+            return Response(
+                {'error': 'participant_ids must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            participant_ids = {int(user_id) for user_id in participant_ids}
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'participant_ids must contain user IDs'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        found_ids = set(
+            User.objects.filter(id__in=participant_ids).values_list('id', flat=True)
+        )
+        missing_ids = participant_ids - found_ids
+        if missing_ids:
+            return Response(
+                {'error': 'User not found', 'user_ids': sorted(missing_ids)},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        found_ids.add(request.user.pk)
+        conversation, created = Conversation.objects.find_or_create(found_ids)
+        
+        serializer = self.get_serializer(conversation)
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
     
     @action(detail=True, methods=['post'], permission_classes=[IsConversationParticipant])
     def add_participant(self, request, pk=None):
@@ -79,7 +182,8 @@ class ConversationViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            conversation.participants.add(user_to_add)
+            with transaction.atomic(using=conversation._state.db):
+                conversation.participants.add(user_to_add)
             return Response(
                 {'message': f'User {user_to_add.username} added to conversation'},
                 status=status.HTTP_200_OK
@@ -89,6 +193,11 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 {'error': 'User not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except IntegrityError:
+            return Response(
+                {'error': 'A conversation with these participants already exists'},
+                status=status.HTTP_409_CONFLICT
+            )
     
     @action(detail=True, methods=['post'], permission_classes=[IsConversationParticipant])
     def remove_participant(self, request, pk=None):
@@ -114,7 +223,8 @@ class ConversationViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            conversation.participants.remove(user_to_remove)
+            with transaction.atomic(using=conversation._state.db):
+                conversation.participants.remove(user_to_remove)
             return Response(
                 {'message': f'User {user_to_remove.username} removed from conversation'},
                 status=status.HTTP_200_OK
@@ -124,6 +234,170 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 {'error': 'User not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except IntegrityError:
+            return Response(
+                {'error': 'A conversation with these participants already exists'},
+                status=status.HTTP_409_CONFLICT
+            )
+    
+    def _resolve_bulk_users(self, request):
+        """
+        Resolve the user_ids and usernames lists of a bulk request in one query.
+        
+        Returns (entries, error_response). Each entry is a per-item result
+        dict carrying the resolved user id under '_id' (None if not found).
+        """
+        user_ids = request.data.get('user_ids', [])
+        usernames = request.data.get('usernames', [])
+        
+        if not isinstance(user_ids, list) or not isinstance(usernames, list):
+            return None, Response(
+                {'error': 'user_ids and usernames must be lists'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not user_ids and not usernames:
+            return None, Response(
+                {'error': 'user_ids or usernames is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(user_ids) + len(usernames) > MAX_BULK_PARTICIPANTS:
+            return None, Response(
+                {'error': f'At most {MAX_BULK_PARTICIPANTS} users per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        numeric_ids = set()
+        for user_id in user_ids:
+            try:
+                numeric_ids.add(int(user_id))
+            except (TypeError, ValueError):
+                pass
+        names = {str(username) for username in usernames}
+        
+        by_id = {}
+        by_username = {}
+        for pk, username in User.objects.filter(
+            Q(id__in=numeric_ids) | Q(username__in=names)
+        ).values_list('id', 'username'):
+            by_id[pk] = pk
+            by_username[username] = pk
+        
+        entries = []
+        for user_id in user_ids:
+            try:
+                pk = by_id.get(int(user_id))
+            except (TypeError, ValueError):
+                entries.append({'user_id': user_id, 'status': 'invalid', '_id': None})
+                continue
+            entries.append({'user_id': user_id, 'status': 'not_found', '_id': pk})
+        for username in usernames:
+            entries.append({
+                'username': username,
+                'status': 'not_found',
+                '_id': by_username.get(str(username))
+            })
+        
+        return entries, None
+    
+    def _bulk_response(self, conversation, entries, counts):
+        """
+        Build the per-item response of a bulk participant request.
+        """
+        for entry in entries:
+            entry.pop('_id')
+        return Response(
+            dict(counts, conversation_id=conversation.pk, results=entries),
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsConversationParticipant])
+    def add_participants(self, request, pk=None):
+        """
+        Add many participants at once.
+        Accepts user_ids and/or usernames lists and returns a status per item:
+        added, already_participant, not_found or invalid.
+        """
+        conversation = self.get_object()
+        entries, error = self._resolve_bulk_users(request)
+        if error is not None:
+            return error
+        
+        using = conversation._state.db
+        Participant = Conversation.participants.through
+        requested = {entry['_id'] for entry in entries if entry['_id'] is not None}
+        current = set(
+            Participant.objects.using(using).filter(
+                conversation_id=conversation.pk,
+                user_id__in=requested
+            ).values_list('user_id', flat=True)
+        )
+        to_add = requested - current
+        
+        try:
+            with transaction.atomic(using=using):
+                Participant.objects.using(using).bulk_create([
+                    Participant(conversation_id=conversation.pk, user_id=user_id)
+                    for user_id in sorted(to_add)
+                ])
+                conversation.refresh_participant_key()
+        except IntegrityError:
+            return Response(
+                {'error': 'A conversation with these participants already exists'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        for entry in entries:
+            if entry['_id'] in current:
+                entry['status'] = 'already_participant'
+            elif entry['_id'] is not None:
+                entry['status'] = 'added'
+        
+        return self._bulk_response(conversation, entries, {'added': len(to_add)})
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsConversationParticipant])
+    def remove_participants(self, request, pk=None):
+        """
+        Remove many participants at once.
+        Accepts user_ids and/or usernames lists and returns a status per item:
+        removed, not_participant, not_found or invalid.
+        """
+        conversation = self.get_object()
+        entries, error = self._resolve_bulk_users(request)
+        if error is not None:
+            return error
+        
+        using = conversation._state.db
+        Participant = Conversation.participants.through
+        requested = {entry['_id'] for entry in entries if entry['_id'] is not None}
+        current = set(
+            Participant.objects.using(using).filter(
+                conversation_id=conversation.pk,
+                user_id__in=requested
+            ).values_list('user_id', flat=True)
+        )
+        
+        try:
+            with transaction.atomic(using=using):
+                Participant.objects.using(using).filter(
+                    conversation_id=conversation.pk,
+                    user_id__in=current
+                ).delete()
+                conversation.refresh_participant_key()
+        except IntegrityError:
+            return Response(
+                {'error': 'A conversation with these participants already exists'},
+                status=status.HTTP_409_CONFLICT
+            )
+        # The bulk delete sends no m2m_changed signal
+        presence.forget_memberships(conversation.pk, current)
+        
+        for entry in entries:
+            if entry['_id'] in current:
+                entry['status'] = 'removed'
+            elif entry['_id'] is not None:
+                entry['status'] = 'not_participant'
+        
+        return self._bulk_response(conversation, entries, {'removed': len(current)})
 
 
 class MessageViewSet(viewsets.ModelViewSet):
@@ -167,6 +441,44 @@ class MessageViewSet(viewsets.ModelViewSet):
             conversation__in=user_conversations
         ).select_related('sender', 'conversation').order_by('-sent_at')
     
+    def get_object(self):
+        """
+        Message ids do not encode their shard, so with sharding enabled the
+        message is looked up on every shard.
+        """
+        if not is_sharded():
+            return super().get_object()
+        
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        
+        for alias in get_shard_aliases():
+            queryset = self.filter_queryset(self.get_queryset().using(alias))
+            try:
+                obj = get_object_or_404(queryset, **filter_kwargs)
+            except Http404:
+                continue
+            self.check_object_permissions(self.request, obj)
+            return obj
+        
+        raise Http404
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List messages from the user's conversations, gathered from every shard.
+        """
+        messages = scatter(
+            lambda alias: self.filter_queryset(self.get_queryset().using(alias))
+        )
+        
+        page = self.paginate_queryset(messages)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(messages, many=True)
+        return Response(serializer.data)
+    
     def perform_create(self, serializer):
         """
         Automatically set the sender as the current user when creating a message.
@@ -179,6 +491,13 @@ class MessageViewSet(viewsets.ModelViewSet):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You are not a participant in this conversation.")
         
+        # Opt-in group commit: coalesce concurrent inserts into one transaction
+        if get_group_commit_settings()['ENABLED']:
+            get_batcher(shard_for_conversation(conversation.pk)).submit(
+                lambda: serializer.save(sender=self.request.user)
+            )
+            return
+        
         serializer.save(sender=self.request.user)
     
     @action(detail=False, methods=['get'])
@@ -187,8 +506,12 @@ class MessageViewSet(viewsets.ModelViewSet):
         Get all messages sent by the current user.
         Supports pagination and filtering.
         """
-        messages = self.filter_queryset(
-            Message.objects.filter(sender=request.user)
+        messages = scatter(
+            lambda alias: self.filter_queryset(
+                Message.objects.using(alias).filter(
+                    sender=request.user
+                ).select_related('sender')
+            )
         )
         
         page = self.paginate_queryset(messages)
@@ -242,20 +565,108 @@ class MessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    @action(detail=False, methods=['get'])
+    def previews(self, request):
+        """
+        Get the most recent messages of many conversations in one call.
+        Requires conversation_ids (comma-separated) as a query parameter;
+        limit sets the messages per conversation (default 3).
+        
+        Membership is checked once for the whole set, and the messages are
+        fetched with a single ROW_NUMBER() window query over the
+        (conversation, -sent_at) index (once per shard when sharded).
+        """
+        raw_ids = [
+            value
+            for param in request.query_params.getlist('conversation_ids')
+            for value in param.split(',')
+            if value.strip()
+        ]
+        
+        if not raw_ids:
+            return Response(
+                {'error': 'conversation_ids parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(raw_ids) > MAX_PREVIEW_CONVERSATIONS:
+            return Response(
+                {'error': f'At most {MAX_PREVIEW_CONVERSATIONS} conversations per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            conversation_ids = list(dict.fromkeys(uuid.UUID(value.strip()) for value in raw_ids))
+            limit = min(int(request.query_params.get('limit', 3)), MAX_PREVIEW_MESSAGES)
+        except ValueError:
+            return Response(
+                {'error': 'Invalid conversation_ids or limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit < 1:
+            return Response(
+                {'error': 'limit must be positive'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        allowed = set()
+        messages = []
+        for alias, shard_ids in group_by_shard(conversation_ids).items():
+            # One membership check for the whole set on each shard
+            shard_allowed = set(
+                Conversation.participants.through.objects.using(alias).filter(
+                    conversation_id__in=shard_ids,
+                    user_id=request.user.pk
+                ).values_list('conversation_id', flat=True)
+            )
+            if not shard_allowed:
+                continue
+            allowed |= shard_allowed
+            
+            messages.extend(Message.objects.using(alias).filter(
+                conversation_id__in=shard_allowed
+            ).annotate(
+                preview_rank=Window(
+                    RowNumber(),
+                    partition_by=F('conversation_id'),
+                    order_by=F('sent_at').desc()
+                )
+            ).filter(
+                preview_rank__lte=limit
+            ).select_related('sender').order_by('conversation_id', 'preview_rank'))
+        
+        serializer = self.get_serializer(messages, many=True)
+        grouped = {conversation_id: [] for conversation_id in allowed}
+        for message, data in zip(messages, serializer.data):
+            grouped[message.conversation_id].append(data)
+        
+        return Response({
+            'results': [
+                {'conversation_id': conversation_id, 'messages': grouped[conversation_id]}
+                for conversation_id in conversation_ids
+                if conversation_id in allowed
+            ],
+            'not_found': [
+                conversation_id
+                for conversation_id in conversation_ids
+                if conversation_id not in allowed
+            ],
+        })
+    
     @action(detail=False, methods=['get'])
     def unread_messages(self, request):
         """
         Get all unread messages for the current user.
         Supports pagination and filtering.
         """
-        user_conversations = Conversation.objects.filter(
-            participants=request.user
-        )
-        messages = self.filter_queryset(
-            Message.objects.filter(
-                conversation__in=user_conversations,
-                is_read=False
-            ).exclude(sender=request.user)
+        messages = scatter(
+            lambda alias: self.filter_queryset(
+                Message.objects.using(alias).filter(
+                    conversation__in=Conversation.objects.using(alias).filter(
+                        participants=request.user
+                    ),
+                    is_read=False
+                ).exclude(sender=request.user).select_related('sender')
+            )
         )
         
         page = self.paginate_queryset(messages)
@@ -277,4 +688,242 @@ class MessageViewSet(viewsets.ModelViewSet):
         message.save()
         
         serializer = self.get_serializer(message)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def fragment_cache(self, request):
+        """
+        Hit/miss and size metrics of the rendered message fragment cache.
+        Admin only.
+        """
+        cache = get_fragment_cache()
+        if cache is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **cache.stats})
+
+
+class PresenceViewSet(viewsets.ViewSet):
+    """
+    Presence and typing indicators, kept in the presence backend only.
+    
+    JWT requests are authenticated from the token alone and revocations
+    are checked in memory, so heartbeats do not query the database.
+    Presence is only returned for users sharing a conversation with the
+    requester; that check runs one query per shard and is then cached
+    (see presence.MembershipCache).
+    """
+    authentication_classes = [RevocableJWTStatelessUserAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    
+    @staticmethod
+    def _user_id(request):
+        # Stateless token users carry the id claim as sent (a string)
+        return int(request.user.pk)
+    
+    @staticmethod
+    def _id_list(request, name):
+        return [
+            value.strip()
+            for param in request.query_params.getlist(name)
+            for value in param.split(',')
+            if value.strip()
+        ]
+    
+    def list(self, request):
+        """
+        Presence of the given users.
+        Requires user_ids (comma-separated) as a query parameter. Users who
+        share no conversation with the requester are listed in not_found.
+        """
+        try:
+            user_ids = [int(value) for value in self._id_list(request, 'user_ids')]
+        except ValueError:
+            return Response(
+                {'error': 'Invalid user_ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not user_ids:
+            return Response(
+                {'error': 'user_ids parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(user_ids) > MAX_PRESENCE_USERS:
+            return Response(
+                {'error': f'At most {MAX_PRESENCE_USERS} users per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        visible = self._visible(self._user_id(request), user_ids)
+        return Response({
+            'results': presence.presence_for(u for u in user_ids if u in visible),
+            'not_found': [u for u in dict.fromkeys(user_ids) if u not in visible],
+        })
+    
+    @action(detail=False, methods=['post'])
+    def heartbeat(self, request):
+        """
+        Mark the current user as online.
+        """
+        presence.heartbeat(self._user_id(request))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=False, methods=['post'])
+    def typing(self, request):
+        """
+        Start or stop the current user's typing indicator.
+        Expects conversation_id and an optional typing flag (default true).
+        """
+        try:
+            conversation_id = uuid.UUID(str(request.data.get('conversation_id')))
+        except ValueError:
+            return Response(
+                {'error': 'A valid conversation_id is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        typing = request.data.get('typing', True)
+        if isinstance(typing, str):
+            typing = typing.lower() not in ('0', 'false', 'no')
+        
+        if not self._is_member(self._user_id(request), conversation_id):
+            return Response(
+                {'error': 'Conversation not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        presence.set_typing(conversation_id, self._user_id(request), bool(typing))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=False, methods=['get'])
+    def conversations(self, request):
+        """
+        Presence of every participant, and who is typing, for many
+        conversations in one call.
+        Requires conversation_ids (comma-separated) as a query parameter.
+        
+        Participants are read with one query per shard; presence and typing
+        come from the presence backend in one batch each.
+        """
+        raw_ids = self._id_list(request, 'conversation_ids')
+        if not raw_ids:
+            return Response(
+                {'error': 'conversation_ids parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(raw_ids) > MAX_PRESENCE_CONVERSATIONS:
+            return Response(
+                {'error': f'At most {MAX_PRESENCE_CONVERSATIONS} conversations per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            conversation_ids = list(dict.fromkeys(uuid.UUID(value) for value in raw_ids))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid conversation_ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        Participant = Conversation.participants.through
+        participants = {}
+        for alias, shard_ids in group_by_shard(conversation_ids).items():
+            mine = Participant.objects.using(alias).filter(
+                conversation_id__in=shard_ids,
+                user_id=self._user_id(request)
+            ).values('conversation_id')
+            rows = Participant.objects.using(alias).filter(
+                conversation_id__in=mine
+            ).values_list('conversation_id', 'user_id')
+            for conversation_id, user_id in rows:
+                participants.setdefault(conversation_id, []).append(user_id)
+        
+        statuses = presence.presence_for(
+            user_id for user_ids in participants.values() for user_id in user_ids
+        )
+        typing = presence.typing_in(participants)
+        
+        results = [
+            {
+                'conversation_id': conversation_id,
+                'participants': {
+                    user_id: statuses[user_id] for user_id in sorted(participants[conversation_id])
+                },
+                'typing': typing[str(conversation_id)],
+            }
+            for conversation_id in conversation_ids
+            if conversation_id in participants
+        ]
+        not_found = [c for c in conversation_ids if c not in participants]
+        return Response({'results': results, 'not_found': not_found})
+    
+    def _is_member(self, user_id, conversation_id):
+        cache = presence.get_membership_cache()
+        now = time.monotonic()
+        if cache.is_member(user_id, conversation_id, now):
+            return True
+        
+        is_member = Conversation.participants.through.objects.using(
+            shard_for_conversation(conversation_id)
+        ).filter(conversation_id=conversation_id, user_id=user_id).exists()
+        if is_member:
+            cache.add_member(user_id, conversation_id, now)
+        return is_member
+    
+    def _visible(self, viewer_id, user_ids):
+        """
+        Return the ids among user_ids that share a conversation with
+        viewer_id (viewer_id included).
+        """
+        cache = presence.get_membership_cache()
+        now = time.monotonic()
+        visible = cache.known_contacts(viewer_id, user_ids, now) | {viewer_id}
+        unknown = [user_id for user_id in user_ids if user_id not in visible]
+        if unknown:
+            Participant = Conversation.participants.through
+            found = set()
+            for alias in get_shard_aliases():
+                mine = Participant.objects.using(alias).filter(
+                    user_id=viewer_id
+                ).values('conversation_id')
+                found.update(Participant.objects.using(alias).filter(
+                    conversation_id__in=mine,
+                    user_id__in=unknown
+                ).values_list('user_id', flat=True))
+            cache.add_contacts(viewer_id, found, now)
+            visible |= found
+        return visible
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """
+    Results of the sampling profiler (see chats/profiling.py) for this
+    process. Admin only.
+    
+    - list: per-view request count, samples and phase breakdown
+    - retrieve: collapsed stacks of one view (flamegraph.pl / speedscope input)
+    - reset: drop everything collected so far
+    """
+    permission_classes = [IsAdminUser]
+    # View names contain dots (ConversationViewSet.list)
+    lookup_value_regex = '[^/]+'
+    
+    def list(self, request):
+        config = profiling.get_profiling_settings()
+        summary = profiling.get_profiler().summary()
+        return Response({
+            'enabled': config['ENABLED'],
+            'sample_rate': config['SAMPLE_RATE'],
+            **summary,
+        })
+    
+    def retrieve(self, request, pk=None):
+        collapsed = profiling.get_profiler().collapsed(pk)
+        if collapsed is None:
+            return Response(
+                {'error': 'No samples for this view'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return HttpResponse(collapsed, content_type='text/plain; charset=utf-8')
+    
+    @action(detail=False, methods=['post'])
+    def reset(self, request):
+        profiling.get_profiler().reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
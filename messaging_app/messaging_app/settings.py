@@ -1,6 +1,7 @@
 # messaging_app/messaging_app/settings.py
 # Add these to your existing settings.py file
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -31,6 +32,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so request latency covers the other middleware
+    'chats.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -38,6 +41,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Removes itself unless CHATS_PROFILING['ENABLED'] is set
+    'chats.profiling.SamplingProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'messaging_app.urls'
@@ -68,6 +73,25 @@ DATABASES = {
     }
 }
 
+# Conversation sharding (see chats/sharding.py).
+# Each extra shard is its own SQLite file; to try it locally set
+# CHATS_SHARD_COUNT=3, run `migrate --database=shard_N` for every shard,
+# then `rebalance_shards` to move existing conversations.
+CHATS_SHARD_COUNT = int(os.environ.get('CHATS_SHARD_COUNT', '1'))
+
+# At least three aliases are defined so the sharded tests can spread
+# conversations with override_settings(CHATS_SHARDS=...); an alias
+# outside CHATS_SHARDS is never used and its file is never created.
+for shard in range(1, max(CHATS_SHARD_COUNT, 3)):
+    DATABASES[f'shard_{shard}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard_{shard}.sqlite3',
+    }
+
+CHATS_SHARDS = list(DATABASES)[:CHATS_SHARD_COUNT]
+
+DATABASE_ROUTERS = ['chats.sharding.ConversationShardRouter']
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -103,7 +127,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'chats.auth.RevocableJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -123,7 +147,7 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
-    'ROTATE_REFRESH_TOKENS': False,
+    'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
@@ -133,4 +157,92 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-}
\ No newline at end of file
+}
+# ==========================================
+# CHATS APP CONFIGURATION
+# ==========================================
+
+# Group commit for message inserts (see chats/batching.py).
+# Concurrent inserts are coalesced into one transaction per WINDOW_MS.
+CHATS_GROUP_COMMIT = {
+    'ENABLED': False,
+    'WINDOW_MS': 5,
+    'MAX_BATCH': 256,
+}
+
+# Change log written with every conversation/message change (see chats/outbox.py).
+# Events consumed by every consumer are pruned after RETENTION_HOURS.
+CHATS_OUTBOX = {
+    'ENABLED': True,
+    'BATCH_SIZE': 1000,
+    'RETENTION_HOURS': 24 * 7,
+}
+
+# Per-process LRU cache of rendered messages (see chats/fragments.py).
+CHATS_FRAGMENT_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 50000,
+    'MAX_BYTES': 32 * 1024 * 1024,
+}
+
+# Presence and typing indicators (see chats/presence.py). Nothing is
+# written to the database; use chats.presence.CachePresenceBackend with a
+# shared cache (OPTIONS: {'cache_alias': ...}) when running several processes.
+CHATS_PRESENCE = {
+    'BACKEND': 'chats.presence.LocalPresenceBackend',
+    'OPTIONS': {},
+    'ONLINE_TTL': 60,
+    'LAST_SEEN_TTL': 24 * 60 * 60,
+    'TYPING_TTL': 8,
+    # Seconds a confirmed membership / shared conversation is trusted
+    'MEMBERSHIP_TTL': 60,
+}
+
+# Retention purges (see chats/retention.py and the purge_expired command).
+# Each chunk is its own short transaction, followed by a PAUSE_MS pause.
+CHATS_RETENTION = {
+    'CHUNK_SIZE': 500,
+    'PAUSE_MS': 50,
+}
+
+# JWT revocation (see chats/revocation.py). Revoked jtis are checked in
+# memory; workers pick up revocations from others within REFRESH_SECONDS.
+CHATS_REVOCATION = {
+    'REFRESH_SECONDS': 5,
+    'REBUILD_SECONDS': 300,
+    'CAPACITY': 100000,
+    'ERROR_RATE': 0.001,
+}
+
+# Bulk user provisioning (see chats/provisioning.py and the
+# provision_users command). WORKERS is the number of password hashing
+# processes of the command (None: one per CPU); the HTTP endpoint always
+# hashes in-process.
+CHATS_PROVISIONING = {
+    'BATCH_SIZE': 500,
+    'WORKERS': None,
+}
+
+# Sampling profiler for API requests (see chats/profiling.py). Profiles
+# SAMPLE_RATE of the requests plus those sending HEADER: TOKEN; results
+# are served at /api/chats/profiles/ (admin only).
+CHATS_PROFILING = {
+    'ENABLED': os.environ.get('CHATS_PROFILING', '') == '1',
+    'SAMPLE_RATE': 0.0,
+    'HEADER': 'X-Chats-Profile',
+    'TOKEN': os.environ.get('CHATS_PROFILING_TOKEN'),
+    'INTERVAL_MS': 5,
+    'MAX_STACKS': 5000,
+    'OUTPUT_DIR': None,
+    'FLUSH_SECONDS': 30,
+}
+
+# Request metrics served at /metrics (see chats/metrics.py). With several
+# worker processes, point MULTIPROCESS_DIR at a directory they share.
+CHATS_METRICS = {
+    'ENABLED': True,
+    'PATH_PREFIXES': ['/api/chats/', '/api/token/'],
+    'MULTIPROCESS_DIR': os.environ.get('CHATS_METRICS_DIR'),
+    'FLUSH_SECONDS': 5,
+    'TOKEN': os.environ.get('CHATS_METRICS_TOKEN'),
+}
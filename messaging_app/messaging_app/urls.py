@@ -2,20 +2,23 @@
 
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
-from chats.auth_views import register
+from rest_framework_simplejwt.views import TokenObtainPairView
+from chats.metrics import metrics_view
+from chats.auth_views import RevocableTokenRefreshView, logout, provision_users, register
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     
     # JWT Authentication endpoints
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', RevocableTokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/register/', register, name='register'),
+    path('api/auth/logout/', logout, name='logout'),
+    path('api/auth/provision/', provision_users, name='provision_users'),
     
     # Your chat app URLs
     path('api/chats/', include('chats.urls')),
+    
+    # Prometheus scrape endpoint (see chats/metrics.py)
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -36,12 +36,26 @@ def log_queries(func):
 
 
 @log_queries
-def fetch_all_users(query):
+def fetch_all_users(query, pool=None):
+    """
+    Fetches all rows of a query from users.db
+
+    Args:
+        query: SQL query to run
+        pool: Connection pool to check a connection out of (any object with
+            a connection() context manager, e.g. a ConnectionPool from
+            python-generators-0x00/pool.py); a fresh connection otherwise
+    """
+    if pool is not None:
+        with pool.connection() as conn:
+            return conn.execute(query).fetchall()
     conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        results = cursor.fetchall()
+    finally:
+        conn.close()
     return results
 
 
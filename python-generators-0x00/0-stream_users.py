@@ -2,32 +2,36 @@
 """
 Module for streaming user data from database using generators
 """
-import sqlite3
+from pool import checkout
+from row_formats import row_converter
 
 
-def stream_users():
+def stream_users(row_format='dict', pool=None):
     """
     Generator function that streams rows from the user_data table one by one
     
+    Args:
+        row_format (str): 'dict' (default), 'tuple', 'record' or 'columns'
+            (see row_formats)
+        pool (ConnectionPool): Pool to check a connection out of (default:
+            a fresh connection for this generator, see pool)
+    
     Yields:
-        dict: A dictionary containing user data (user_id, name, email, age)
+        A row of user data (user_id, name, email, age) in row_format
     """
-    # Connect to the database
-    connection = sqlite3.connect('ALX_prodev.db')
-    cursor = connection.cursor()
-    
-    # Execute query to fetch all users
-    cursor.execute("SELECT user_id, name, email, age FROM user_data")
-    
-    # Fetch and yield rows one by one
-    for row in cursor:
-        yield {
-            'user_id': row[0],
-            'name': row[1],
-            'email': row[2],
-            'age': row[3]
-        }
+    convert = row_converter(row_format)
     
-    # Clean up
-    cursor.close()
-    connection.close()
\ No newline at end of file
+    # Connect to the database; the connection is given back even if the
+    # generator is closed or garbage collected mid-iteration
+    with checkout(pool) as connection:
+        cursor = connection.cursor()
+        try:
+            # Execute query to fetch all users
+            cursor.execute("SELECT user_id, name, email, age FROM user_data")
+            
+            # Fetch and yield rows one by one
+            for row in cursor:
+                yield convert(row)
+        finally:
+            # Clean up
+            cursor.close()
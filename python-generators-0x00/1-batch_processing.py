@@ -2,59 +2,55 @@
 """
 Module for batch processing large data from database using generators
 """
-import sqlite3
+import sys
 
+from pool import checkout
+from query_builder import Query
 
-def stream_users_in_batches(batch_size):
+
+def stream_users_in_batches(batch_size, row_format='dict', query=None, pool=None):
     """
     Generator function that fetches rows from user_data table in batches
     
     Args:
         batch_size (int): Number of rows to fetch per batch
+        row_format (str): 'dict' (default), 'tuple', 'record' or 'columns'
+            (see row_formats)
+        query (Query): Columns and filters to apply in SQLite (default: all
+            columns of all users, see query_builder)
+        pool (ConnectionPool): Pool to check a connection out of (default:
+            a fresh connection for this generator, see pool)
         
     Yields:
-        list: A list of dictionaries containing user data for each batch
+        A batch of user data: a list of rows in row_format, or a
+        ColumnBatch for 'columns'
     """
-    connection = sqlite3.connect('ALX_prodev.db')
-    cursor = connection.cursor()
-    
-    # Execute query to fetch all users
-    cursor.execute("SELECT user_id, name, email, age FROM user_data")
-    
-    # Fetch and yield rows in batches
-    while True:
-        batch = cursor.fetchmany(batch_size)
-        
-        if not batch:
-            break
-            
-        # Convert batch rows to list of dictionaries
-        yield [
-            {
-                'user_id': row[0],
-                'name': row[1],
-                'email': row[2],
-                'age': row[3]
-            }
-            for row in batch
-        ]
-    
-    # Clean up
-    cursor.close()
-    connection.close()
+    query = query or Query()
+    # The connection is given back even if the generator is closed or
+    # garbage collected mid-iteration
+    with checkout(pool) as connection:
+        # Fetch the selected users and yield them in batches
+        yield from query.stream_batches(connection, batch_size, row_format)
 
 
-def batch_processing(batch_size):
+def batch_processing(batch_size, row_format='dict', pool=None):
     """
     Processes batches of users and filters those over the age of 25
     
+    The filter runs in SQLite, so only matching users are fetched, and
+    each batch is written to stdout with one call instead of one print
+    per user.
+    
     Args:
         batch_size (int): Number of rows to process per batch
+        row_format (str): Row format of the batches (see row_formats)
+        pool (ConnectionPool): Pool to check a connection out of (see pool)
     """
+    # Filter users over age 25; ordered by rowid to keep the table order
+    # even when SQLite reads through an index on age
+    query = Query().where('age', '>', 25).order_by('rowid')
+    write = sys.stdout.write
     # Loop 1: Iterate over batches from the generator
-    for batch in stream_users_in_batches(batch_size):
-        # Loop 2: Iterate over users in each batch
-        for user in batch:
-            # Filter users over age 25
-            if user['age'] > 25:
-                print(user)
\ No newline at end of file
+    for batch in stream_users_in_batches(batch_size, row_format, query, pool):
+        # Loop 2: Format the users of each batch
+        write(''.join([f"{user}\n" for user in batch]))
\ No newline at end of file
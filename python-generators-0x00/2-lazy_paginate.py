@@ -1,55 +1,168 @@
 #!/usr/bin/python3
 """
 Module for lazy loading paginated data from database using generators
+
+Pages are read with keyset pagination by default: each page starts
+after the last key of the previous one (WHERE key > ? ORDER BY key
+LIMIT ?), so every page costs one index seek plus page_size rows and a
+full traversal is linear. LIMIT/OFFSET pagination, which skips all
+earlier rows again for every page, is kept behind keyset=False.
 """
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from pool import checkout
+
+DATABASE = 'ALX_prodev.db'
 
+# Keys allowed for keyset pagination (identifiers cannot be bound)
+KEYSET_KEYS = ('rowid', 'user_id')
 
-def paginate_users(page_size, offset):
+
+def _rows_to_dicts(cursor, rows, skip=0):
+    """
+    Converts result rows to dictionaries keyed by column name
+    """
+    columns = [description[0] for description in cursor.description][skip:]
+    return [dict(zip(columns, row[skip:])) for row in rows]
+
+
+def paginate_users(page_size, offset, connection=None, pool=None):
     """
     Fetches a page of users from the database
-    
+
     Args:
         page_size (int): Number of users per page
         offset (int): Starting position for the page
-        
+        connection: Open SQLite connection to reuse (optional)
+        pool (ConnectionPool): Pool to check a connection out of when no
+            connection is given (default: a fresh connection, see pool)
+
     Returns:
         list: List of dictionaries containing user data
     """
-    connection = sqlite3.connect('ALX_prodev.db')
-    connection.row_factory = sqlite3.Row  # Enable dictionary-like access
-    cursor = connection.cursor()
-    
-    cursor.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
+    if connection is None:
+        with checkout(pool, DATABASE) as connection:
+            return paginate_users(page_size, offset, connection)
+    cursor = connection.execute(
+        "SELECT * FROM user_data LIMIT ? OFFSET ?", (page_size, offset)
+    )
+    return _rows_to_dicts(cursor, cursor.fetchall())
+
+
+def paginate_users_after(connection, page_size, last_key=None, key='rowid'):
+    """
+    Fetches the page of users following last_key (keyset pagination)
+
+    Args:
+        connection: Open SQLite connection
+        page_size (int): Number of users per page
+        last_key: Key of the last user of the previous page (None for the first page)
+        key (str): Column to paginate on, one of KEYSET_KEYS
+
+    Returns:
+        tuple: (list of user dictionaries, key of the last user or None)
+    """
+    if key not in KEYSET_KEYS:
+        raise ValueError(f"key must be one of {KEYSET_KEYS}")
+    if last_key is None:
+        cursor = connection.execute(
+            f"SELECT {key}, * FROM user_data ORDER BY {key} LIMIT ?", (page_size,)
+        )
+    else:
+        cursor = connection.execute(
+            f"SELECT {key}, * FROM user_data WHERE {key} > ? ORDER BY {key} LIMIT ?",
+            (last_key, page_size)
+        )
     rows = cursor.fetchall()
-    
-    # Convert Row objects to dictionaries
-    result = [dict(row) for row in rows]
-    
-    connection.close()
-    return result
+    # The first column is the key itself, not part of the user data
+    return _rows_to_dicts(cursor, rows, skip=1), (rows[-1][0] if rows else None)
 
 
-def lazy_pagination(page_size):
+def lazy_pagination(page_size, keyset=True, key='rowid', prefetch=False, database=None,
+                    pool=None):
     """
     Generator function that lazily loads paginated data
     Fetches the next page only when needed
-    
+
+    One connection is opened (or checked out of pool) for the whole life
+    of the generator and given back when it is exhausted, closed or
+    garbage collected.
+
     Args:
         page_size (int): Number of users per page
-        
+        keyset (bool): Use keyset pagination (default) instead of LIMIT/OFFSET
+        key (str): Keyset column, 'rowid' (table order) or 'user_id'
+        prefetch (bool): Fetch the next page in a background thread while
+            the consumer processes the current one
+        database (str): Database file (default: ALX_prodev.db; ignored
+            when pool is given)
+        pool (ConnectionPool): Pool to check the connection out of (see pool)
+
     Yields:
         list: A page (list of dictionaries) of user data
     """
-    offset = 0
-    
-    # Single loop that continues until no more data
-    while True:
-        page = paginate_users(page_size, offset)
-        
-        # Stop if no more data
-        if not page:
-            break
-        
-        yield page
-        offset += page_size
\ No newline at end of file
+    # With prefetch the connection is used by the worker thread only
+    with checkout(pool, database or DATABASE, check_same_thread=not prefetch) as connection:
+        yield from _paginate(connection, page_size, keyset, key, prefetch)
+
+
+def _paginate(connection, page_size, keyset, key, prefetch):
+    """
+    Yields the pages of lazy_pagination from an open connection
+    """
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+    def fetch(position):
+        if keyset:
+            return paginate_users_after(connection, page_size, position, key)
+        page = paginate_users(page_size, position, connection)
+        return page, position + len(page)
+
+    try:
+        position = None if keyset else 0
+        pending = executor.submit(fetch, position) if prefetch else None
+
+        # Single loop that continues until no more data
+        while True:
+            page, position = pending.result() if prefetch else fetch(position)
+
+            # Stop if no more data
+            if not page:
+                break
+
+            if prefetch:
+                pending = executor.submit(fetch, position)
+            yield page
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    # Benchmark: full traversal with OFFSET vs keyset pagination
+    import os
+    import sqlite3
+    import tempfile
+    import time
+
+    import seed
+
+    rows = 100000
+    page_size = 100
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed.create_sample_data(sqlite3.connect(path), rows).close()
+
+    for label, options in [
+        ("offset", {'keyset': False}),
+        ("keyset rowid", {}),
+        ("keyset user_id", {'key': 'user_id'}),
+        ("keyset rowid + prefetch", {'prefetch': True}),
+    ]:
+        started = time.perf_counter()
+        count = 0
+        for page in lazy_pagination(page_size, database=path, **options):
+            count += len(page)
+            # Stand-in for a consumer doing I/O with each page
+            time.sleep(0.0005)
+        print(f"{label:>24}: {count} users in {time.perf_counter() - started:.3f}s")
+    os.remove(path)
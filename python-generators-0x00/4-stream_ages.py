@@ -3,36 +3,42 @@
 Module for memory-efficient aggregation using generators
 Calculates average age without loading entire dataset into memory
 """
-import sqlite3
+from pool import checkout
 
 
-def stream_user_ages():
+def stream_user_ages(pool=None):
     """
     Generator function that yields user ages one by one from the database
     
+    Args:
+        pool (ConnectionPool): Pool to check a connection out of (default:
+            a fresh connection for this generator, see pool)
+    
     Yields:
         int: Age of each user
     """
-    connection = sqlite3.connect('ALX_prodev.db')
-    cursor = connection.cursor()
-    
-    # Execute query to fetch only ages
-    cursor.execute("SELECT age FROM user_data")
-    
-    # Loop 1: Fetch and yield ages one by one
-    for row in cursor:
-        yield row[0]
-    
-    # Clean up
-    cursor.close()
-    connection.close()
+    with checkout(pool) as connection:
+        cursor = connection.cursor()
+        try:
+            # Execute query to fetch only ages
+            cursor.execute("SELECT age FROM user_data")
+            
+            # Loop 1: Fetch and yield ages one by one
+            for row in cursor:
+                yield row[0]
+        finally:
+            # Clean up
+            cursor.close()
 
 
-def calculate_average_age():
+def calculate_average_age(pool=None):
     """
     Calculates the average age of users using the generator
     Memory-efficient as it doesn't load all ages into memory at once
     
+    Args:
+        pool (ConnectionPool): Pool to check a connection out of (see pool)
+    
     Returns:
         float: Average age of all users
     """
@@ -40,7 +46,7 @@ def calculate_average_age():
     count = 0
     
     # Loop 2: Iterate over ages from generator
-    for age in stream_user_ages():
+    for age in stream_user_ages(pool):
         total_age += age
         count += 1
     
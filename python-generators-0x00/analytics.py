@@ -0,0 +1,467 @@
+#!/usr/bin/python3
+"""
+Module for vectorized analytics over the user_data table
+
+Columns are read in chunks of up to CHUNK_SIZE rows into NumPy arrays
+and aggregated with vectorized kernels; per-chunk results are merged as
+the stream goes, so memory stays bounded by one chunk. SQLite joins each
+chunk into one string (group_concat over a rowid range) that NumPy
+parses, so no Python object is created per row:
+
+- count, sum, mean and variance (exact integer sums, Chan et al. merge
+  of the second moments)
+- exact quantiles and histograms for integer columns, from merged value
+  counts (np.bincount)
+- grouped counts by age band
+
+Aggregates SQLite can compute itself (COUNT, SUM, MIN, MAX, GROUP BY
+age or the email domain) are pushed down into SQL instead: only the
+result is transferred. summarize() by default only fetches the value
+counts of the column and derives everything else from them; with the
+index from ensure_indexes() that is a scan of a narrow index.
+
+column_chunks() and summarize() can also read a columnar snapshot
+(snapshot.py) instead of the table: the chunks are then zero-copy views
+of the mapped file.
+
+NumPy is only needed for the vectorized functions; the SQL ones work
+without it.
+"""
+import sqlite3
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DATABASE = 'ALX_prodev.db'
+
+# Rowids per chunk (a chunk holds at most this many rows)
+CHUNK_SIZE = 65536
+
+# Columns that may be aggregated (identifiers cannot be bound)
+NUMERIC_COLUMNS = ('age',)
+
+
+def _require_numpy():
+    """
+    Raises ImportError with install instructions when NumPy is missing
+    """
+    if np is None:
+        raise ImportError(
+            "analytics needs NumPy for vectorized aggregation: pip install numpy"
+        )
+
+
+def _connect(connection):
+    """
+    Returns (connection, whether the caller must close it)
+    """
+    if connection is not None:
+        return connection, False
+    return sqlite3.connect(DATABASE), True
+
+
+def _check_column(column):
+    if column not in NUMERIC_COLUMNS:
+        raise ValueError(f"column must be one of {NUMERIC_COLUMNS}")
+
+
+def column_chunks(column='age', chunk_size=CHUNK_SIZE, connection=None, snapshot=None):
+    """
+    Generator that yields a numeric column in chunks
+
+    Args:
+        column (str): Column name, one of NUMERIC_COLUMNS
+        chunk_size (int): Maximum rows per chunk
+        connection: Open SQLite connection (optional)
+        snapshot (Snapshot): Read the column from this snapshot instead
+        counts: (values, counts) of the column, already computed
+
+    Yields:
+        numpy.ndarray: int64 array of up to chunk_size values
+    """
+    _require_numpy()
+    _check_column(column)
+    if snapshot is not None:
+        values = snapshot.column(column)
+        for start in range(0, len(values), chunk_size):
+            yield values[start:start + chunk_size]
+        return
+    connection, own_connection = _connect(connection)
+    # One read transaction: every chunk sees the same table
+    opened = not connection.in_transaction
+    if opened:
+        connection.execute("BEGIN")
+    try:
+        first, last = connection.execute(
+            "SELECT MIN(rowid), MAX(rowid) FROM user_data"
+        ).fetchone()
+        if last is None:
+            return
+        # SQLite joins each rowid range into one string, parsed by NumPy:
+        # no Python object per row
+        query = (
+            f"SELECT COUNT({column}), group_concat({column}) FROM user_data "
+            "WHERE rowid >= ? AND rowid < ?"
+        )
+        for start in range(first, last + 1, chunk_size):
+            count, text = connection.execute(query, (start, start + chunk_size)).fetchone()
+            if count:
+                yield np.fromstring(text, dtype=np.int64, count=count, sep=',')
+    finally:
+        if opened:
+            connection.rollback()
+        if own_connection:
+            connection.close()
+
+
+class IntegerSummary:
+    """
+    Streaming summary of an integer column
+
+    Each update is vectorized over a chunk; merging two summaries is exact
+    for count, sum and value counts and numerically stable for the
+    variance (Chan et al.).
+    """
+
+    def __init__(self):
+        _require_numpy()
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.offset = None
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_value_counts(cls, values, counts):
+        """
+        Builds a summary from distinct values and their counts, e.g. the
+        result of a GROUP BY pushed down to SQL
+        """
+        summary = cls()
+        values = np.asarray(values, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        if not counts.sum():
+            return summary
+        summary.count = int(counts.sum())
+        summary.total = int((values * counts).sum())
+        summary.mean = summary.total / summary.count
+        summary.m2 = float((counts * np.square(values - summary.mean)).sum())
+        summary.offset = int(values.min())
+        summary.counts = np.bincount(values - summary.offset, weights=counts).astype(np.int64)
+        return summary
+
+    def update(self, values):
+        """
+        Adds a chunk (1-d integer array) to the summary
+        """
+        if not len(values):
+            return
+        chunk = IntegerSummary()
+        chunk.count = len(values)
+        # Python int: exact whatever the number of chunks
+        chunk.total = int(values.sum())
+        chunk.mean = chunk.total / chunk.count
+        chunk.m2 = float(np.square(values - chunk.mean).sum())
+        chunk.offset = int(values.min())
+        chunk.counts = np.bincount(values - chunk.offset)
+        self.merge(chunk)
+
+    def merge(self, other):
+        """
+        Merges another summary into this one
+        """
+        if not other.count:
+            return
+        if self.count:
+            delta = other.mean - self.mean
+            count = self.count + other.count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        else:
+            self.m2 = other.m2
+        self.count += other.count
+        self.total += other.total
+        self.mean = self.total / self.count
+
+        if self.offset is None:
+            self.offset, self.counts = other.offset, other.counts.copy()
+            return
+        offset = min(self.offset, other.offset)
+        size = max(self.offset + len(self.counts), other.offset + len(other.counts)) - offset
+        counts = np.zeros(size, dtype=np.int64)
+        counts[self.offset - offset:self.offset - offset + len(self.counts)] += self.counts
+        counts[other.offset - offset:other.offset - offset + len(other.counts)] += other.counts
+        self.offset, self.counts = offset, counts
+
+    @property
+    def variance(self):
+        """
+        Population variance
+        """
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def minimum(self):
+        return self.offset if self.count else None
+
+    @property
+    def maximum(self):
+        return self.offset + len(self.counts) - 1 if self.count else None
+
+    def quantiles(self, probabilities):
+        """
+        Exact quantiles with linear interpolation (numpy.quantile's default
+        method) computed from the value counts
+
+        Args:
+            probabilities: Iterable of values in [0, 1]
+
+        Returns:
+            list: One float per probability
+        """
+        if not self.count:
+            return [None for _ in probabilities]
+        cumulative = np.cumsum(self.counts)
+        values = np.arange(self.offset, self.offset + len(self.counts))
+        positions = np.asarray(list(probabilities), dtype=np.float64) * (self.count - 1)
+        lower = np.floor(positions)
+        # The values at sorted ranks lower and lower + 1
+        below = values[np.searchsorted(cumulative, lower, side='right')]
+        above = values[np.searchsorted(
+            cumulative, np.minimum(lower + 1, self.count - 1), side='right'
+        )]
+        return [float(v) for v in below + (above - below) * (positions - lower)]
+
+    def histogram(self, edges):
+        """
+        Counts per bin, like numpy.histogram (the last bin includes its
+        right edge)
+
+        Args:
+            edges: Increasing bin edges
+
+        Returns:
+            list: Counts of the len(edges) - 1 bins
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        if not self.count:
+            return [0] * (len(edges) - 1)
+        values = np.arange(self.offset, self.offset + len(self.counts))
+        counts, _ = np.histogram(values, bins=edges, weights=self.counts)
+        return [int(c) for c in counts]
+
+    def band_counts(self, width):
+        """
+        Counts per band of the given width
+
+        Returns:
+            dict: {band start: count} for non-empty bands
+        """
+        if not self.count:
+            return {}
+        values = np.arange(self.offset, self.offset + len(self.counts))
+        bands = np.bincount(values // width - self.offset // width, weights=self.counts)
+        first = self.offset // width
+        return {
+            int((first + i) * width): int(count)
+            for i, count in enumerate(bands)
+            if count
+        }
+
+
+def value_counts(column='age', connection=None):
+    """
+    Distinct values of a column and their counts, grouped by SQLite
+
+    Returns:
+        tuple: (values, counts) as int64 arrays
+    """
+    _require_numpy()
+    _check_column(column)
+    connection, own_connection = _connect(connection)
+    try:
+        rows = connection.execute(
+            f"SELECT {column}, COUNT(*) FROM user_data "
+            f"WHERE {column} IS NOT NULL GROUP BY {column}"
+        ).fetchall()
+    finally:
+        if own_connection:
+            connection.close()
+    table = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return table[:, 0], table[:, 1]
+
+
+def summarize(column='age', quantiles=(0.25, 0.5, 0.75), edges=None, band_width=10,
+              pushdown=True, chunk_size=CHUNK_SIZE, connection=None, snapshot=None,
+              counts=None):
+    """
+    Computes the summary statistics of a numeric column
+
+    With pushdown the value counts come from SQLite (see value_counts)
+    and everything else is computed from them; without it the column is
+    streamed in chunks. A snapshot is always streamed, as its chunks are
+    already arrays in memory. Value counts the caller already holds
+    (e.g. a materialized histogram) are used without reading the table.
+
+    Args:
+        column (str): Column name, one of NUMERIC_COLUMNS
+        quantiles: Probabilities of the quantiles to compute
+        edges: Histogram bin edges (default: bands of band_width)
+        band_width (int): Width of the grouped counts' bands
+        pushdown (bool): Group by value in SQL instead of streaming rows
+        chunk_size (int): Rows per chunk when streaming
+        connection: Open SQLite connection (optional)
+        snapshot (Snapshot): Read the column from this snapshot instead
+        counts: (values, counts) of the column, already computed
+
+    Returns:
+        dict: count, mean, variance, std, min, max, quantiles, histogram
+        and bands
+    """
+    if counts is not None:
+        summary = IntegerSummary.from_value_counts(*counts)
+    elif pushdown and snapshot is None:
+        summary = IntegerSummary.from_value_counts(*value_counts(column, connection))
+    else:
+        summary = IntegerSummary()
+        for values in column_chunks(column, chunk_size, connection, snapshot):
+            summary.update(values)
+
+    if edges is None and summary.count:
+        edges = list(range(
+            summary.minimum // band_width * band_width,
+            summary.maximum // band_width * band_width + band_width + 1,
+            band_width
+        ))
+    return {
+        'count': summary.count,
+        'mean': summary.total / summary.count if summary.count else 0,
+        'variance': summary.variance,
+        'std': summary.variance ** 0.5,
+        'min': summary.minimum,
+        'max': summary.maximum,
+        'quantiles': dict(zip(quantiles, summary.quantiles(quantiles))),
+        'histogram': {'edges': edges, 'counts': summary.histogram(edges)} if edges else None,
+        'bands': summary.band_counts(band_width),
+    }
+
+
+def ensure_indexes(connection=None):
+    """
+    Creates the index the pushed-down aggregates scan instead of the table
+    """
+    connection, own_connection = _connect(connection)
+    try:
+        for column in NUMERIC_COLUMNS:
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_user_data_{column} ON user_data({column})"
+            )
+        connection.commit()
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def sql_aggregates(column='age', connection=None):
+    """
+    Count, sum, min, max and mean computed by SQLite (no NumPy needed)
+
+    Returns:
+        dict: count, sum, min, max and mean of the column
+    """
+    _check_column(column)
+    connection, own_connection = _connect(connection)
+    try:
+        # MIN and MAX as subqueries are single index seeks instead of
+        # extra work on every row of the scan
+        count, total, minimum, maximum = connection.execute(
+            f"SELECT COUNT({column}), SUM({column}), "
+            f"(SELECT MIN({column}) FROM user_data), (SELECT MAX({column}) FROM user_data) "
+            "FROM user_data"
+        ).fetchone()
+    finally:
+        if own_connection:
+            connection.close()
+    return {
+        'count': count,
+        'sum': total or 0,
+        'min': minimum,
+        'max': maximum,
+        # Integer sum / count: the same float as calculate_average_age
+        'mean': total / count if count else 0,
+    }
+
+
+def average_age(connection=None):
+    """
+    Average age of all users, pushed down to SQL
+
+    Returns:
+        float: Same value as 4-stream_ages.calculate_average_age()
+    """
+    return sql_aggregates('age', connection)['mean']
+
+
+def count_by_email_domain(limit=None, connection=None):
+    """
+    Number of users per email domain, grouped by SQLite
+
+    Args:
+        limit (int): Only return the most common domains (optional)
+
+    Returns:
+        dict: {domain: count}, most common first
+    """
+    connection, own_connection = _connect(connection)
+    query = (
+        "SELECT lower(substr(email, instr(email, '@') + 1)) AS domain, COUNT(*) AS users "
+        "FROM user_data GROUP BY domain ORDER BY users DESC, domain"
+    )
+    try:
+        if limit is not None:
+            rows = connection.execute(query + " LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = connection.execute(query).fetchall()
+    finally:
+        if own_connection:
+            connection.close()
+    return dict(rows)
+
+
+if __name__ == "__main__":
+    # Benchmark against 4-stream_ages.calculate_average_age
+    import importlib
+    import os
+    import tempfile
+    import time
+
+    import seed
+
+    rows = 1000000
+    os.chdir(tempfile.mkdtemp())
+    seed.create_sample_data(sqlite3.connect(DATABASE), rows).close()
+
+    ensure_indexes()
+    stream_ages = importlib.import_module('4-stream_ages')
+
+    def timed(label, function, baseline=None):
+        # Best of three runs, so every function reads a warm page cache
+        elapsed = []
+        for _ in range(3):
+            started = time.perf_counter()
+            result = function()
+            elapsed.append(time.perf_counter() - started)
+        speedup = f" ({baseline / min(elapsed):.1f}x)" if baseline else ""
+        print(f"{label:>38}: {min(elapsed):.3f}s{speedup}")
+        return min(elapsed)
+
+    baseline = timed("calculate_average_age (loop)", stream_ages.calculate_average_age)
+    timed("average_age (SQL)", average_age, baseline)
+    timed("summarize (value counts in SQL)", summarize, baseline)
+    timed("summarize (streamed NumPy chunks)", lambda: summarize(pushdown=False), baseline)
+    timed("count_by_email_domain (SQL)", count_by_email_domain)
+    summary = summarize()
+    print(f"mean {summary['mean']:.4f}, std {summary['std']:.4f}, "
+          f"quartiles {summary['quantiles']}")
@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+"""
+Module with asyncio counterparts of the user_data streaming generators
+
+sqlite3 calls block, so awaiting them directly from a coroutine stalls
+the event loop. Every async generator here owns one connection on a
+dedicated executor thread: the connection is opened, used and closed on
+that thread, and while the consumer handles one batch the next one is
+already being fetched there.
+
+Batches are converted to their row format on the executor thread too,
+so the loop only receives ready-made lists.
+
+Closing or cancelling a generator (aclose(), break out of async for,
+task.cancel()) closes the cursor and the connection on their thread,
+after any fetch still running there, without blocking the loop.
+"""
+import asyncio
+import importlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from query_builder import Query
+
+DATABASE = 'ALX_prodev.db'
+
+
+class _SQLiteThread:
+    """
+    A connection and the single thread allowed to use it
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.connection = None
+        self.cursor = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+
+    def call(self, function, *args):
+        """
+        Runs function(*args) on the connection thread; returns an awaitable
+        """
+        return asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _connect(self):
+        self.connection = sqlite3.connect(self.database)
+
+    def _close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+        if self.connection is not None:
+            self.connection.close()
+
+    async def open(self):
+        await self.call(self._connect)
+
+    def close(self):
+        """
+        Schedules the cleanup behind any running call and releases the
+        thread once it is done, without waiting
+        """
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+
+async def _prefetched(thread, fetch):
+    """
+    Yields the results of fetch() run on thread until one is empty,
+    fetching the next one while the consumer handles the current one
+    """
+    pending = thread.call(fetch)
+    try:
+        while True:
+            batch = await pending
+            if not batch:
+                break
+            pending = thread.call(fetch)
+            yield batch
+    finally:
+        # Drops a fetch that has not started; a running one finishes
+        # before the cleanup scheduled by close()
+        pending.cancel()
+        thread.close()
+
+
+async def async_stream_users_in_batches(batch_size, row_format='dict', query=None,
+                                        database=None):
+    """
+    Async generator counterpart of stream_users_in_batches
+
+    Args:
+        batch_size (int): Number of rows to fetch per batch
+        row_format (str): Row format of the batches (see row_formats)
+        query (Query): Columns and filters to apply in SQLite (see query_builder)
+        database (str): Database file (default: ALX_prodev.db)
+
+    Yields:
+        A batch of user data in row_format
+    """
+    query = query or Query()
+    convert = query.batch_converter(row_format)
+    thread = _SQLiteThread(database or DATABASE)
+
+    def execute():
+        thread._connect()
+        thread.cursor = thread.connection.execute(*query.compile())
+
+    def fetch():
+        return convert(thread.cursor.fetchmany(batch_size))
+
+    try:
+        await thread.call(execute)
+    except BaseException:
+        thread.close()
+        raise
+    # Closed explicitly: a consumer that stops while handling a batch
+    # leaves this generator suspended, and garbage collection would
+    # release the thread and connection only some time later
+    batches = _prefetched(thread, fetch)
+    try:
+        async for batch in batches:
+            yield batch
+    finally:
+        await batches.aclose()
+
+
+async def async_stream_users(row_format='dict', batch_size=1000, database=None):
+    """
+    Async generator counterpart of stream_users
+
+    Rows are fetched batch_size at a time on the connection thread and
+    yielded one by one.
+
+    Args:
+        row_format (str): Row format (see row_formats)
+        batch_size (int): Number of rows fetched per executor call
+        database (str): Database file (default: ALX_prodev.db)
+
+    Yields:
+        A row of user data in row_format
+    """
+    batches = async_stream_users_in_batches(batch_size, row_format, database=database)
+    try:
+        async for batch in batches:
+            for user in batch:
+                yield user
+    finally:
+        await batches.aclose()
+
+
+async def async_lazy_pagination(page_size, key='rowid', database=None):
+    """
+    Async generator counterpart of lazy_pagination (keyset pagination)
+
+    Args:
+        page_size (int): Number of users per page
+        key (str): Keyset column, 'rowid' (table order) or 'user_id'
+        database (str): Database file (default: ALX_prodev.db)
+
+    Yields:
+        list: A page (list of dictionaries) of user data
+    """
+    paginate = importlib.import_module('2-lazy_paginate')
+    if key not in paginate.KEYSET_KEYS:
+        raise ValueError(f"key must be one of {paginate.KEYSET_KEYS}")
+    thread = _SQLiteThread(database or DATABASE)
+    last_key = None
+
+    def fetch():
+        nonlocal last_key
+        page, last_key = paginate.paginate_users_after(
+            thread.connection, page_size, last_key, key
+        )
+        return page
+
+    try:
+        await thread.open()
+    except BaseException:
+        thread.close()
+        raise
+    pages = _prefetched(thread, fetch)
+    try:
+        async for page in pages:
+            yield page
+    finally:
+        await pages.aclose()
+
+
+if __name__ == "__main__":
+    # Benchmark: event loop latency while streaming, blocking vs async
+    import os
+    import sys
+    import tempfile
+    import time
+
+    import seed
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    batch_size = 10000
+    os.chdir(tempfile.mkdtemp())
+    seed.create_sample_data(sqlite3.connect(DATABASE), rows).close()
+
+    batches = importlib.import_module('1-batch_processing')
+
+    async def blocking():
+        count = 0
+        for batch in batches.stream_users_in_batches(batch_size):
+            count += len(batch)
+            await asyncio.sleep(0)
+        return count
+
+    async def streamed():
+        count = 0
+        async for batch in async_stream_users_in_batches(batch_size):
+            count += len(batch)
+        return count
+
+    async def measure(consumer):
+        # A task that wants to run every millisecond records how late it is
+        lateness = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                expected = time.perf_counter() + 0.001
+                await asyncio.sleep(0.001)
+                lateness.append(time.perf_counter() - expected)
+
+        tick = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        count = await consumer()
+        elapsed = time.perf_counter() - started
+        done.set()
+        await tick
+        lateness.sort()
+        p99 = lateness[int(len(lateness) * 0.99)] * 1000
+        print(f"{consumer.__name__:>9}: {count / elapsed:>10,.0f} rows/s, "
+              f"loop lateness p99 {p99:.1f} ms, max {lateness[-1] * 1000:.1f} ms")
+
+    async def main():
+        await measure(blocking)
+        await measure(streamed)
+
+        # Cancelling mid-stream closes the connection
+        async def cancelled():
+            async for _ in async_stream_users():
+                await asyncio.sleep(0)
+        task = asyncio.create_task(cancelled())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        print(f"cancelled: {task.cancelled()}")
+
+    asyncio.run(main())
@@ -0,0 +1,409 @@
+#!/usr/bin/python3
+"""
+Module for incrementally maintained aggregates of user_data ages
+
+install() creates two side tables and keeps them current with triggers
+on user_data:
+
+- user_data_stats: one row with the count, sum and sum of squares of
+  the ages
+- user_data_age_histogram: the number of users of each age
+
+Every insert (INSERT OR REPLACE and UPSERT included), delete and update
+of an age adjusts them, so the average, the variance and the histogram
+are read in O(1) (O(distinct ages) for the histogram) instead of
+scanning the table. Sums are SQLite integers and the variance is
+computed with Python integers, so results match a full scan exactly.
+summarize() builds the full analytics summary from the histogram.
+
+seed.insert_data() drops the triggers while it bulk loads an empty
+table and rebuilds the aggregates once at the end.
+
+Command line:
+
+    python3 materialized_aggregates.py install|rebuild|verify|uninstall [--database FILE]
+    python3 materialized_aggregates.py benchmark
+"""
+import sqlite3
+
+import analytics
+
+DATABASE = 'ALX_prodev.db'
+
+STATS_TABLE = 'user_data_stats'
+HISTOGRAM_TABLE = 'user_data_age_histogram'
+# Rows about to be replaced by INSERT OR REPLACE, keyed by user_id
+REPLACED_TABLE = 'user_data_replaced'
+
+# REPLACE deletes the conflicting row without firing delete triggers
+# (unless PRAGMA recursive_triggers is on for that connection), so the
+# row is saved before every insert and subtracted after it. UPSERT and
+# INSERT OR IGNORE conflicts fire no AFTER INSERT trigger: the saved row
+# is dropped by the update trigger, or replaced before the next insert.
+TRIGGERS = {
+    'user_data_stats_before_insert': f"""
+        CREATE TRIGGER user_data_stats_before_insert BEFORE INSERT ON user_data
+        BEGIN
+            DELETE FROM {REPLACED_TABLE} WHERE user_id = NEW.user_id;
+            INSERT INTO {REPLACED_TABLE} (user_id, age)
+                SELECT user_id, age FROM user_data WHERE user_id = NEW.user_id;
+        END
+    """,
+    'user_data_stats_insert': f"""
+        CREATE TRIGGER user_data_stats_insert AFTER INSERT ON user_data
+        BEGIN
+            UPDATE {STATS_TABLE} SET count = count - 1,
+                total = total - (SELECT age FROM {REPLACED_TABLE} WHERE user_id = NEW.user_id),
+                total_squares = total_squares
+                    - (SELECT age * age FROM {REPLACED_TABLE} WHERE user_id = NEW.user_id)
+                WHERE EXISTS (SELECT 1 FROM {REPLACED_TABLE} WHERE user_id = NEW.user_id);
+            UPDATE {HISTOGRAM_TABLE} SET count = count - 1
+                WHERE age = (SELECT age FROM {REPLACED_TABLE} WHERE user_id = NEW.user_id);
+            DELETE FROM {HISTOGRAM_TABLE} WHERE count = 0
+                AND age = (SELECT age FROM {REPLACED_TABLE} WHERE user_id = NEW.user_id);
+            DELETE FROM {REPLACED_TABLE} WHERE user_id = NEW.user_id;
+            UPDATE {STATS_TABLE} SET count = count + 1, total = total + NEW.age,
+                total_squares = total_squares + NEW.age * NEW.age;
+            INSERT INTO {HISTOGRAM_TABLE} (age, count) VALUES (NEW.age, 1)
+                ON CONFLICT(age) DO UPDATE SET count = count + 1;
+        END
+    """,
+    'user_data_stats_delete': f"""
+        CREATE TRIGGER user_data_stats_delete AFTER DELETE ON user_data
+        BEGIN
+            UPDATE {STATS_TABLE} SET count = count - 1, total = total - OLD.age,
+                total_squares = total_squares - OLD.age * OLD.age;
+            UPDATE {HISTOGRAM_TABLE} SET count = count - 1 WHERE age = OLD.age;
+            DELETE FROM {HISTOGRAM_TABLE} WHERE age = OLD.age AND count = 0;
+            -- With recursive_triggers on, REPLACE subtracts the row here
+            DELETE FROM {REPLACED_TABLE} WHERE user_id = OLD.user_id;
+        END
+    """,
+    'user_data_stats_update': f"""
+        CREATE TRIGGER user_data_stats_update AFTER UPDATE OF age ON user_data
+        WHEN OLD.age IS NOT NEW.age
+        BEGIN
+            UPDATE {STATS_TABLE} SET total = total - OLD.age + NEW.age,
+                total_squares = total_squares - OLD.age * OLD.age + NEW.age * NEW.age;
+            UPDATE {HISTOGRAM_TABLE} SET count = count - 1 WHERE age = OLD.age;
+            DELETE FROM {HISTOGRAM_TABLE} WHERE age = OLD.age AND count = 0;
+            INSERT INTO {HISTOGRAM_TABLE} (age, count) VALUES (NEW.age, 1)
+                ON CONFLICT(age) DO UPDATE SET count = count + 1;
+        END
+    """,
+    'user_data_stats_upserted': f"""
+        CREATE TRIGGER user_data_stats_upserted AFTER UPDATE ON user_data
+        WHEN EXISTS (SELECT 1 FROM {REPLACED_TABLE} WHERE user_id = OLD.user_id)
+        BEGIN
+            DELETE FROM {REPLACED_TABLE} WHERE user_id = OLD.user_id;
+        END
+    """,
+}
+
+
+def is_installed(connection):
+    """
+    Returns whether the aggregate tables exist
+    """
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (STATS_TABLE,)
+    ).fetchone() is not None
+
+
+def _scan(connection):
+    """
+    Computes the aggregates with a full scan of user_data
+
+    Returns:
+        tuple: (count, total, total_squares, {age: count})
+    """
+    histogram = dict(connection.execute(
+        "SELECT age, COUNT(*) FROM user_data GROUP BY age"
+    ).fetchall())
+    return (
+        sum(histogram.values()),
+        sum(age * count for age, count in histogram.items()),
+        sum(age * age * count for age, count in histogram.items()),
+        histogram,
+    )
+
+
+def rebuild(connection):
+    """
+    Recomputes the aggregate tables from a full scan of user_data
+
+    The scan and the writes run in one BEGIN IMMEDIATE transaction, so no
+    other connection can change user_data in between. Inside a caller's
+    transaction they run as part of it and the caller commits.
+    """
+    own_transaction = not connection.in_transaction
+    if own_transaction:
+        connection.execute("BEGIN IMMEDIATE")
+    try:
+        count, total, total_squares, histogram = _scan(connection)
+        connection.execute(f"DELETE FROM {STATS_TABLE}")
+        connection.execute(
+            f"INSERT INTO {STATS_TABLE} (id, count, total, total_squares) VALUES (1, ?, ?, ?)",
+            (count, total, total_squares)
+        )
+        connection.execute(f"DELETE FROM {HISTOGRAM_TABLE}")
+        connection.executemany(
+            f"INSERT INTO {HISTOGRAM_TABLE} (age, count) VALUES (?, ?)", histogram.items()
+        )
+        connection.execute(f"DELETE FROM {REPLACED_TABLE}")
+    except BaseException:
+        if own_transaction:
+            connection.rollback()
+        raise
+    if own_transaction:
+        connection.commit()
+
+
+def install(connection):
+    """
+    Creates the aggregate tables and their triggers, and fills the tables
+    from the current contents of user_data
+    """
+    with connection:
+        connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                count INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                total_squares INTEGER NOT NULL
+            )
+        """)
+        connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {HISTOGRAM_TABLE} (
+                age INTEGER PRIMARY KEY,
+                count INTEGER NOT NULL
+            )
+        """)
+        connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {REPLACED_TABLE} (
+                user_id TEXT PRIMARY KEY,
+                age INTEGER NOT NULL
+            )
+        """)
+        # Recreated so an upgrade picks up changed trigger definitions
+        for name, sql in TRIGGERS.items():
+            connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+            connection.execute(sql)
+    rebuild(connection)
+
+
+def drop_triggers(connection):
+    """
+    Drops the maintenance triggers, e.g. for a bulk load; install() puts
+    them back and rebuilds the aggregates
+
+    Returns:
+        bool: Whether the aggregates were installed
+    """
+    installed = is_installed(connection)
+    with connection:
+        for name in TRIGGERS:
+            connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+    return installed
+
+
+def uninstall(connection):
+    """
+    Drops the triggers and the aggregate tables
+    """
+    drop_triggers(connection)
+    with connection:
+        connection.execute(f"DROP TABLE IF EXISTS {STATS_TABLE}")
+        connection.execute(f"DROP TABLE IF EXISTS {HISTOGRAM_TABLE}")
+        connection.execute(f"DROP TABLE IF EXISTS {REPLACED_TABLE}")
+
+
+def stats(connection):
+    """
+    Returns the materialized count, total and total_squares of the ages
+    """
+    row = connection.execute(
+        f"SELECT count, total, total_squares FROM {STATS_TABLE}"
+    ).fetchone()
+    return dict(zip(('count', 'total', 'total_squares'), row or (0, 0, 0)))
+
+
+def average_age(connection):
+    """
+    Returns the average age of users in O(1)
+
+    Returns:
+        float: The same value as calculate_average_age() (0 for no users)
+    """
+    values = stats(connection)
+    return values['total'] / values['count'] if values['count'] else 0
+
+
+def age_variance(connection):
+    """
+    Returns the population variance of the ages in O(1)
+    """
+    values = stats(connection)
+    count = values['count']
+    if not count:
+        return 0.0
+    # Exact integer arithmetic until the final division
+    return (count * values['total_squares'] - values['total'] ** 2) / count ** 2
+
+
+def age_histogram(connection):
+    """
+    Returns the number of users of each age
+
+    Returns:
+        dict: age -> count, in age order
+    """
+    return dict(connection.execute(
+        f"SELECT age, count FROM {HISTOGRAM_TABLE} WHERE count > 0 ORDER BY age"
+    ).fetchall())
+
+
+def summarize(connection, **options):
+    """
+    Returns analytics.summarize() of the ages, computed from the
+    materialized histogram in O(distinct ages) instead of a scan
+
+    Args:
+        connection: Open SQLite connection with the aggregates installed
+        **options: quantiles, edges and band_width, as for
+            analytics.summarize()
+
+    Returns:
+        dict: The same summary as analytics.summarize(connection=...)
+    """
+    histogram = age_histogram(connection)
+    return analytics.summarize(
+        'age', counts=(list(histogram), list(histogram.values())), **options
+    )
+
+
+def verify(connection):
+    """
+    Compares the aggregate tables with a full scan of user_data
+
+    Returns:
+        dict: name -> (materialized, scanned) for every value that differs;
+        empty when the aggregates are consistent
+    """
+    count, total, total_squares, histogram = _scan(connection)
+    materialized = stats(connection)
+    differences = {
+        name: (materialized[name], scanned)
+        for name, scanned in (
+            ('count', count), ('total', total), ('total_squares', total_squares)
+        )
+        if materialized[name] != scanned
+    }
+    stored = age_histogram(connection)
+    for age in sorted(set(stored) | set(histogram)):
+        if stored.get(age, 0) != histogram.get(age, 0):
+            differences[f'age {age}'] = (stored.get(age, 0), histogram.get(age, 0))
+    return differences
+
+
+def _benchmark():
+    """
+    Compares calculate_average_age with the materialized average, and
+    checks the aggregates against a full scan after a random workload
+    """
+    import importlib
+    import os
+    import random
+    import tempfile
+    import time
+
+    import seed
+
+    rows = 1000000
+    os.chdir(tempfile.mkdtemp())
+    connection = seed.create_sample_data(sqlite3.connect(DATABASE), rows)
+
+    def timed(label, function):
+        started = time.perf_counter()
+        result = function()
+        print(f"{label:>36}: {time.perf_counter() - started:.6f}s")
+        return result
+
+    timed("install (initial rebuild)", lambda: install(connection))
+    stream_ages = importlib.import_module('4-stream_ages')
+    expected = timed("calculate_average_age (full scan)", stream_ages.calculate_average_age)
+    assert timed("average_age (materialized)", lambda: average_age(connection)) == expected
+    timed("age_variance (materialized)", lambda: age_variance(connection))
+    timed("age_histogram (materialized)", lambda: age_histogram(connection))
+    summary = timed("summarize (materialized)", lambda: summarize(connection))
+    assert summary == timed(
+        "analytics.summarize (GROUP BY)", lambda: analytics.summarize(connection=connection)
+    )
+
+    # Random inserts, replaces, updates and deletes, maintained by the triggers
+    generator = random.Random(0)
+    operations = 20000
+    started = time.perf_counter()
+    with connection:
+        for i in range(operations):
+            choice = generator.random()
+            user = f"{generator.randrange(rows):036d}"
+            if choice < 0.4:
+                connection.execute(
+                    "INSERT INTO user_data VALUES (?, ?, ?, ?)",
+                    (f"new-{i}", f"new {i}", f"new{i}@example.com", generator.randint(18, 120))
+                )
+            elif choice < 0.5:
+                connection.execute(
+                    "INSERT OR REPLACE INTO user_data VALUES (?, ?, ?, ?)",
+                    (user, f"replaced {i}", f"replaced{i}@example.com", generator.randint(18, 120))
+                )
+            elif choice < 0.8:
+                connection.execute(
+                    "UPDATE user_data SET age = ? WHERE user_id = ?",
+                    (generator.randint(18, 120), user)
+                )
+            else:
+                connection.execute("DELETE FROM user_data WHERE user_id = ?", (user,))
+    elapsed = time.perf_counter() - started
+    print(f"{'random writes with triggers':>36}: {operations / elapsed:,.0f} writes/s")
+    differences = timed("verify (full scan)", lambda: verify(connection))
+    assert not differences, differences
+    assert average_age(connection) == stream_ages.calculate_average_age()
+    print("materialized aggregates match a full scan")
+    connection.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        'command', choices=('install', 'rebuild', 'verify', 'uninstall', 'benchmark')
+    )
+    parser.add_argument('--database', default=DATABASE)
+    arguments = parser.parse_args()
+
+    if arguments.command == 'benchmark':
+        _benchmark()
+    else:
+        connection = sqlite3.connect(arguments.database)
+        try:
+            if arguments.command == 'install':
+                install(connection)
+                print(f"Aggregates installed: {stats(connection)}")
+            elif arguments.command == 'rebuild':
+                rebuild(connection)
+                print(f"Aggregates rebuilt: {stats(connection)}")
+            elif arguments.command == 'uninstall':
+                uninstall(connection)
+                print("Aggregates removed")
+            else:
+                differences = verify(connection)
+                for name, (materialized, scanned) in differences.items():
+                    print(f"{name}: materialized {materialized}, full scan {scanned}")
+                print("Aggregates are consistent" if not differences else
+                      f"{len(differences)} values differ; run rebuild")
+                raise SystemExit(1 if differences else 0)
+        finally:
+            connection.close()
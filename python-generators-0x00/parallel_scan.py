@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""
+Module for scanning user_data in parallel across a process pool
+
+The table is split into chunks of rowid or user_id ranges. Each worker
+process opens its own read-only connection once, streams the chunks it
+is given in batches and applies a user-supplied function to every row.
+parallel_scan() merges the results into one iterator, in table order or
+in completion order.
+
+Only max_pending chunks are in flight at a time: a new chunk is sent to
+the pool when the consumer takes the results of a finished one, so a
+slow consumer stalls the scan instead of letting results pile up, and
+memory stays bounded by max_pending * chunk_rows results.
+
+The function must be picklable (defined at module level). Chunks are
+read at different times, so the scan is not a snapshot of the table if
+it is written to meanwhile.
+"""
+import hashlib
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from row_formats import batch_converter
+
+DATABASE = 'ALX_prodev.db'
+
+SCAN_KEYS = ('rowid', 'user_id')
+
+# Connection of a worker process, opened by _open_worker
+_connection = None
+
+
+def _open_worker(database):
+    """
+    Opens the read-only connection of a worker process
+    """
+    global _connection
+    _connection = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+
+
+def chunk_ranges(connection, chunk_rows, key='rowid'):
+    """
+    Splits user_data into [low, high) ranges of about chunk_rows rows
+
+    Args:
+        connection: Open SQLite connection
+        chunk_rows (int): Rows per range
+        key (str): 'rowid' (table order) or 'user_id'
+
+    Returns:
+        list: (low, high) tuples in key order; high is None for the last one
+    """
+    if key not in SCAN_KEYS:
+        raise ValueError(f"key must be one of {SCAN_KEYS}")
+    if key == 'rowid':
+        low, high = connection.execute(
+            "SELECT MIN(rowid), MAX(rowid) FROM user_data"
+        ).fetchone()
+        if low is None:
+            return []
+        bounds = list(range(low, high + 1, chunk_rows))
+    else:
+        # One pass over the user_id index: every chunk_rows-th key
+        bounds = [row[0] for row in connection.execute(
+            "SELECT user_id FROM (SELECT user_id, "
+            "row_number() OVER (ORDER BY user_id) - 1 AS position FROM user_data) "
+            "WHERE position % ? = 0", (chunk_rows,)
+        )]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def _scan_chunk(func, key, low, high, batch_size, row_format):
+    """
+    Streams one range in batches and applies func to each row (run in a
+    worker process)
+    """
+    if high is None:
+        cursor = _connection.execute(
+            f"SELECT user_id, name, email, age FROM user_data WHERE {key} >= ? "
+            f"ORDER BY {key}", (low,)
+        )
+    else:
+        cursor = _connection.execute(
+            f"SELECT user_id, name, email, age FROM user_data "
+            f"WHERE {key} >= ? AND {key} < ? ORDER BY {key}", (low, high)
+        )
+    convert = batch_converter(row_format)
+    results = []
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            results.extend(map(func, convert(rows)))
+    finally:
+        cursor.close()
+    return results
+
+
+def parallel_scan(func, database=None, workers=None, key='rowid', ordered=True,
+                  chunk_rows=20000, batch_size=1000, row_format='dict',
+                  max_pending=None):
+    """
+    Generator that applies func to every user in parallel
+
+    Args:
+        func: Picklable function called with each row
+        database (str): Database file (default: ALX_prodev.db)
+        workers (int): Worker processes (default: one per CPU)
+        key (str): Split the table on 'rowid' or 'user_id' ranges
+        ordered (bool): Yield results in key order; otherwise in the order
+            chunks finish, which keeps all workers busy behind a slow chunk
+        chunk_rows (int): Rows per task sent to a worker
+        batch_size (int): Rows fetched at a time by a worker
+        row_format (str): Row format passed to func (see row_formats)
+        max_pending (int): Chunks in flight at a time (default: 2 per worker)
+
+    Yields:
+        The result of func for each user
+    """
+    database = database or DATABASE
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    # Fail early on an unknown row_format rather than in every worker
+    batch_converter(row_format)
+
+    connection = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        chunks = iter(chunk_ranges(connection, chunk_rows, key))
+    finally:
+        connection.close()
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers, initializer=_open_worker, initargs=(database,)
+    )
+
+    def submit():
+        for low, high in chunks:
+            return pool.submit(_scan_chunk, func, key, low, high, batch_size, row_format)
+        return None
+
+    try:
+        pending = deque()
+        for _ in range(max_pending):
+            future = submit()
+            if future is None:
+                break
+            pending.append(future)
+
+        while pending:
+            if ordered:
+                finished = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finished = [future for future in pending if future in done]
+                for future in finished:
+                    pending.remove(future)
+            for future in finished:
+                results = future.result()
+                # Refill before handing results out, so workers stay busy
+                # while the consumer works
+                future = submit()
+                if future is not None:
+                    pending.append(future)
+                yield from results
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _score(user):
+    """
+    CPU-heavy stand-in for per-user processing (used by the benchmark)
+    """
+    digest = user['email'].encode()
+    for _ in range(200):
+        digest = hashlib.sha256(digest).digest()
+    return digest[0]
+
+
+if __name__ == "__main__":
+    # Benchmark: serial stream_users vs parallel_scan with 1..CPU workers
+    import importlib
+    import tempfile
+    import time
+
+    import seed
+
+    rows = 20000
+    os.chdir(tempfile.mkdtemp())
+    seed.create_sample_data(sqlite3.connect(DATABASE), rows).close()
+
+    stream = importlib.import_module('0-stream_users')
+    started = time.perf_counter()
+    expected = sum(map(_score, stream.stream_users()))
+    serial = time.perf_counter() - started
+    print(f"{'serial stream_users':>24}: {rows / serial:>9,.0f} rows/s")
+
+    counts = sorted({1, 2, os.cpu_count() or 1})
+    for workers in counts:
+        for ordered in (True, False):
+            started = time.perf_counter()
+            total = sum(parallel_scan(_score, workers=workers, ordered=ordered))
+            elapsed = time.perf_counter() - started
+            assert total == expected
+            label = f"{workers} workers, {'ordered' if ordered else 'unordered'}"
+            print(f"{label:>24}: {rows / elapsed:>9,.0f} rows/s ({serial / elapsed:.1f}x)")
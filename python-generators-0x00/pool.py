@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+"""
+Module with a small SQLite connection pool
+
+ConnectionPool keeps up to max_size connections to one database file,
+each set up once with the configured pragmas and statement cache size.
+Connections are checked out with a context manager and returned to the
+pool when the block exits, including when a generator holding one is
+closed or garbage collected:
+
+    pool = ConnectionPool('ALX_prodev.db', max_size=4)
+    for user in stream_users(pool=pool):
+        ...
+
+The streaming functions accept pool=None too, in which case they open a
+fresh connection for the call and close it the same way (checkout()).
+
+Closing a checked out connection gives it back to the pool too, so code
+written for plain connections (connect, use, close) does not leak them.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DATABASE = 'ALX_prodev.db'
+
+# Applied to every new connection; journal_mode is left to the caller
+# since it is stored in the database file
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -16384,  # 16 MiB
+}
+
+# sqlite3's own default is 128 prepared statements per connection
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+class PoolTimeout(RuntimeError):
+    """
+    Raised when no connection becomes free within the checkout timeout
+    """
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    A connection opened by a ConnectionPool: close() releases it to the
+    pool instead of closing it (and does nothing once it is released);
+    the pool closes it with sqlite3.Connection.close()
+    """
+    _pool = None
+    _checked_out = False
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.release(self)
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of SQLite connections
+
+    Args:
+        database (str): Database file (default: ALX_prodev.db)
+        max_size (int): Most connections open at a time
+        pragmas (dict): PRAGMA name -> value run on each new connection
+            (default: DEFAULT_PRAGMAS)
+        cached_statements (int): Prepared statements cached per connection
+        timeout (float): Seconds to wait for a free connection (None: forever)
+    """
+
+    def __init__(self, database=DATABASE, max_size=5, pragmas=None,
+                 cached_statements=DEFAULT_CACHED_STATEMENTS, timeout=None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.database = database
+        self.max_size = max_size
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def _connect(self):
+        # Checked out connections may move between threads (prefetching
+        # generators); the pool hands each one to a single user at a time
+        connection = sqlite3.connect(
+            self.database,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        connection._pool = self
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    @property
+    def size(self):
+        """
+        Number of connections currently open (idle or checked out)
+        """
+        return self._size
+
+    @property
+    def idle(self):
+        """
+        Number of open connections waiting in the pool
+        """
+        return len(self._idle)
+
+    def acquire(self, timeout=None):
+        """
+        Checks a connection out of the pool, opening one if the pool is not
+        full and waiting for one to be released otherwise
+
+        Args:
+            timeout (float): Seconds to wait (default: the pool's timeout)
+
+        Returns:
+            PooledConnection: Give it back with release() or close()
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("connection pool is closed")
+                if self._idle:
+                    connection = self._idle.pop()
+                    connection._checked_out = True
+                    return connection
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout(
+                        f"no free connection to {self.database} after {timeout}s"
+                    )
+                self._condition.wait(remaining)
+        try:
+            connection = self._connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        connection._checked_out = True
+        return connection
+
+    def release(self, connection):
+        """
+        Returns a checked out connection to the pool
+
+        An open transaction is rolled back. Connections closed by the
+        caller are dropped from the pool. Releasing a connection that is
+        not checked out does nothing.
+        """
+        with self._condition:
+            if not connection._checked_out:
+                return
+            connection._checked_out = False
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            usable = True
+        except sqlite3.ProgrammingError:
+            # Closed by the caller
+            usable = False
+        with self._condition:
+            if usable and not self._closed:
+                self._idle.append(connection)
+            else:
+                self._size -= 1
+                if usable:
+                    sqlite3.Connection.close(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager checking out a connection for the block
+        """
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        """
+        Closes the idle connections; checked out ones are closed when
+        released
+        """
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                sqlite3.Connection.close(self._idle.pop())
+                self._size -= 1
+            self._condition.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextmanager
+def checkout(pool=None, database=DATABASE, **connect_kwargs):
+    """
+    Context manager yielding a connection from pool, or a fresh connection
+    to database (closed at the end of the block) when pool is None
+    """
+    if pool is not None:
+        with pool.connection() as connection:
+            yield connection
+        return
+    connection = sqlite3.connect(database, **connect_kwargs)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+# Default pool shared by callers that want one, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the default pool, on the database named by the ALX_PRODEV_DB
+    environment variable (default: ALX_prodev.db)
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(os.environ.get('ALX_PRODEV_DB', DATABASE))
+        return _pool
+
+
+def configure_pool(**options):
+    """
+    Replaces the default pool with ConnectionPool(**options) and closes
+    the previous one
+    """
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, ConnectionPool(**options)
+    if previous is not None:
+        previous.close()
+    return _pool
+
+
+if __name__ == "__main__":
+    # Benchmark: fresh connection per call vs pooled connections
+    import importlib
+    import tempfile
+
+    import seed
+
+    os.chdir(tempfile.mkdtemp())
+    seed.create_sample_data(sqlite3.connect(DATABASE), 1000).close()
+
+    paginate = importlib.import_module('2-lazy_paginate')
+    stream = importlib.import_module('0-stream_users')
+    calls = 5000
+    with ConnectionPool(DATABASE, max_size=2) as pool:
+        for label, options in [("fresh connection", {}), ("pooled", {'pool': pool})]:
+            started = time.perf_counter()
+            for offset in range(calls):
+                paginate.paginate_users(10, offset % 990, **options)
+            elapsed = time.perf_counter() - started
+            print(f"{label:>16}: {calls / elapsed:>8,.0f} paginate_users calls/s")
+
+        # Abandoned generators give their connection back
+        for _ in range(10):
+            next(stream.stream_users(pool=pool))
+        print(f"after 10 abandoned generators: {pool.size} open, {pool.idle} idle")
@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+"""
+Module for building filtered, projected queries over user_data
+
+A Query compiles column projections and filter predicates into one
+parameterized SELECT, so SQLite does the filtering and only matching
+rows and the needed columns cross into Python:
+
+    query = Query().select('name', 'email').where('age', '>', 25)
+    query.compile()
+    # ('SELECT name, email FROM user_data WHERE age > ?', [25])
+
+Columns and operators are checked against fixed lists (identifiers
+cannot be bound); every value is a bound parameter. Queries are
+immutable: each method returns a new Query.
+"""
+import json
+
+from row_formats import FIELDS, ROW_FORMATS, batch_converter
+
+TABLE = 'user_data'
+
+COMPARISONS = ('=', '!=', '<', '<=', '>', '>=')
+
+# Columns queries can be ordered on; rowid is the table order
+ORDER_KEYS = FIELDS + ('rowid',)
+
+# Longer IN lists are bound as one JSON array instead of one parameter
+# per value (SQLite limits the number of parameters)
+IN_LIST_LIMIT = 500
+
+
+def _check_column(column):
+    if column not in FIELDS:
+        raise ValueError(f"column must be one of {FIELDS}")
+
+
+def _prefix_bound(prefix):
+    """
+    Returns the smallest string greater than every string starting with
+    prefix, or None if there is none
+    """
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            # Surrogates are not valid in the UTF-8 SQLite stores: skip them
+            following = 0xE000 if 0xD7FF <= last < 0xE000 else last + 1
+            return prefix[:-1] + chr(following)
+        prefix = prefix[:-1]
+    return None
+
+
+class Query:
+    """
+    A SELECT over user_data with a projection, predicates, ordering and limit
+    """
+
+    def __init__(self, columns=FIELDS, predicates=(), order=None, limit=None):
+        self.columns = tuple(columns)
+        self.predicates = tuple(predicates)
+        self.order = order
+        self.row_limit = limit
+
+    def _replace(self, **changes):
+        options = {
+            'columns': self.columns,
+            'predicates': self.predicates,
+            'order': self.order,
+            'limit': self.row_limit,
+        }
+        options.update(changes)
+        return Query(**options)
+
+    def _filter(self, sql, *params):
+        return self._replace(predicates=self.predicates + ((sql, params),))
+
+    def select(self, *columns):
+        """
+        Returns the query reading only the given columns
+        """
+        if not columns:
+            raise ValueError("select() needs at least one column")
+        for column in columns:
+            _check_column(column)
+        return self._replace(columns=columns)
+
+    def where(self, column, op, value):
+        """
+        Returns the query filtered on a comparison, e.g. where('age', '>', 25)
+        """
+        _check_column(column)
+        if op not in COMPARISONS:
+            raise ValueError(f"op must be one of {COMPARISONS}")
+        return self._filter(f"{column} {op} ?", value)
+
+    def between(self, column, low, high):
+        """
+        Returns the query filtered on low <= column <= high
+        """
+        _check_column(column)
+        return self._filter(f"{column} BETWEEN ? AND ?", low, high)
+
+    def isin(self, column, values):
+        """
+        Returns the query filtered on column being one of values
+        """
+        _check_column(column)
+        values = list(values)
+        if not values:
+            return self._filter("0")
+        if len(values) > IN_LIST_LIMIT:
+            return self._filter(
+                f"{column} IN (SELECT value FROM json_each(?))", json.dumps(values)
+            )
+        return self._filter(f"{column} IN ({', '.join('?' * len(values))})", *values)
+
+    def startswith(self, column, prefix):
+        """
+        Returns the query filtered on column starting with prefix
+
+        Compiled to a range (column >= prefix AND column < next) rather than
+        LIKE, so it is case sensitive and can use an index on the column.
+        """
+        _check_column(column)
+        if not prefix:
+            return self
+        bound = _prefix_bound(prefix)
+        if bound is None:
+            return self._filter(f"{column} >= ?", prefix)
+        return self._filter(f"{column} >= ? AND {column} < ?", prefix, bound)
+
+    def order_by(self, column, descending=False):
+        """
+        Returns the query sorted on column (or rowid)
+        """
+        if column not in ORDER_KEYS:
+            raise ValueError(f"column must be one of {ORDER_KEYS}")
+        return self._replace(order=f"{column} DESC" if descending else column)
+
+    def limit(self, count):
+        """
+        Returns the query reading at most count rows
+        """
+        return self._replace(limit=int(count))
+
+    def compile(self):
+        """
+        Compiles the query
+
+        Returns:
+            tuple: (SQL string, list of parameters)
+        """
+        sql = f"SELECT {', '.join(self.columns)} FROM {TABLE}"
+        params = []
+        if self.predicates:
+            sql += " WHERE " + " AND ".join(clause for clause, _ in self.predicates)
+            for _, values in self.predicates:
+                params.extend(values)
+        if self.order:
+            sql += f" ORDER BY {self.order}"
+        if self.row_limit is not None:
+            sql += " LIMIT ?"
+            params.append(self.row_limit)
+        return sql, params
+
+    def batch_converter(self, row_format='tuple'):
+        """
+        Returns a function converting fetched rows to the given row format
+
+        'tuple' and 'dict' work with any projection; 'record' and 'columns'
+        need all of user_id, name, email, age in that order.
+        """
+        if row_format not in ROW_FORMATS:
+            raise ValueError(f"row_format must be one of {ROW_FORMATS}")
+        if self.columns == FIELDS:
+            return batch_converter(row_format)
+        if row_format == 'tuple':
+            return list
+        if row_format == 'dict':
+            columns = self.columns
+            return lambda rows: [dict(zip(columns, row)) for row in rows]
+        raise ValueError(f"row_format '{row_format}' needs all of {FIELDS} selected")
+
+    def stream_batches(self, connection, batch_size, row_format='tuple'):
+        """
+        Generator that runs the query and yields its rows in batches
+
+        Args:
+            connection: Open SQLite connection
+            batch_size (int): Number of rows per batch
+            row_format (str): Row format of the batches (see row_formats)
+
+        Yields:
+            A batch of matching rows
+        """
+        convert = self.batch_converter(row_format)
+        sql, params = self.compile()
+        cursor = connection.execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield convert(rows)
+        finally:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    # Benchmark: batch_processing filtering in Python vs in SQLite
+    import contextlib
+    import importlib
+    import io
+    import os
+    import sqlite3
+    import tempfile
+    import time
+
+    import seed
+
+    rows = 200000
+    os.chdir(tempfile.mkdtemp())
+    setup = seed.create_sample_data(sqlite3.connect('ALX_prodev.db'), rows)
+    setup.execute("CREATE INDEX idx_user_data_age ON user_data(age)")
+    setup.commit()
+
+    batches = importlib.import_module('1-batch_processing')
+
+    def baseline(batch_size):
+        # The original: every row into Python, filtered and printed one by one
+        for batch in batches.stream_users_in_batches(batch_size):
+            for user in batch:
+                if user['age'] > 25:
+                    print(user)
+
+    for label, run in [
+        ("filter in Python, print per row", baseline),
+        ("pushdown, buffered output", batches.batch_processing),
+    ]:
+        output = io.StringIO()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            run(1000)
+        elapsed = time.perf_counter() - started
+        print(f"{label:>32}: {output.getvalue().count(chr(10))} rows in {elapsed:.3f}s")
+
+    # Narrow projections move less data still
+    for label, query in [
+        ("age > 90, all columns", Query().where('age', '>', 90)),
+        ("age > 90, email only", Query().select('email').where('age', '>', 90)),
+        ("name prefix 'user 1999'", Query().select('name').startswith('name', 'user 1999')),
+        ("age IN (20, 30, 40)", Query().isin('age', [20, 30, 40])),
+    ]:
+        started = time.perf_counter()
+        count = sum(len(batch) for batch in query.stream_batches(setup, 1000))
+        print(f"{label:>32}: {count} rows in {time.perf_counter() - started:.3f}s")
+    setup.close()
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+"""
+Module with the row formats of the user_data streaming generators
+
+Building a four-key dict per row costs more memory and time than reading
+the row. The generators take a row_format parameter instead:
+
+- 'dict' (default): {'user_id': ..., 'name': ..., 'email': ..., 'age': ...}
+- 'tuple': the (user_id, name, email, age) tuples sqlite3 returns, as is
+- 'record': UserRecord objects with __slots__ (attribute access)
+- 'columns': one ColumnBatch per batch holding a list per column; its
+  rows are lightweight RowView objects created on access
+
+UserRecord and RowView also support row['age'], so code written for the
+dict format keeps working with them. field_getter() returns an accessor
+that works for any format.
+"""
+from collections.abc import Sequence
+from operator import attrgetter, itemgetter
+
+FIELDS = ('user_id', 'name', 'email', 'age')
+
+ROW_FORMATS = ('dict', 'tuple', 'record', 'columns')
+
+
+class UserRecord:
+    """
+    A user_data row with fixed attributes and no per-instance dict
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, user_id, name, email, age):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.age = age
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def __eq__(self, other):
+        if not isinstance(other, UserRecord):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        return (f"UserRecord(user_id={self.user_id!r}, name={self.name!r}, "
+                f"email={self.email!r}, age={self.age!r})")
+
+    def as_tuple(self):
+        return (self.user_id, self.name, self.email, self.age)
+
+    def as_dict(self):
+        return dict(zip(FIELDS, self.as_tuple()))
+
+
+class RowView:
+    """
+    One row of a ColumnBatch; reads go to the batch's column lists
+    """
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    user_id = property(lambda self: self._columns[0][self._index])
+    name = property(lambda self: self._columns[1][self._index])
+    email = property(lambda self: self._columns[2][self._index])
+    age = property(lambda self: self._columns[3][self._index])
+
+    def __getitem__(self, field):
+        return self._columns[FIELDS.index(field)][self._index]
+
+    def __repr__(self):
+        return f"RowView({self.as_tuple()!r})"
+
+    def as_tuple(self):
+        return tuple(column[self._index] for column in self._columns)
+
+    def as_dict(self):
+        return dict(zip(FIELDS, self.as_tuple()))
+
+
+class ColumnBatch(Sequence):
+    """
+    A batch of rows stored as one list per column
+
+    Args:
+        rows: List of (user_id, name, email, age) tuples
+    """
+
+    def __init__(self, rows):
+        self.columns = tuple(map(list, zip(*rows))) if rows else tuple([] for _ in FIELDS)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __iter__(self):
+        columns = self.columns
+        return (RowView(columns, index) for index in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('batch index out of range')
+        return RowView(self.columns, index)
+
+    def column(self, field):
+        """
+        Returns the list of values of one column
+        """
+        return self.columns[FIELDS.index(field)]
+
+
+def _check(row_format):
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"row_format must be one of {ROW_FORMATS}")
+
+
+def row_converter(row_format='dict'):
+    """
+    Returns a function converting one (user_id, name, email, age) tuple
+    """
+    _check(row_format)
+    if row_format == 'dict':
+        return lambda row: {'user_id': row[0], 'name': row[1], 'email': row[2], 'age': row[3]}
+    if row_format == 'tuple':
+        return tuple
+    if row_format == 'record':
+        return lambda row: UserRecord(*row)
+    # A single row is a batch of one
+    return lambda row: ColumnBatch([row])[0]
+
+
+def batch_converter(row_format='dict'):
+    """
+    Returns a function converting a list of (user_id, name, email, age)
+    tuples to a batch in the given format
+    """
+    _check(row_format)
+    if row_format == 'dict':
+        return lambda rows: [
+            {'user_id': row[0], 'name': row[1], 'email': row[2], 'age': row[3]}
+            for row in rows
+        ]
+    if row_format == 'tuple':
+        return list
+    if row_format == 'record':
+        return lambda rows: [UserRecord(*row) for row in rows]
+    return ColumnBatch
+
+
+def field_getter(row_format, field):
+    """
+    Returns a function reading one field from a row of the given format
+    """
+    _check(row_format)
+    if row_format == 'dict':
+        return itemgetter(field)
+    if row_format == 'tuple':
+        return itemgetter(FIELDS.index(field))
+    return attrgetter(field)
+
+
+if __name__ == "__main__":
+    # Benchmark: memory per batch and rows/sec of each format
+    import importlib
+    import os
+    import sqlite3
+    import tempfile
+    import time
+    import tracemalloc
+
+    import seed
+
+    rows = 200000
+    batch_size = 10000
+    os.chdir(tempfile.mkdtemp())
+    setup = seed.create_sample_data(sqlite3.connect('ALX_prodev.db'), rows)
+
+    batches = importlib.import_module('1-batch_processing')
+    print(f"{'format':>8} {'bytes/batch':>12} {'bytes/row':>10} {'rows/s':>12}")
+    for row_format in ROW_FORMATS:
+        # Memory held by one batch: fetched rows, converted, the tuples
+        # dropped unless the format keeps them (field values included)
+        convert = batch_converter(row_format)
+        cursor = setup.execute("SELECT user_id, name, email, age FROM user_data")
+        tracemalloc.start()
+        batch = convert(cursor.fetchmany(batch_size))
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del batch
+        cursor.close()
+
+        age = field_getter(row_format, 'age')
+        started = time.perf_counter()
+        total = 0
+        for batch in batches.stream_users_in_batches(batch_size, row_format=row_format):
+            for user in batch:
+                total += age(user) > 25
+        elapsed = time.perf_counter() - started
+        print(f"{row_format:>8} {size:>12,} {size / batch_size:>10.1f} {rows / elapsed:>12,.0f}")
+    setup.close()
+
+    # Column batches are fastest read a column at a time
+    started = time.perf_counter()
+    total = 0
+    for batch in batches.stream_users_in_batches(batch_size, row_format='columns'):
+        total += sum(age > 25 for age in batch.column('age'))
+    elapsed = time.perf_counter() - started
+    print(f"{'columns':>8} {'(column scan)':>23} {rows / elapsed:>12,.0f}")
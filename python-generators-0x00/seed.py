@@ -4,18 +4,90 @@ Module for seeding the ALX_prodev database with user data (SQLite version)
 """
 import sqlite3
 import csv
+import io
+import itertools
 import uuid
 import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 
+import materialized_aggregates
+import snapshot
 
-def connect_db():
+# Rows per executemany/transaction during bulk loads
+LOAD_CHUNK_SIZE = 100000
+
+# Files larger than this are parsed by a pool of processes, in byte
+# ranges of PARSE_RANGE_BYTES
+PARALLEL_PARSE_BYTES = 64 * 1024 * 1024
+PARSE_RANGE_BYTES = 16 * 1024 * 1024
+
+# Pragmas set for the duration of a bulk load
+LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # 256 MiB
+    'temp_store': 'MEMORY',
+}
+
+CREATE_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    age INTEGER NOT NULL
+)
+"""
+
+INSERT_QUERY = """
+INSERT INTO user_data (user_id, name, email, age)
+VALUES (?, ?, ?, ?)
+"""
+
+# Copies a staging database attached as "stage"; WHERE true lets SQLite
+# parse an ON CONFLICT clause after the SELECT
+COPY_QUERY = """
+INSERT INTO user_data (user_id, name, email, age)
+SELECT user_id, name, email, age FROM stage.user_data WHERE true ORDER BY user_id
+"""
+
+UPSERT_CLAUSE = """
+ON CONFLICT(user_id) DO UPDATE SET
+    name = excluded.name, email = excluded.email, age = excluded.age
+"""
+
+# Email domains of the generated sample users
+SAMPLE_DOMAINS = ('gmail.com', 'yahoo.com', 'hotmail.com', 'example.org')
+
+
+class PartialLoadError(Exception):
+    """
+    Raised when a load fails after some of its chunks were committed
+
+    Attributes:
+        loaded (int): Rows committed before the failure
+    """
+
+    def __init__(self, csv_file, loaded):
+        super().__init__(f"loading {csv_file} failed after {loaded} rows were committed")
+        self.loaded = loaded
+
+
+def connect_db(pool=None):
     """
     Connects to the SQLite database server
     
+    Args:
+        pool (ConnectionPool): Pool to check the connection out of;
+            closing the connection gives it back to the pool (see pool)
+    
     Returns:
         connection object if successful, None otherwise
     """
     try:
+        if pool is not None:
+            return pool.acquire()
         # Connect to SQLite (creates file if doesn't exist)
         connection = sqlite3.connect('ALX_prodev.db')
         return connection
@@ -37,14 +109,20 @@ def create_database(connection):
     pass
 
 
-def connect_to_prodev():
+def connect_to_prodev(pool=None):
     """
     Connects to the ALX_prodev database
     
+    Args:
+        pool (ConnectionPool): Pool to check the connection out of;
+            closing the connection gives it back to the pool (see pool)
+    
     Returns:
         connection object if successful, None otherwise
     """
     try:
+        if pool is not None:
+            return pool.acquire()
         connection = sqlite3.connect('ALX_prodev.db')
         return connection
     except sqlite3.Error as e:
@@ -61,15 +139,7 @@ def create_table(connection):
     """
     try:
         cursor = connection.cursor()
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS user_data (
-            user_id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            age INTEGER NOT NULL
-        )
-        """
-        cursor.execute(create_table_query)
+        cursor.execute(CREATE_TABLE_QUERY)
         
         # Create index on user_id
         cursor.execute("""
@@ -83,56 +153,344 @@ def create_table(connection):
         print(f"Error creating table: {e}")
 
 
-def insert_data(connection, csv_file):
+def sample_users(rows):
+    """
+    Generator of deterministic (user_id, name, email, age) rows for
+    benchmarks and tests: user_ids in rowid order, ages 18 to 100 spread
+    over the table, emails over SAMPLE_DOMAINS
+    """
+    for i in range(rows):
+        yield (
+            f"{i:036d}",
+            f"user {i}",
+            f"user{i}@{SAMPLE_DOMAINS[i % 7 % len(SAMPLE_DOMAINS)]}",
+            18 + (i * 7919) % 83,
+        )
+
+
+def create_sample_data(connection, rows):
+    """
+    Creates user_data (without secondary indexes) and fills it with
+    sample_users(rows) in one transaction
+
+    Args:
+        connection: SQLite connection object
+        rows (int): Number of users to generate
+
+    Returns:
+        connection: The same connection, for chaining
+    """
+    with connection:
+        connection.execute(CREATE_TABLE_QUERY)
+        connection.executemany(INSERT_QUERY, sample_users(rows))
+    return connection
+
+
+def _parse_age(value):
+    """
+    Parses an age such as "67" or "67.0" to an int
+    """
+    return int(value) if value.isdigit() else int(float(value))
+
+
+def _column_indexes(header):
+    """
+    Returns the positions of (user_id, name, email, age) in the CSV header;
+    user_id is None when the file has no user_id column
+    """
+    header = [column.strip() for column in header]
+    return (
+        header.index('user_id') if 'user_id' in header else None,
+        header.index('name'),
+        header.index('email'),
+        header.index('age'),
+    )
+
+
+def _parse_records(records, indexes):
+    """
+    Converts CSV records to (user_id, name, email, age) tuples
+    """
+    user_id, name, email, age = indexes
+    for record in records:
+        if not record:
+            continue
+        yield (
+            record[user_id] if user_id is not None else str(uuid.uuid4()),
+            record[name],
+            record[email],
+            _parse_age(record[age]),
+        )
+
+
+def _stage_range(csv_file, start, end, data_start, indexes, stage_file):
+    """
+    Parses the lines starting in the byte range [start, end) of a CSV file
+    into a staging database (run in a worker process). Assumes no quoted
+    field spans lines (see _has_multiline_records). Returns the number of
+    rows staged.
+    """
+    with open(csv_file, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+        if not data.endswith(b'\n'):
+            # Finish the last line of the range
+            data += file.readline()
+        if start > data_start:
+            file.seek(start - 1)
+            if file.read(1) != b'\n':
+                # The first line started in the previous range
+                data = data[data.find(b'\n') + 1:]
+    text = io.StringIO(data.decode('utf-8'), newline='')
+    rows = list(_parse_records(csv.reader(text), indexes))
+
+    stage = sqlite3.connect(stage_file)
+    try:
+        stage.execute("PRAGMA journal_mode = OFF")
+        stage.execute("PRAGMA synchronous = OFF")
+        stage.execute("CREATE TABLE user_data (user_id, name, email, age)")
+        stage.executemany(INSERT_QUERY, rows)
+        stage.commit()
+    finally:
+        stage.close()
+    return len(rows)
+
+
+def _parsed_chunks(csv_file):
+    """
+    Yields lists of parsed rows from a CSV file, LOAD_CHUNK_SIZE at a time
+    """
+    with open(csv_file, 'r', newline='') as file:
+        reader = csv.reader(file)
+        rows = _parse_records(reader, _column_indexes(next(reader)))
+        while True:
+            chunk = list(itertools.islice(rows, LOAD_CHUNK_SIZE))
+            if not chunk:
+                return
+            yield chunk
+
+
+def _has_multiline_records(csv_file):
+    """
+    Returns whether a quoted field of a CSV file contains a line break,
+    which the byte ranges of _staged_ranges() would split
+
+    A record spans lines exactly when a line ends after an odd number of
+    quote characters (an escaped quote is doubled). Blocks without quotes
+    are checked with one search instead of line by line.
+    """
+    quoted = False
+    with open(csv_file, 'rb') as file:
+        for block in iter(lambda: file.read(PARSE_RANGE_BYTES), b''):
+            if b'"' not in block:
+                if quoted and b'\n' in block:
+                    return True
+                continue
+            *lines, rest = block.split(b'\n')
+            for line in lines:
+                quoted ^= line.count(b'"') % 2 == 1
+                if quoted:
+                    return True
+            quoted ^= rest.count(b'"') % 2 == 1
+    return False
+
+
+def _staged_ranges(csv_file, directory, workers=None):
+    """
+    Parses a large CSV file with a process pool, one staging database per
+    byte range, and yields (staging file, row count) in file order while
+    the caller copies the previous ranges.
+    """
+    with open(csv_file, 'rb') as file:
+        header = file.readline().decode('utf-8')
+        data_start = file.tell()
+    indexes = _column_indexes(next(csv.reader([header])))
+    size = os.path.getsize(csv_file)
+    starts = range(data_start, size, PARSE_RANGE_BYTES)
+    stage_files = [os.path.join(directory, f'stage-{i}.db') for i in range(len(starts))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(
+            _stage_range,
+            itertools.repeat(csv_file),
+            starts,
+            [min(start + PARSE_RANGE_BYTES, size) for start in starts],
+            itertools.repeat(data_start),
+            itertools.repeat(indexes),
+            stage_files,
+        )
+        yield from zip(stage_files, counts)
+
+
+def _set_load_pragmas(cursor):
+    """
+    Applies bulk load pragmas and returns the settings to restore
+    """
+    previous = {
+        name: cursor.execute(f"PRAGMA {name}").fetchone()[0] for name in LOAD_PRAGMAS
+    }
+    for name, value in LOAD_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    return previous
+
+
+def _restore_pragmas(cursor, previous):
+    """
+    Restores the settings returned by _set_load_pragmas()
+    """
+    # journal_mode last: leaving WAL fails while another connection has
+    # the database open, and the other settings are restored by then
+    for name, value in reversed(previous.items()):
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def insert_data(connection, csv_file, upsert=False, workers=None):
     """
     Inserts data into the database if it does not exist
-    
+
+    Rows are streamed from the CSV file and inserted with executemany in
+    chunks of LOAD_CHUNK_SIZE, one transaction per chunk, with load-time
+    pragmas (WAL journal, synchronous off, large cache; the previous
+    settings are restored afterwards). Files of
+    PARALLEL_PARSE_BYTES or more are parsed by a process pool into
+    staging databases, which are copied in with INSERT ... SELECT while
+    the next ranges are parsed. When the table is empty, the secondary
+    index is dropped during the load and rebuilt at the end, and so are
+    the triggers of the materialized aggregates (which are recomputed
+    once instead of row by row). The snapshot version triggers are
+    dropped for any load and the version is bumped once at the end.
+    Files with line breaks inside quoted fields are always loaded by the
+    serial parser.
+
     Args:
         connection: SQLite connection object
         csv_file: path to the CSV file containing user data
+        upsert (bool): Load into a non-empty table, inserting new users
+            and updating existing ones (by user_id)
+        workers (int): Parse processes for large files (default: one per CPU)
+
+    Returns:
+        int: Number of rows loaded
+
+    Raises:
+        sqlite3.ProgrammingError: The connection has an open transaction
+            (the load commits chunk by chunk, so it would commit it too)
+        PartialLoadError: The load failed after some chunks were
+            committed; they stay in the table. Failures before the first
+            commit are printed and return 0.
     """
+    if connection.in_transaction:
+        raise sqlite3.ProgrammingError(
+            "insert_data() needs a connection without an open transaction"
+        )
     try:
         cursor = connection.cursor()
-        
+
         # Check if data already exists
         cursor.execute("SELECT COUNT(*) FROM user_data")
         count = cursor.fetchone()[0]
-        
-        if count > 0:
+
+        if count > 0 and not upsert:
             print("Data already exists in user_data table")
             cursor.close()
-            return
-        
+            return 0
+
         # Read and insert data from CSV
         if not os.path.exists(csv_file):
             print(f"CSV file {csv_file} not found")
             cursor.close()
-            return
-            
-        with open(csv_file, 'r') as file:
-            csv_reader = csv.DictReader(file)
-            
-            insert_query = """
-            INSERT INTO user_data (user_id, name, email, age)
-            VALUES (?, ?, ?, ?)
-            """
-            
-            for row in csv_reader:
-                # Generate UUID if not present or use existing
-                user_id = row.get('user_id', str(uuid.uuid4()))
-                name = row['name']
-                email = row['email']
-                age = int(float(row['age']))  # Convert to int
-                
-                cursor.execute(insert_query, (user_id, name, email, age))
-        
-        connection.commit()
-        print(f"Data inserted successfully from {csv_file}")
+            return 0
+
+        previous = _set_load_pragmas(cursor)
+        indexes = []
+        aggregates = False
+        versioned = snapshot.drop_version_triggers(connection)
+        if count == 0:
+            aggregates = materialized_aggregates.drop_triggers(connection)
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name = 'user_data' AND sql IS NOT NULL"
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX "{name}"')
+            connection.commit()
+
+        query = INSERT_QUERY + (UPSERT_CLAUSE if upsert else "")
+        started = time.perf_counter()
+        loaded = 0
+        try:
+            if (os.path.getsize(csv_file) < PARALLEL_PARSE_BYTES
+                    or _has_multiline_records(csv_file)):
+                for chunk in _parsed_chunks(csv_file):
+                    cursor.execute("BEGIN")
+                    cursor.executemany(query, chunk)
+                    connection.commit()
+                    loaded += len(chunk)
+            else:
+                with tempfile.TemporaryDirectory() as directory:
+                    for stage_file, staged in _staged_ranges(csv_file, directory, workers):
+                        # Copied inside SQLite: no per-row Python work here
+                        cursor.execute("ATTACH DATABASE ? AS stage", (stage_file,))
+                        cursor.execute("BEGIN")
+                        cursor.execute(COPY_QUERY + (UPSERT_CLAUSE if upsert else ""))
+                        connection.commit()
+                        cursor.execute("DETACH DATABASE stage")
+                        loaded += staged
+        except Exception as e:
+            if loaded:
+                raise PartialLoadError(csv_file, loaded) from e
+            raise
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            for _, sql in indexes:
+                cursor.execute(sql)
+            connection.commit()
+            if aggregates:
+                materialized_aggregates.install(connection)
+            if versioned:
+                snapshot.install_version_triggers(connection)
+                snapshot.bump_version(connection)
+            _restore_pragmas(cursor, previous)
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"Data inserted successfully from {csv_file}: {loaded} rows in "
+            f"{elapsed:.2f}s ({loaded / elapsed if elapsed else 0:,.0f} rows/s)"
+        )
         cursor.close()
-        
+        return loaded
+
+    except PartialLoadError:
+        raise
     except sqlite3.Error as e:
         print(f"Error inserting data: {e}")
     except FileNotFoundError:
         print(f"CSV file {csv_file} not found")
     except Exception as e:
-        print(f"Error reading CSV file: {e}")
\ No newline at end of file
+        print(f"Error reading CSV file: {e}")
+    return 0
+
+
+if __name__ == "__main__":
+    # Benchmark: bulk load of a generated CSV file
+    import sys
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    directory = tempfile.mkdtemp()
+    csv_path = os.path.join(directory, 'users.csv')
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['user_id', 'name', 'email', 'age'])
+        writer.writerows(
+            (str(uuid.uuid4()), f"User {i}", f"user{i}@example.com", f"{18 + i % 80}.0")
+            for i in range(rows)
+        )
+    print(f"CSV: {rows} rows, {os.path.getsize(csv_path) / 2 ** 20:.0f} MiB")
+
+    connection = sqlite3.connect(os.path.join(directory, 'bench.db'))
+    create_table(connection)
+    insert_data(connection, csv_path)
+    # Incremental load of the same file: every row is an update
+    insert_data(connection, csv_path, upsert=True)
+    connection.close()
@@ -0,0 +1,524 @@
+#!/usr/bin/python3
+"""
+Module for columnar snapshots of user_data
+
+export_snapshot() reads the table once and writes it column by column
+to a file; Snapshot opens that file with mmap and exposes the columns
+as zero-copy NumPy views, so repeated analytical passes run over plain
+arrays instead of decoding every row through sqlite3 again:
+
+    snapshot = load_snapshot('user_data.snap')
+    snapshot.column('age').mean()
+    (snapshot.column('age') > 25).sum()
+
+File layout (little-endian): the magic bytes, the length of a JSON
+header, the header, then one 64-byte aligned section per array. Numeric
+columns (rowid, age) are int64 arrays; string columns (user_id, name,
+email) are a uint64 offsets array of row count + 1 entries and the
+UTF-8 bytes of all values, value i being data[offsets[i]:offsets[i + 1]].
+
+The header records the table's version when it was exported. Opening a
+snapshot against a database whose version differs raises StaleSnapshot
+(load_snapshot() re-exports instead). The version is the counter kept
+by install_version_triggers() when it is installed: it is cheap to read
+and exact, but every write to user_data then also updates it. The
+triggers are opt-in (export_snapshot(install_triggers=True) or a direct
+call) and uninstall_version_triggers() removes them; seed.insert_data()
+drops them during a load and bumps the version once. Without them the
+version is a BLAKE2b checksum of every row, which costs a scan on each
+check.
+
+NumPy is required (pip install numpy).
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+from array import array
+from itertools import accumulate, islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from row_formats import batch_converter
+
+DATABASE = 'ALX_prodev.db'
+
+SNAPSHOT_FILE = 'user_data.snap'
+
+MAGIC = b'UDSNAP01'
+
+ALIGNMENT = 64
+
+NUMERIC_COLUMNS = ('rowid', 'age')
+STRING_COLUMNS = ('user_id', 'name', 'email')
+
+# Rows read from SQLite per fetch during an export
+EXPORT_CHUNK_SIZE = 65536
+
+VERSION_TABLE = 'user_data_version'
+VERSION_TRIGGERS = {
+    f'user_data_version_{event.lower()}': f"""
+        CREATE TRIGGER IF NOT EXISTS user_data_version_{event.lower()} AFTER {event} ON user_data
+        BEGIN UPDATE {VERSION_TABLE} SET version = version + 1; END
+    """
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+}
+
+
+class StaleSnapshot(Exception):
+    """
+    Raised when a snapshot does not match the current table
+    """
+
+
+def _require_numpy():
+    """
+    Raises ImportError with install instructions when NumPy is missing
+    """
+    if np is None:
+        raise ImportError("snapshot needs NumPy for its column views: pip install numpy")
+
+
+def install_version_triggers(connection):
+    """
+    Creates a version counter bumped by every insert, update and delete
+    on user_data, which makes checking a snapshot O(1)
+
+    Every write to user_data then also updates the counter row.
+    """
+    connection.executescript(f"""
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL);
+        INSERT INTO {VERSION_TABLE} (version)
+            SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM {VERSION_TABLE});
+    """ + ';'.join(VERSION_TRIGGERS.values()))
+
+
+def drop_version_triggers(connection):
+    """
+    Drops the version triggers but keeps the counter, e.g. for a bulk
+    load; install_version_triggers() and bump_version() afterwards
+
+    Returns:
+        bool: Whether the version counter was installed
+    """
+    installed = _has_version_counter(connection)
+    with connection:
+        for name in VERSION_TRIGGERS:
+            connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+    return installed
+
+
+def bump_version(connection):
+    """
+    Increments the version counter once, marking snapshots stale
+    """
+    with connection:
+        connection.execute(f"UPDATE {VERSION_TABLE} SET version = version + 1")
+
+
+def uninstall_version_triggers(connection):
+    """
+    Drops the version triggers and the counter; versions fall back to
+    the checksum
+    """
+    drop_version_triggers(connection)
+    with connection:
+        connection.execute(f"DROP TABLE IF EXISTS {VERSION_TABLE}")
+
+
+def _has_version_counter(connection):
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (VERSION_TABLE,)
+    ).fetchone() is not None
+
+
+def table_checksum(connection):
+    """
+    Returns a BLAKE2b checksum of every user_data row, in rowid order
+
+    SQLite joins the rows of each rowid range into one string, so Python
+    hashes EXPORT_CHUNK_SIZE rows per call instead of decoding them.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    low, high = connection.execute("SELECT MIN(rowid), MAX(rowid) FROM user_data").fetchone()
+    if low is not None:
+        for start in range(low, high + 1, EXPORT_CHUNK_SIZE):
+            (chunk,) = connection.execute(
+                "SELECT group_concat(rowid || char(31) || user_id || char(31) || name "
+                "|| char(31) || email || char(31) || age, char(30)) "
+                "FROM user_data WHERE rowid >= ? AND rowid < ?",
+                (start, start + EXPORT_CHUNK_SIZE)
+            ).fetchone()
+            if chunk is not None:
+                digest.update(chunk.encode())
+                digest.update(b'\x1d')
+    return digest.hexdigest()
+
+
+def table_version(connection):
+    """
+    Returns the current version of user_data (see the module docstring)
+    """
+    if _has_version_counter(connection):
+        row = connection.execute(f"SELECT version FROM {VERSION_TABLE}").fetchone()
+        return ['counter', row[0] if row else 0]
+    return ['checksum', table_checksum(connection)]
+
+
+def _pad(file):
+    file.write(b'\0' * (-file.tell() % ALIGNMENT))
+
+
+def export_snapshot(path=SNAPSHOT_FILE, connection=None, install_triggers=False):
+    """
+    Writes a columnar snapshot of user_data to path
+
+    The table is read in one pass inside a read transaction, so the
+    snapshot and its recorded version are consistent. The file is
+    written next to path and renamed over it when complete. The schema
+    is left as it is unless install_triggers is set.
+
+    Args:
+        path (str): Snapshot file
+        connection: Open SQLite connection (default: a new one to ALX_prodev.db)
+        install_triggers (bool): Install the version triggers first if
+            missing, so later checks are O(1); skipped inside a
+            transaction (installing them would commit it) and on a
+            read-only database
+
+    Returns:
+        int: Number of rows exported
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = sqlite3.connect(DATABASE)
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        if (install_triggers and not connection.in_transaction
+                and not _has_version_counter(connection)):
+            try:
+                install_version_triggers(connection)
+            except sqlite3.OperationalError:
+                # Read-only database: versions fall back to the checksum
+                pass
+        with tempfile.TemporaryDirectory(dir=directory) as scratch:
+            # Strings are spooled per column and copied in afterwards
+            numeric = {name: array('q') for name in NUMERIC_COLUMNS}
+            offsets = {name: array('Q', [0]) for name in STRING_COLUMNS}
+            data = {name: open(os.path.join(scratch, name), 'w+b') for name in STRING_COLUMNS}
+            try:
+                opened = not connection.in_transaction
+                if opened:
+                    connection.execute("BEGIN")
+                try:
+                    version = table_version(connection)
+                    # CAST AS BLOB returns the stored UTF-8 bytes as is
+                    cursor = connection.execute(
+                        "SELECT rowid, age, CAST(user_id AS BLOB), CAST(name AS BLOB), "
+                        "CAST(email AS BLOB) FROM user_data ORDER BY rowid"
+                    )
+                    while True:
+                        rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                        if not rows:
+                            break
+                        columns = list(zip(*rows))
+                        for name, values in zip(NUMERIC_COLUMNS, columns):
+                            numeric[name].extend(values)
+                        for name, values in zip(STRING_COLUMNS, columns[2:]):
+                            values = [value or b'' for value in values]
+                            ends = accumulate(map(len, values), initial=offsets[name][-1])
+                            offsets[name].extend(islice(ends, 1, None))
+                            data[name].write(b''.join(values))
+                finally:
+                    if opened:
+                        connection.rollback()
+
+                count = len(numeric['rowid'])
+                header = {'rows': count, 'version': version, 'columns': {}}
+                sections = [(name, 'int64', numeric[name]) for name in NUMERIC_COLUMNS]
+                for name in STRING_COLUMNS:
+                    sections.append((name + '.offsets', 'uint64', offsets[name]))
+                    sections.append((name + '.data', 'uint8', data[name]))
+
+                # Offsets of every section relative to the end of the header
+                position = 0
+                relative = {}
+                for name, dtype, values in sections:
+                    size = values.tell() if hasattr(values, 'tell') else len(values) * 8
+                    relative[name] = position
+                    header['columns'][name] = {'dtype': dtype, 'offset': 0, 'size': size}
+                    position += size + (-size % ALIGNMENT)
+                layout = header['columns']
+                # The header holds the absolute offsets, which depend on its
+                # own length: grow the reserved space until it fits
+                start = 0
+                while True:
+                    for name in layout:
+                        layout[name]['offset'] = start + relative[name]
+                    encoded = json.dumps(header).encode()
+                    needed = len(MAGIC) + 8 + len(encoded)
+                    if needed <= start:
+                        break
+                    start = needed + (-needed % ALIGNMENT)
+
+                temporary = os.path.join(scratch, 'snapshot')
+                with open(temporary, 'wb') as file:
+                    file.write(MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+                    for name, _, values in sections:
+                        file.write(b'\0' * (layout[name]['offset'] - file.tell()))
+                        if hasattr(values, 'tell'):
+                            values.seek(0)
+                            shutil.copyfileobj(values, file, 16 * 1024 * 1024)
+                        else:
+                            values.tofile(file)
+                    _pad(file)
+                os.replace(temporary, path)
+            finally:
+                for file in data.values():
+                    file.close()
+    finally:
+        if own_connection:
+            connection.close()
+    return count
+
+
+class StringColumn:
+    """
+    A string column of a snapshot: values are decoded on access
+
+    Attributes:
+        offsets: uint64 view of the value boundaries (rows + 1 entries)
+        data: uint8 view of the UTF-8 bytes of all values
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        start, end = self.offsets[index:index + 2]
+        return self.data[start:end].tobytes().decode('utf-8')
+
+    def lengths(self):
+        """
+        Returns the byte length of every value as an int64 array
+        """
+        return np.diff(self.offsets).astype(np.int64)
+
+    def slice(self, start, stop):
+        """
+        Returns the values of rows [start, stop) as a list of str
+        """
+        bounds = self.offsets[start:stop + 1].tolist()
+        if not bounds:
+            return []
+        chunk = self.data[bounds[0]:bounds[-1]].tobytes()
+        base = bounds[0]
+        if chunk.isascii():
+            # Byte offsets are character offsets: decode the chunk once
+            text = chunk.decode('ascii')
+            return [text[a - base:b - base] for a, b in zip(bounds, bounds[1:])]
+        return [chunk[a - base:b - base].decode('utf-8') for a, b in zip(bounds, bounds[1:])]
+
+
+class Snapshot:
+    """
+    A columnar snapshot of user_data opened with mmap
+
+    Args:
+        path (str): Snapshot file
+        connection: Open SQLite connection to check the snapshot against;
+            StaleSnapshot is raised if the table changed since the export
+            (default: no check)
+    """
+
+    def __init__(self, path=SNAPSHOT_FILE, connection=None):
+        _require_numpy()
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a user_data snapshot")
+            (length,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+            start = len(MAGIC) + 8
+            self.header = json.loads(self._mmap[start:start + length])
+            if connection is not None and self.header['version'] != table_version(connection):
+                raise StaleSnapshot(f"{path} does not match the current user_data table")
+        except BaseException:
+            self._mmap.close()
+            raise
+        self.version = self.header['version']
+        self._arrays = {
+            name: np.frombuffer(
+                self._mmap, dtype=section['dtype'],
+                count=section['size'] // np.dtype(section['dtype']).itemsize,
+                offset=section['offset'],
+            )
+            for name, section in self.header['columns'].items()
+        }
+
+    def __len__(self):
+        return self.header['rows']
+
+    def column(self, name):
+        """
+        Returns a numeric column (rowid, age) as a read-only int64 view
+        """
+        if name not in NUMERIC_COLUMNS:
+            raise ValueError(f"column must be one of {NUMERIC_COLUMNS}")
+        return self._arrays[name]
+
+    def strings(self, name):
+        """
+        Returns a string column (user_id, name, email) as a StringColumn
+        """
+        if name not in STRING_COLUMNS:
+            raise ValueError(f"column must be one of {STRING_COLUMNS}")
+        return StringColumn(self._arrays[name + '.offsets'], self._arrays[name + '.data'])
+
+    def _rows(self, start, stop):
+        user_ids, names, emails = (
+            self.strings(name).slice(start, stop) for name in STRING_COLUMNS
+        )
+        return list(zip(user_ids, names, emails, self.column('age')[start:stop].tolist()))
+
+    def stream_users_in_batches(self, batch_size, row_format='dict', mask=None):
+        """
+        Generator counterpart of stream_users_in_batches over the snapshot
+
+        Args:
+            batch_size (int): Number of rows per batch
+            row_format (str): Row format of the batches (see row_formats)
+            mask: Boolean array selecting rows, e.g. snapshot.column('age') > 25
+
+        Yields:
+            A batch of user data in row_format
+        """
+        convert = batch_converter(row_format)
+        if mask is None:
+            for start in range(0, len(self), batch_size):
+                yield convert(self._rows(start, min(start + batch_size, len(self))))
+            return
+        selected = np.flatnonzero(mask)
+        for start in range(0, len(selected), batch_size):
+            yield convert([
+                self._rows(index, index + 1)[0]
+                for index in selected[start:start + batch_size].tolist()
+            ])
+
+    def stream_users(self, row_format='dict'):
+        """
+        Generator counterpart of stream_users over the snapshot
+        """
+        for batch in self.stream_users_in_batches(EXPORT_CHUNK_SIZE, row_format):
+            yield from batch
+
+    def close(self):
+        """
+        Releases the views and unmaps the file
+        """
+        self._arrays = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views handed out are still alive; the map is released with them
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_snapshot(path=SNAPSHOT_FILE, connection=None):
+    """
+    Opens the snapshot at path, exporting it first if it is missing or
+    does not match the current table
+
+    Args:
+        path (str): Snapshot file
+        connection: Open SQLite connection (default: a new one to ALX_prodev.db)
+
+    Returns:
+        Snapshot
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = sqlite3.connect(DATABASE)
+    try:
+        try:
+            return Snapshot(path, connection)
+        except (FileNotFoundError, StaleSnapshot):
+            export_snapshot(path, connection)
+            return Snapshot(path)
+    finally:
+        if own_connection:
+            connection.close()
+
+
+if __name__ == "__main__":
+    # Benchmark: repeated analytics over SQLite vs over the snapshot
+    import importlib
+    import time
+
+    import seed
+
+    rows = 1000000
+    os.chdir(tempfile.mkdtemp())
+    setup = seed.create_sample_data(sqlite3.connect(DATABASE), rows)
+
+    def timed(label, function):
+        started = time.perf_counter()
+        result = function()
+        print(f"{label:>40}: {time.perf_counter() - started:.3f}s")
+        return result
+
+    stream_ages = importlib.import_module('4-stream_ages')
+    batches = importlib.import_module('1-batch_processing')
+    timed("table_checksum (read-only fallback)", lambda: table_checksum(setup))
+    timed("export_snapshot (+ version triggers)", lambda: export_snapshot(
+        SNAPSHOT_FILE, setup, install_triggers=True
+    ))
+    snapshot = timed("open (version counter check)", lambda: Snapshot(SNAPSHOT_FILE, setup))
+
+    ages = snapshot.column('age')
+    expected = timed("calculate_average_age (SQLite)", stream_ages.calculate_average_age)
+    average = timed("average age (snapshot)", lambda: ages.sum() / len(ages))
+    assert average == expected
+
+    filtered = timed("age > 25 count (SQLite batches)", lambda: sum(
+        len(batch) for batch in batches.stream_users_in_batches(
+            10000, 'tuple', batches.Query().where('age', '>', 25))
+    ))
+    assert filtered == timed("age > 25 count (snapshot)", lambda: int((ages > 25).sum()))
+
+    sqlite_rows = timed("stream_users_in_batches (SQLite)", lambda: [
+        user for batch in batches.stream_users_in_batches(10000) for user in batch
+    ])
+    snapshot_rows = timed("stream_users_in_batches (snapshot)", lambda: [
+        user for batch in snapshot.stream_users_in_batches(10000) for user in batch
+    ])
+    assert sqlite_rows == snapshot_rows
+
+    # Any write makes the snapshot stale
+    setup.execute("UPDATE user_data SET age = age + 1 WHERE rowid = 1")
+    setup.commit()
+    try:
+        Snapshot(SNAPSHOT_FILE, setup)
+    except StaleSnapshot as e:
+        print(f"after an update: {e}")
+    setup.close()
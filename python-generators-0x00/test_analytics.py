@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+"""
+Tests for analytics: every way of computing the summary must match
+calculate_average_age() and NumPy on the full column exactly
+
+Run with: python3 -m unittest test_analytics
+"""
+import importlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+import analytics
+import seed
+import snapshot
+from pool import ConnectionPool
+
+stream_ages = importlib.import_module('4-stream_ages')
+
+
+class SummarizeTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.database = os.path.join(self.directory, 'ALX_prodev.db')
+        self.connection = sqlite3.connect(self.database)
+        self.addCleanup(self.connection.close)
+        seed.create_sample_data(self.connection, 5000)
+        with self.connection:
+            # Leave gaps in the rowids
+            self.connection.execute("DELETE FROM user_data WHERE rowid % 7 = 0")
+        self.ages = np.array(
+            [row[0] for row in self.connection.execute("SELECT age FROM user_data")]
+        )
+
+    def average_age(self):
+        with ConnectionPool(self.database, max_size=1) as pool:
+            return stream_ages.calculate_average_age(pool)
+
+    def assertExact(self, summary):
+        self.assertEqual(summary['count'], len(self.ages))
+        self.assertEqual(summary['mean'], self.average_age())
+        self.assertEqual(summary['min'], self.ages.min())
+        self.assertEqual(summary['max'], self.ages.max())
+        self.assertAlmostEqual(summary['variance'], self.ages.var(), places=9)
+        quantiles = np.quantile(self.ages, list(summary['quantiles']))
+        self.assertEqual(list(summary['quantiles'].values()), list(quantiles))
+        edges = summary['histogram']['edges']
+        self.assertEqual(summary['histogram']['counts'], list(np.histogram(self.ages, edges)[0]))
+
+    def test_column_chunks(self):
+        chunks = list(analytics.column_chunks(chunk_size=1000, connection=self.connection))
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+        self.assertEqual(np.concatenate(chunks).tolist(), self.ages.tolist())
+
+    def test_every_path_matches(self):
+        analytics.ensure_indexes(self.connection)
+        self.assertEqual(analytics.average_age(self.connection), self.average_age())
+        self.assertExact(analytics.summarize(connection=self.connection))
+        self.assertExact(analytics.summarize(
+            pushdown=False, chunk_size=1000, connection=self.connection
+        ))
+
+        path = os.path.join(self.directory, 'user_data.snap')
+        snapshot.export_snapshot(path, self.connection)
+        with snapshot.Snapshot(path, self.connection) as columns:
+            self.assertExact(analytics.summarize(snapshot=columns, chunk_size=1000))
+
+    def test_empty_table(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM user_data")
+        for pushdown in (True, False):
+            summary = analytics.summarize(pushdown=pushdown, connection=self.connection)
+            self.assertEqual(summary['count'], 0)
+            self.assertIsNone(summary['histogram'])
+
+
+if __name__ == "__main__":
+    unittest.main()
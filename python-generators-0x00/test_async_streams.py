@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+"""
+Tests for async_streams: the async generators must return the same users
+as the blocking ones, and release their thread and connection as soon
+as the consumer stops, whether it breaks out, closes or is cancelled
+
+Run with: python3 -m unittest test_async_streams
+"""
+import asyncio
+import importlib
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import async_streams
+import seed
+
+paginate = importlib.import_module('2-lazy_paginate')
+
+
+class TrackedConnection(sqlite3.Connection):
+    """
+    A connection recording whether it was closed
+    """
+    closed = False
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+class AsyncStreamsTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, 'ALX_prodev.db')
+        seed.create_sample_data(sqlite3.connect(self.database), 500).close()
+
+        self.connections = []
+        connect = sqlite3.connect
+
+        def tracked_connect(database, **kwargs):
+            connection = connect(database, factory=TrackedConnection, **kwargs)
+            self.connections.append(connection)
+            return connection
+
+        patcher = mock.patch.object(async_streams.sqlite3, 'connect', tracked_connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.closes = []
+        close = async_streams._SQLiteThread.close
+
+        def tracked_close(thread):
+            self.closes.append(thread)
+            close(thread)
+
+        patcher = mock.patch.object(async_streams._SQLiteThread, 'close', tracked_close)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generators(self):
+        yield async_streams.async_stream_users_in_batches(50, database=self.database)
+        yield async_streams.async_stream_users(batch_size=50, database=self.database)
+        yield async_streams.async_lazy_pagination(50, database=self.database)
+
+    def assertReleased(self):
+        # close() was called before the consumer resumed; the connection
+        # itself is closed on its thread right after
+        self.assertEqual(len(self.closes), 1)
+        thread = self.closes.pop()
+        thread._executor.shutdown(wait=True)
+        self.assertTrue(all(connection.closed for connection in self.connections))
+        self.connections.clear()
+
+    async def test_same_users_as_the_blocking_generators(self):
+        expected = list(paginate.lazy_pagination(50, database=self.database))
+        flat = [user for page in expected for user in page]
+        batches = [batch async for batch in async_streams.async_stream_users_in_batches(
+            50, database=self.database
+        )]
+        self.assertEqual(batches, expected)
+        users = [user async for user in async_streams.async_stream_users(
+            batch_size=50, database=self.database
+        )]
+        self.assertEqual(users, flat)
+        pages = [page async for page in async_streams.async_lazy_pagination(
+            50, database=self.database
+        )]
+        self.assertEqual(pages, expected)
+        self.assertEqual(len(self.closes), 3)
+
+    async def test_break_releases_the_connection(self):
+        for generator in self.generators():
+            with self.subTest(generator=generator.__name__):
+                async for _ in generator:
+                    break
+                await generator.aclose()
+                self.assertReleased()
+
+    async def test_cancel_releases_the_connection(self):
+        for generator in self.generators():
+            with self.subTest(generator=generator.__name__):
+                started = asyncio.Event()
+
+                async def consume():
+                    async for _ in generator:
+                        started.set()
+                        # Handling the first batch when cancelled
+                        await asyncio.sleep(10)
+
+                task = asyncio.create_task(consume())
+                await started.wait()
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                await generator.aclose()
+                self.assertReleased()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""
+Tests for lazy_pagination: keyset pages must match the LIMIT/OFFSET
+pages, and a generator abandoned early must stop its prefetch thread
+and give its connection back
+
+Run with: python3 -m unittest test_lazy_paginate
+"""
+import importlib
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import seed
+from pool import ConnectionPool
+
+paginate = importlib.import_module('2-lazy_paginate')
+
+
+class LazyPaginationTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, 'ALX_prodev.db')
+        with sqlite3.connect(self.database) as connection:
+            seed.create_sample_data(connection, 1000)
+            # Gaps in the rowids, and 642 users: a last page of 5
+            connection.execute("DELETE FROM user_data WHERE rowid % 10 IN (3, 4)")
+            connection.execute("DELETE FROM user_data WHERE rowid > 803")
+        connection.close()
+
+    def pages(self, **options):
+        return list(paginate.lazy_pagination(7, database=self.database, **options))
+
+    def test_keyset_pages_match_offset_pages(self):
+        expected = self.pages(keyset=False)
+        self.assertEqual(sum(map(len, expected)), 642)
+        self.assertEqual(len(expected[-1]), 5)
+        for options in ({}, {'key': 'user_id'}, {'prefetch': True},
+                        {'key': 'user_id', 'prefetch': True}):
+            with self.subTest(**options):
+                self.assertEqual(self.pages(**options), expected)
+
+    def test_empty_table(self):
+        with sqlite3.connect(self.database) as connection:
+            connection.execute("DELETE FROM user_data")
+        connection.close()
+        self.assertEqual(self.pages(), [])
+        self.assertEqual(self.pages(keyset=False), [])
+
+    def test_early_break_stops_the_prefetch_thread(self):
+        threads = threading.active_count()
+        with ConnectionPool(self.database, max_size=1, timeout=0) as pool:
+            pages = paginate.lazy_pagination(7, prefetch=True, pool=pool)
+            for page in pages:
+                break
+            self.assertEqual(threading.active_count(), threads + 1)
+            self.assertEqual(pool.idle, 0)
+
+            pages.close()
+            self.assertEqual(threading.active_count(), threads)
+            self.assertEqual((pool.size, pool.idle), (1, 1))
+            # The released connection serves the next generator
+            self.assertEqual(next(paginate.lazy_pagination(7, pool=pool)), page)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+"""
+Tests for materialized_aggregates: every kind of write to user_data
+must leave the aggregates equal to a full scan
+
+Run with: python3 -m unittest test_materialized_aggregates
+"""
+import contextlib
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import analytics
+import materialized_aggregates
+import seed
+
+
+class MaterializedAggregatesTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.connection = sqlite3.connect(os.path.join(self.directory, 'ALX_prodev.db'))
+        self.addCleanup(self.connection.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed.create_table(self.connection)
+
+    def insert(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO user_data VALUES (?, ?, ?, ?)",
+                [(user_id, f"user {user_id}", f"{user_id}@example.com", age)
+                 for user_id, age in rows]
+            )
+
+    def assertConsistent(self, count):
+        self.assertEqual(materialized_aggregates.verify(self.connection), {})
+        self.assertEqual(materialized_aggregates.stats(self.connection)['count'], count)
+        ages = [row[0] for row in self.connection.execute("SELECT age FROM user_data")]
+        self.assertEqual(
+            materialized_aggregates.average_age(self.connection),
+            sum(ages) / len(ages) if ages else 0
+        )
+
+    def test_install_fills_from_existing_rows(self):
+        self.insert([('a', 20), ('b', 30), ('c', 30)])
+        materialized_aggregates.install(self.connection)
+        self.assertConsistent(3)
+        self.assertEqual(materialized_aggregates.age_histogram(self.connection), {20: 1, 30: 2})
+
+    def test_summarize_matches_a_scan(self):
+        seed.create_sample_data(self.connection, 2000)
+        materialized_aggregates.install(self.connection)
+        with self.connection:
+            self.connection.execute("DELETE FROM user_data WHERE rowid % 5 = 0")
+            self.connection.execute("UPDATE user_data SET age = age + 40 WHERE rowid % 7 = 0")
+        self.assertEqual(
+            materialized_aggregates.summarize(self.connection, band_width=5),
+            analytics.summarize(band_width=5, connection=self.connection)
+        )
+        with self.connection:
+            self.connection.execute("DELETE FROM user_data")
+        self.assertEqual(materialized_aggregates.summarize(self.connection)['count'], 0)
+
+    def test_insert_update_delete(self):
+        materialized_aggregates.install(self.connection)
+        self.insert([('a', 20), ('b', 30), ('c', 40)])
+        self.assertConsistent(3)
+
+        with self.connection:
+            self.connection.execute("UPDATE user_data SET age = 31 WHERE user_id = 'b'")
+            self.connection.execute("UPDATE user_data SET name = 'renamed' WHERE user_id = 'c'")
+        self.assertConsistent(3)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM user_data WHERE user_id = 'a'")
+        self.assertConsistent(2)
+        self.assertNotIn(20, materialized_aggregates.age_histogram(self.connection))
+
+    def test_upsert(self):
+        materialized_aggregates.install(self.connection)
+        self.insert([('a', 20), ('b', 30)])
+        with self.connection:
+            self.connection.executemany(
+                seed.INSERT_QUERY + seed.UPSERT_CLAUSE,
+                [('a', 'a', 'a@example.com', 25), ('b', 'b', 'b@example.com', 30),
+                 ('c', 'c', 'c@example.com', 40)]
+            )
+        self.assertConsistent(3)
+
+    def test_replace(self):
+        for recursive_triggers in (False, True):
+            with self.subTest(recursive_triggers=recursive_triggers):
+                self.connection.execute(f"PRAGMA recursive_triggers = {int(recursive_triggers)}")
+                materialized_aggregates.uninstall(self.connection)
+                with self.connection:
+                    self.connection.execute("DELETE FROM user_data")
+                materialized_aggregates.install(self.connection)
+                self.insert([('a', 20), ('b', 30)])
+
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO user_data VALUES ('a', 'a', 'a@example.com', 50)"
+                    )
+                    self.connection.execute(
+                        "REPLACE INTO user_data VALUES ('b', 'b', 'b@example.com', 30)"
+                    )
+                    self.connection.execute(
+                        "REPLACE INTO user_data VALUES ('c', 'c', 'c@example.com', 60)"
+                    )
+                self.assertConsistent(3)
+                self.assertEqual(
+                    materialized_aggregates.age_histogram(self.connection), {30: 1, 50: 1, 60: 1}
+                )
+
+    def test_ignored_insert_then_reinsert(self):
+        materialized_aggregates.install(self.connection)
+        self.insert([('a', 20)])
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO user_data VALUES ('a', 'a', 'a@example.com', 99)"
+            )
+            self.connection.execute("DELETE FROM user_data WHERE user_id = 'a'")
+        self.insert([('a', 21)])
+        self.assertConsistent(1)
+
+    def test_rebuild_repairs_drift(self):
+        self.insert([('a', 20), ('b', 30)])
+        materialized_aggregates.install(self.connection)
+        with self.connection:
+            self.connection.execute(f"UPDATE {materialized_aggregates.STATS_TABLE} SET count = 7")
+        self.assertIn('count', materialized_aggregates.verify(self.connection))
+
+        materialized_aggregates.rebuild(self.connection)
+        self.assertFalse(self.connection.in_transaction)
+        self.assertConsistent(2)
+
+    def test_bulk_load_with_seed(self):
+        materialized_aggregates.install(self.connection)
+        csv_path = os.path.join(self.directory, 'users.csv')
+        with open(csv_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['user_id', 'name', 'email', 'age'])
+            writer.writerows(
+                (f"{i:036d}", f"User {i}", f"user{i}@example.com", f"{18 + i % 80}.0")
+                for i in range(5000)
+            )
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(seed.insert_data(self.connection, csv_path), 5000)
+        self.assertConsistent(5000)
+        # The triggers are back after the load
+        self.insert([('extra', 99)])
+        self.assertConsistent(5001)
+
+        # An upsert load keeps the triggers firing
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed.insert_data(self.connection, csv_path, upsert=True)
+        self.assertConsistent(5001)
+
+
+if __name__ == "__main__":
+    unittest.main()
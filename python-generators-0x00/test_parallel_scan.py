@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+Tests for parallel_scan: the scan must return every user exactly once,
+in key order when ordered, whichever key the table is split on
+
+Run with: python3 -m unittest test_parallel_scan
+"""
+import collections
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import seed
+from parallel_scan import chunk_ranges, parallel_scan
+
+
+class ParallelScanTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, 'ALX_prodev.db')
+        with sqlite3.connect(self.database) as connection:
+            seed.create_sample_data(connection, 1000)
+            # Gaps in the rowids, including whole chunks, and user_ids
+            # that sort before the rows inserted first
+            connection.execute("DELETE FROM user_data WHERE rowid % 3 = 0")
+            connection.execute("DELETE FROM user_data WHERE rowid BETWEEN 200 AND 420")
+            connection.executemany(
+                seed.INSERT_QUERY,
+                [(f"a{i:03d}", f"late {i}", f"late{i}@example.com", 40) for i in range(50)]
+            )
+            self.by_rowid = connection.execute(
+                "SELECT user_id, name, email, age FROM user_data ORDER BY rowid"
+            ).fetchall()
+        connection.close()
+        self.by_user_id = sorted(self.by_rowid)
+
+    def scan(self, **options):
+        return list(parallel_scan(
+            tuple, self.database, workers=2, chunk_rows=64, batch_size=10,
+            row_format='tuple', **options
+        ))
+
+    def test_ordered_scan_matches_a_serial_scan(self):
+        self.assertEqual(self.scan(), self.by_rowid)
+        self.assertEqual(self.scan(key='user_id'), self.by_user_id)
+
+    def test_unordered_scan_returns_every_row_once(self):
+        for key in ('rowid', 'user_id'):
+            with self.subTest(key=key):
+                self.assertEqual(
+                    collections.Counter(self.scan(key=key, ordered=False)),
+                    collections.Counter(self.by_rowid)
+                )
+
+    def test_chunk_ranges_cover_the_table(self):
+        with sqlite3.connect(self.database) as connection:
+            for key in ('rowid', 'user_id'):
+                with self.subTest(key=key):
+                    ranges = chunk_ranges(connection, 64, key)
+                    self.assertIsNone(ranges[-1][1])
+                    # Each range starts where the previous one ends
+                    self.assertEqual(
+                        [low for low, _ in ranges[1:]], [high for _, high in ranges[:-1]]
+                    )
+            chunks = chunk_ranges(connection, 64, 'user_id')
+            self.assertEqual(len(chunks), -(-len(self.by_rowid) // 64))
+            with self.assertRaises(ValueError):
+                chunk_ranges(connection, 64, 'name')
+        connection.close()
+
+    def test_empty_table(self):
+        with sqlite3.connect(self.database) as connection:
+            connection.execute("DELETE FROM user_data")
+        connection.close()
+        self.assertEqual(self.scan(), [])
+        self.assertEqual(self.scan(key='user_id', ordered=False), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
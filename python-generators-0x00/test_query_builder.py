@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""
+Tests for query_builder: every compiled filter must select the same
+users as the same filter applied in Python to the whole table
+
+Run with: python3 -m unittest test_query_builder
+"""
+import importlib
+import operator
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import query_builder
+import seed
+from pool import ConnectionPool
+from query_builder import Query
+
+batches = importlib.import_module('1-batch_processing')
+
+# Names around the prefix bounds: non-ASCII, the last code point before
+# the surrogates and the highest code point
+NAMES = [
+    'é', 'éa', 'éz', 'ê', 'e', 'f',
+    '\ud7ff', '\ud7ffa', '\ue000', '\uffff',
+    '\U0010ffff', '\U0010ffffa', 'a\U0010ffff', 'a\U0010ffffb', 'b',
+]
+
+OPERATORS = {
+    '=': operator.eq, '!=': operator.ne, '<': operator.lt,
+    '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.connection = sqlite3.connect(os.path.join(directory.name, 'ALX_prodev.db'))
+        self.addCleanup(self.connection.close)
+        seed.create_sample_data(self.connection, 1200)
+        with self.connection:
+            self.connection.executemany(
+                seed.INSERT_QUERY,
+                [(f"n{i}", name, f"{i}@example.com", 30) for i, name in enumerate(NAMES)]
+            )
+        self.table = self.connection.execute(
+            "SELECT user_id, name, email, age FROM user_data"
+        ).fetchall()
+
+    def run_query(self, query):
+        return [row for batch in query.stream_batches(self.connection, 64) for row in batch]
+
+    def assertSelects(self, query, predicate):
+        self.assertEqual(
+            sorted(self.run_query(query)), sorted(row for row in self.table if predicate(row))
+        )
+
+    def test_compile(self):
+        query = Query().select('name', 'email').where('age', '>', 25)
+        self.assertEqual(
+            query.compile(), ('SELECT name, email FROM user_data WHERE age > ?', [25])
+        )
+        query = Query().between('age', 20, 30).startswith('name', 'ab').order_by('rowid').limit(5)
+        self.assertEqual(query.compile(), (
+            'SELECT user_id, name, email, age FROM user_data '
+            'WHERE age BETWEEN ? AND ? AND name >= ? AND name < ? ORDER BY rowid LIMIT ?',
+            [20, 30, 'ab', 'ac', 5]
+        ))
+        with self.assertRaises(ValueError):
+            Query().where('age; DROP TABLE user_data', '=', 1)
+        with self.assertRaises(ValueError):
+            Query().where('age', 'LIKE', 1)
+
+    def test_comparisons(self):
+        for op, compare in OPERATORS.items():
+            with self.subTest(op=op):
+                self.assertSelects(Query().where('age', op, 50), lambda row: compare(row[3], 50))
+        self.assertSelects(Query().between('age', 20, 30), lambda row: 20 <= row[3] <= 30)
+        self.assertSelects(
+            Query().where('age', '>', 25).where('email', '<', 'user5'),
+            lambda row: row[3] > 25 and row[2] < 'user5'
+        )
+
+    def test_isin(self):
+        self.assertSelects(Query().isin('age', [20, 30, 40]), lambda row: row[3] in (20, 30, 40))
+        self.assertSelects(Query().isin('age', []), lambda row: False)
+        # Over IN_LIST_LIMIT values: bound as one JSON array
+        ids = [row[0] for row in self.table[::2]]
+        query = Query().isin('user_id', ids)
+        self.assertEqual(len(query.compile()[1]), 1)
+        self.assertSelects(query, lambda row: row[0] in ids)
+
+    def test_startswith(self):
+        prefixes = ['user 1', 'é', 'e', '\ud7ff', '\U0010ffff', 'a\U0010ffff', 'user 1199', 'zz']
+        for prefix in prefixes:
+            with self.subTest(prefix=prefix):
+                self.assertSelects(
+                    Query().startswith('name', prefix), lambda row: row[1].startswith(prefix)
+                )
+        self.assertSelects(Query().startswith('name', ''), lambda row: True)
+
+    def test_prefix_bound(self):
+        bound = query_builder._prefix_bound
+        self.assertEqual(bound('ab'), 'ac')
+        self.assertEqual(bound('é'), 'ê')
+        self.assertEqual(bound('\ud7ff'), '\ue000')
+        self.assertEqual(bound('a\U0010ffff'), 'b')
+        self.assertIsNone(bound('\U0010ffff\U0010ffff'))
+
+    def test_order_and_limit(self):
+        query = Query().select('user_id').order_by('user_id', descending=True).limit(7)
+        rows = self.run_query(query)
+        self.assertEqual(rows, sorted(((row[0],) for row in self.table), reverse=True)[:7])
+
+    def test_stream_users_in_batches_uses_the_query(self):
+        database = self.connection.execute("PRAGMA database_list").fetchone()[2]
+        query = Query().select('name', 'age').where('age', '>', 90)
+        with ConnectionPool(database, max_size=1) as pool:
+            users = [
+                user
+                for batch in batches.stream_users_in_batches(10, 'dict', query, pool)
+                for user in batch
+            ]
+        self.assertEqual(users, [
+            {'name': row[1], 'age': row[3]} for row in self.table if row[3] > 90
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
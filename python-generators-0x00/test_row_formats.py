@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+Tests for row_formats: every row format must carry the same data as the
+dict rows of the original generators
+
+Run with: python3 -m unittest test_row_formats
+"""
+import importlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import seed
+from pool import ConnectionPool
+from row_formats import (
+    FIELDS, ROW_FORMATS, ColumnBatch, UserRecord, batch_converter, field_getter,
+    row_converter,
+)
+
+stream = importlib.import_module('0-stream_users')
+batches = importlib.import_module('1-batch_processing')
+
+
+def as_dict(row, row_format):
+    """
+    Reads a row of any format back into the dict format
+    """
+    return {field: field_getter(row_format, field)(row) for field in FIELDS}
+
+
+class RowFormatsTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = os.path.join(directory.name, 'ALX_prodev.db')
+        seed.create_sample_data(sqlite3.connect(database), 250).close()
+        self.pool = ConnectionPool(database, max_size=1)
+        self.addCleanup(self.pool.close)
+        self.rows = list(seed.sample_users(250))
+
+    def test_converters_match_the_dict_format(self):
+        expected = batch_converter('dict')(self.rows)
+        for row_format in ROW_FORMATS:
+            with self.subTest(row_format=row_format):
+                convert = row_converter(row_format)
+                batch = batch_converter(row_format)(self.rows)
+                self.assertEqual(len(batch), len(expected))
+                for row, converted, user in zip(self.rows, batch, expected):
+                    self.assertEqual(as_dict(convert(row), row_format), user)
+                    self.assertEqual(as_dict(converted, row_format), user)
+                    if row_format != 'tuple':
+                        # Code written for dicts works unchanged
+                        self.assertEqual({field: converted[field] for field in FIELDS}, user)
+
+    def test_generators_match_the_dict_format(self):
+        expected = list(stream.stream_users(pool=self.pool))
+        self.assertEqual(len(expected), 250)
+        for row_format in ROW_FORMATS:
+            with self.subTest(row_format=row_format):
+                users = list(stream.stream_users(row_format, pool=self.pool))
+                self.assertEqual([as_dict(user, row_format) for user in users], expected)
+                batched = [
+                    as_dict(user, row_format)
+                    for batch in batches.stream_users_in_batches(
+                        100, row_format, pool=self.pool
+                    )
+                    for user in batch
+                ]
+                self.assertEqual(batched, expected)
+
+    def test_record_has_no_instance_dict(self):
+        record = UserRecord(*self.rows[0])
+        self.assertFalse(hasattr(record, '__dict__'))
+        with self.assertRaises(AttributeError):
+            record.extra = 1
+        self.assertEqual(record.as_tuple(), self.rows[0])
+        self.assertEqual(record, UserRecord(*self.rows[0]))
+
+    def test_column_batch(self):
+        batch = ColumnBatch(self.rows[:10])
+        self.assertEqual(batch.column('age'), [row[3] for row in self.rows[:10]])
+        self.assertEqual(batch[-1].as_tuple(), self.rows[9])
+        self.assertEqual([row.as_tuple() for row in batch[2:4]], self.rows[2:4])
+        with self.assertRaises(IndexError):
+            batch[10]
+        self.assertEqual(len(ColumnBatch([])), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+"""
+Tests for seed: a bulk load leaves the connection's settings as it found
+them and never commits a caller's transaction, and pooled connections go
+back to the pool when closed
+
+Run with: python3 -m unittest test_seed
+"""
+import contextlib
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import seed
+import snapshot
+from pool import ConnectionPool
+
+
+class InsertDataTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.connection = sqlite3.connect(os.path.join(directory.name, 'ALX_prodev.db'))
+        self.addCleanup(self.connection.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed.create_table(self.connection)
+        self.csv_path = os.path.join(directory.name, 'users.csv')
+        with open(self.csv_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['user_id', 'name', 'email', 'age'])
+            writer.writerows(
+                (f"{i:036d}", f"User {i}", f"user{i}@example.com", f"{18 + i % 80}.0")
+                for i in range(100)
+            )
+
+    def pragmas(self):
+        return {
+            name: self.connection.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in seed.LOAD_PRAGMAS
+        }
+
+    def load(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return seed.insert_data(self.connection, self.csv_path, **kwargs)
+
+    def test_pragmas_are_restored(self):
+        before = self.pragmas()
+        self.assertEqual(self.load(), 100)
+        self.assertEqual(self.pragmas(), before)
+        self.assertEqual(before['journal_mode'], 'delete')
+
+    def test_load_bumps_the_version_once(self):
+        snapshot.install_version_triggers(self.connection)
+        self.assertEqual(self.load(), 100)
+        self.assertEqual(snapshot.table_version(self.connection), ['counter', 1])
+        # The triggers are back for later writes
+        with self.connection:
+            self.connection.execute("DELETE FROM user_data WHERE rowid = 1")
+        self.assertEqual(snapshot.table_version(self.connection), ['counter', 2])
+
+    def test_open_transaction_is_an_error(self):
+        self.connection.execute(
+            "INSERT INTO user_data VALUES ('pending', 'Pending', 'p@example.com', 30)"
+        )
+        self.assertTrue(self.connection.in_transaction)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            self.load(upsert=True)
+        # The caller's insert is still uncommitted
+        self.connection.rollback()
+        self.assertEqual(self.count(), 0)
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM user_data").fetchone()[0]
+
+    def write_csv(self, rows):
+        with open(self.csv_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['user_id', 'name', 'email', 'age'])
+            writer.writerows(rows)
+
+    def test_failure_after_a_commit_raises(self):
+        rows = [(f"{i:036d}", f"User {i}", f"user{i}@example.com", 30) for i in range(150)]
+        rows[120] = (rows[120][0], 'Bad', 'bad@example.com', 'unknown')
+        self.write_csv(rows)
+        with mock.patch.object(seed, 'LOAD_CHUNK_SIZE', 50):
+            with self.assertRaises(seed.PartialLoadError) as raised:
+                self.load()
+        self.assertEqual(raised.exception.loaded, 100)
+        self.assertEqual(self.count(), 100)
+
+    def test_failure_before_any_commit_returns_zero(self):
+        self.write_csv([('1', 'Bad', 'bad@example.com', 'unknown')])
+        self.assertEqual(self.load(), 0)
+        self.assertEqual(self.count(), 0)
+
+    def test_parallel_load(self):
+        rows = [
+            (f"{i:036d}", f"User, {i}" if i % 3 else f'User "{i}"', f"user{i}@example.com", 30)
+            for i in range(300)
+        ]
+        names = ['\n'.join(['multi', 'line', 'name'] * 10), 'two\r\nlines', 'plain']
+        for multiline in (False, True):
+            with self.subTest(multiline=multiline):
+                if multiline:
+                    rows = [
+                        (user_id, names[i % 3] if i % 10 == 0 else name, email, age)
+                        for i, (user_id, name, email, age) in enumerate(rows)
+                    ]
+                self.write_csv(rows)
+                self.assertEqual(seed._has_multiline_records(self.csv_path), multiline)
+                with self.connection:
+                    self.connection.execute("DELETE FROM user_data")
+                with mock.patch.object(seed, 'PARALLEL_PARSE_BYTES', 0), \
+                        mock.patch.object(seed, 'PARSE_RANGE_BYTES', 200):
+                    self.assertEqual(self.load(workers=2), len(rows))
+                self.assertEqual(
+                    self.connection.execute(
+                        "SELECT user_id, name, email, age FROM user_data ORDER BY user_id"
+                    ).fetchall(),
+                    rows
+                )
+
+
+class PooledConnectTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.pool = ConnectionPool(os.path.join(directory.name, 'ALX_prodev.db'), max_size=1)
+        self.addCleanup(self.pool.close)
+
+    def test_close_releases_to_the_pool(self):
+        # max_size=1: a leaked slot makes the next checkout time out
+        self.pool.timeout = 0
+        for connect in (seed.connect_db, seed.connect_to_prodev):
+            for _ in range(3):
+                connection = connect(self.pool)
+                self.assertIsNotNone(connection)
+                connection.execute("SELECT 1")
+                connection.close()
+                connection.close()
+                self.assertEqual((self.pool.size, self.pool.idle), (1, 1))
+
+        # The pooled connection was not closed, only returned
+        with self.pool.connection() as connection:
+            self.assertEqual(connection.execute("SELECT 1").fetchone(), (1,))
+
+    def test_closed_pool_closes_released_connections(self):
+        connection = seed.connect_db(self.pool)
+        self.pool.close()
+        connection.close()
+        self.assertEqual(self.pool.size, 0)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""
+Tests for snapshot: a snapshot must be reported stale after any change
+to user_data, including edits that keep every length and sum equal
+
+Run with: python3 -m unittest test_snapshot
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import seed
+import snapshot
+
+
+class TableVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, 'ALX_prodev.db')
+        self.path = os.path.join(directory.name, 'user_data.snap')
+        self.connection = sqlite3.connect(self.database)
+        self.addCleanup(self.connection.close)
+        seed.create_sample_data(self.connection, 2)
+
+    def rename(self, name):
+        with self.connection:
+            self.connection.execute("UPDATE user_data SET name = ? WHERE rowid = 1", (name,))
+
+    def test_checksum_sees_same_length_edits(self):
+        before = snapshot.table_checksum(self.connection)
+        self.rename('user 9')
+        self.assertNotEqual(snapshot.table_checksum(self.connection), before)
+        self.rename('user 0')
+        self.assertEqual(snapshot.table_checksum(self.connection), before)
+
+    def triggers(self):
+        return [row[0] for row in self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' ORDER BY name"
+        )]
+
+    def test_export_leaves_the_schema_alone(self):
+        snapshot.export_snapshot(self.path, self.connection)
+        self.assertEqual(self.triggers(), [])
+        self.assertEqual(snapshot.table_version(self.connection)[0], 'checksum')
+        snapshot.Snapshot(self.path, self.connection).close()
+
+        self.rename('user 9')
+        with self.assertRaises(snapshot.StaleSnapshot):
+            snapshot.Snapshot(self.path, self.connection)
+
+    def test_export_installs_the_version_counter_on_request(self):
+        snapshot.export_snapshot(self.path, self.connection, install_triggers=True)
+        self.assertEqual(snapshot.table_version(self.connection), ['counter', 0])
+        snapshot.Snapshot(self.path, self.connection).close()
+
+        self.rename('user 9')
+        with self.assertRaises(snapshot.StaleSnapshot):
+            snapshot.Snapshot(self.path, self.connection)
+
+        snapshot.uninstall_version_triggers(self.connection)
+        self.assertEqual(self.triggers(), [])
+        self.assertEqual(snapshot.table_version(self.connection)[0], 'checksum')
+
+    def test_read_only_export_uses_the_checksum(self):
+        read_only = sqlite3.connect(f"file:{self.database}?mode=ro", uri=True)
+        self.addCleanup(read_only.close)
+        snapshot.export_snapshot(self.path, read_only)
+        self.assertEqual(snapshot.table_version(read_only)[0], 'checksum')
+        snapshot.Snapshot(self.path, read_only).close()
+
+        self.rename('user 9')
+        with self.assertRaises(snapshot.StaleSnapshot):
+            snapshot.Snapshot(self.path, read_only)
+
+
+if __name__ == "__main__":
+    unittest.main()